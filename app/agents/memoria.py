@@ -0,0 +1,279 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from pydantic import Field
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, get_buffer_string
+
+from app.config import (MEMORIA_CONSOLIDAR_INTERVALO, MEMORIA_CONSOLIDAR_LOTE, MEMORIA_MAX_PENDIENTES,
+                        MEMORIA_TURNOS, MEMORIA_MAX_TOKENS, MEMORIA_MAX_TOKENS_RESPUESTA)
+from app.metrics import registro
+from app.services.concurrencia import SaturacionLLM, limitador_llm, turnos_usuario
+from app.utils import contar_tokens, recortar_tokens
+
+logger = logging.getLogger(__name__)
+
+MEMORIA_RESUMENES = registro.contador(
+    "ube_memoria_resumenes_total", "Consolidaciones de memoria en segundo plano, por resultado"
+)
+MEMORIA_POR_CONSOLIDAR = registro.medidor(
+    "ube_memoria_por_consolidar", "Sesiones con turnos esperando incorporarse al resumen"
+)
+
+resumen_prompt_template = """
+    Eres el asistente de memoria de "Dr. Matrícula" (UBE).
+    Actualiza el resumen de la conversación agregando la información de los nuevos turnos.
+    Conserva solo lo útil para continuar la atención: carreras de interés, modalidad,
+    sesión, dudas pendientes y datos que el usuario haya compartido.
+    Responde únicamente con el resumen actualizado, en máximo {max_palabras} palabras.
+
+    Resumen actual:
+    {resumen}
+
+    Nuevos turnos:
+    {turnos}
+"""
+
+MARCA_COMPACTADO = "\n[...respuesta resumida para ahorrar contexto]"
+
+
+class MemoriaResumida(BaseChatMemory):
+    """
+    Memoria con presupuesto de tokens.
+
+    Los últimos `turnos_verbatim` turnos se guardan tal cual; los anteriores se
+    incorporan a un resumen que se actualiza de forma incremental (solo con los
+    turnos que salen de la ventana). Las respuestas largas ya contestadas, como
+    el listado de una malla completa, se compactan en el historial.
+
+    Guardar un turno nunca llama al LLM: los turnos salientes quedan en
+    `pendientes` (que el agente sigue viendo tal cual) hasta que
+    `ConsolidadorMemorias` los resume fuera del turno. Si se acumulan más de
+    `max_pendientes` turnos, o si junto con el resumen y la ventana exceden
+    `max_tokens`, los más viejos se resumen de forma extractiva.
+    """
+
+    llm: Optional[BaseLanguageModel] = None
+    memory_key: str = "chat_history"
+    # Al hacer streaming, AgentExecutor agrega "messages" a las salidas del turno
+    output_key: Optional[str] = "output"
+    return_messages: bool = True
+    resumen: str = ""
+    pendientes: List[BaseMessage] = Field(default_factory=list)
+    turnos_verbatim: int = MEMORIA_TURNOS
+    max_tokens: int = MEMORIA_MAX_TOKENS
+    max_tokens_respuesta: int = MEMORIA_MAX_TOKENS_RESPUESTA
+    max_pendientes: int = MEMORIA_MAX_PENDIENTES
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        mensajes: List[BaseMessage] = self.pendientes + list(self.chat_memory.messages)
+        if self.resumen:
+            mensajes.insert(0, SystemMessage(content=f"Resumen de la conversación anterior: {self.resumen}"))
+        if self.return_messages:
+            return {self.memory_key: mensajes}
+        return {self.memory_key: get_buffer_string(mensajes)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        self._agregar_pendientes(self._podar())
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        await super().asave_context(inputs, outputs)
+        self._agregar_pendientes(self._podar())
+
+    async def aconsolidar(self) -> None:
+        """Incorpora al resumen los turnos pendientes."""
+        resumen, salientes = self.resumen, list(self.pendientes)
+        if salientes:
+            self.aplicar_resumen(resumen, salientes, await self.aresumir(resumen, salientes))
+
+    def aplicar_resumen(self, base: str, salientes: List[BaseMessage], nuevo: str) -> bool:
+        """
+        Reemplaza el resumen `base` por `nuevo` y saca de `pendientes` los turnos
+        resumidos; False si la memoria cambió mientras tanto (otro proceso ya resumió).
+        """
+        if self.resumen != base or self.pendientes[:len(salientes)] != salientes:
+            return False
+        self.resumen = nuevo
+        self.pendientes = self.pendientes[len(salientes):]
+        return True
+
+    def clear(self) -> None:
+        super().clear()
+        self.resumen = ""
+        self.pendientes = []
+
+    def _agregar_pendientes(self, salientes: List[BaseMessage]):
+        self.pendientes.extend(salientes)
+        self._plegar_pendientes(self._total_tokens(self.chat_memory.messages))
+
+    def _total_tokens(self, mensajes: List[BaseMessage]) -> int:
+        return contar_tokens(self.resumen) + sum(contar_tokens(m.content) for m in self.pendientes + mensajes)
+
+    def _plegar_pendientes(self, total: int) -> int:
+        """
+        Resume de forma extractiva los turnos pendientes más viejos mientras sobren
+        turnos o tokens; retorna el total actualizado.
+        """
+        # El consolidador está atrasado (LLM saturado): el prompt no puede crecer sin límite
+        viejos: List[BaseMessage] = []
+        while self.pendientes and (len(self.pendientes) > 2 * self.max_pendientes or total > self.max_tokens):
+            turno, self.pendientes = self.pendientes[:2], self.pendientes[2:]
+            total -= sum(contar_tokens(m.content) for m in turno)
+            viejos.extend(turno)
+        if not viejos:
+            return total
+        total -= contar_tokens(self.resumen)
+        self.resumen = self._resumen_extractivo(self.resumen, viejos)
+        return total + contar_tokens(self.resumen)
+
+    def _podar(self) -> List[BaseMessage]:
+        """Compacta respuestas viejas y retira los turnos que exceden la ventana o el presupuesto."""
+        mensajes = list(self.chat_memory.messages)
+
+        # La última respuesta se deja intacta: puede ser necesaria para la próxima pregunta
+        for i, mensaje in enumerate(mensajes[:-2]):
+            if isinstance(mensaje, AIMessage) and contar_tokens(mensaje.content) > self.max_tokens_respuesta:
+                mensajes[i] = AIMessage(content=recortar_tokens(mensaje.content, self.max_tokens_respuesta) + MARCA_COMPACTADO)
+
+        # Los pendientes ocupan el mismo prompt: se pliegan antes de achicar la ventana
+        total = self._plegar_pendientes(self._total_tokens(mensajes))
+        salientes: List[BaseMessage] = []
+        while len(mensajes) > 2 and (len(mensajes) > 2 * self.turnos_verbatim or total > self.max_tokens):
+            turno, mensajes = mensajes[:2], mensajes[2:]
+            total -= sum(contar_tokens(m.content) for m in turno)
+            salientes.extend(turno)
+
+        self.chat_memory.messages = mensajes
+        return salientes
+
+    def _prompt_resumen(self, resumen: str, salientes: List[BaseMessage]) -> str:
+        return resumen_prompt_template.format(
+            max_palabras=self.max_tokens // 6,
+            resumen=resumen or "(vacío)",
+            turnos=get_buffer_string(salientes, human_prefix="Usuario", ai_prefix="Dr. Matrícula"),
+        )
+
+    def _resumen_extractivo(self, resumen: str, salientes: List[BaseMessage]) -> str:
+        # Sin LLM (o si falla) se conservan las preguntas del usuario
+        preguntas = [m.content for m in salientes if not isinstance(m, AIMessage)]
+        resumen = " ".join(filter(None, [resumen, *(f"El usuario preguntó: {p}." for p in preguntas)]))
+        return self._acotar(resumen)
+
+    def _acotar(self, resumen: str) -> str:
+        limite = self.max_tokens // 3
+        # Se conserva lo más reciente del resumen
+        return recortar_tokens(resumen, limite, conservar_final=True)
+
+    async def aresumir(self, resumen: str, salientes: List[BaseMessage]) -> str:
+        """`resumen` actualizado con los turnos `salientes` (no modifica la memoria)."""
+        if self.llm is None:
+            return self._resumen_extractivo(resumen, salientes)
+        try:
+            respuesta = await self.llm.ainvoke(self._prompt_resumen(resumen, salientes))
+            return self._acotar(getattr(respuesta, "content", respuesta).strip())
+        except Exception as e:
+            logger.warning("Error al resumir la conversación: %s", e)
+            return self._resumen_extractivo(resumen, salientes)
+
+
+class ConsolidadorMemorias:
+    """
+    Resume en segundo plano los turnos pendientes de las sesiones, fuera del
+    camino de la respuesta.
+
+    `agendar` anota la sesión al terminar un turno. Cada `intervalo` segundos (o
+    antes, si ya hay `lote` sesiones anotadas) se consolida un lote: una llamada
+    al LLM por sesión, con todos los turnos que se acumularon desde la anterior.
+    Cada llamada pide un cupo de `limitador_llm` como un turno del agente y cede
+    el paso si hay turnos esperando: con el LLM saturado las sesiones se reintentan
+    en el próximo lote. El resumen se aplica dentro del turno del usuario (ver
+    `TurnosPorUsuario`) y solo si la memoria no cambió mientras se resumía.
+    """
+
+    def __init__(self, store, intervalo: float = MEMORIA_CONSOLIDAR_INTERVALO, lote: int = MEMORIA_CONSOLIDAR_LOTE):
+        self.store = store
+        self.intervalo = intervalo
+        self.lote = lote
+        # Orden de llegada, sin repetidos
+        self._agendadas: Dict[str, None] = {}
+        self._hay_lote = asyncio.Event()
+        self._tarea: Optional[asyncio.Task] = None
+        self.stats = {"lotes": 0, "consolidadas": 0, "descartadas": 0, "aplazadas": 0, "errores": 0}
+
+    def agendar(self, user_id: str):
+        self._agendadas[user_id] = None
+        MEMORIA_POR_CONSOLIDAR.set(len(self._agendadas))
+        if len(self._agendadas) >= self.lote:
+            self._hay_lote.set()
+
+    async def _ejecutar(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._hay_lote.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._hay_lote.clear()
+            await self.consolidar_lote()
+
+    async def consolidar_lote(self) -> int:
+        """Consolida hasta `lote` sesiones agendadas; retorna cuántas quedaron resumidas."""
+        if not self._agendadas or limitador_llm.esperando:
+            # Los turnos de los usuarios tienen prioridad sobre los resúmenes
+            return 0
+        usuarios = list(self._agendadas)[:self.lote]
+        for user_id in usuarios:
+            del self._agendadas[user_id]
+        self.stats["lotes"] += 1
+        resultados = await asyncio.gather(*(self._consolidar(u) for u in usuarios), return_exceptions=True)
+        for user_id, resultado in zip(usuarios, resultados):
+            if isinstance(resultado, SaturacionLLM):
+                self.stats["aplazadas"] += 1
+                self._agendadas.setdefault(user_id, None)
+            elif isinstance(resultado, Exception):
+                self.stats["errores"] += 1
+                MEMORIA_RESUMENES.inc(resultado="error")
+                logger.warning(f"No se pudo consolidar la memoria de {user_id}: {resultado}")
+        MEMORIA_POR_CONSOLIDAR.set(len(self._agendadas))
+        return sum(resultado is True for resultado in resultados)
+
+    async def _consolidar(self, user_id: str) -> bool:
+        async with turnos_usuario.turno(user_id, contar=False):
+            memoria = await self.store.obtener(user_id)
+            resumen, salientes = memoria.resumen, list(memoria.pendientes)
+        if not salientes:
+            return False
+
+        async with limitador_llm.permiso():
+            nuevo = await memoria.aresumir(resumen, salientes)
+
+        async with turnos_usuario.turno(user_id, contar=False):
+            memoria = await self.store.obtener(user_id)
+            if not memoria.aplicar_resumen(resumen, salientes, nuevo):
+                self.stats["descartadas"] += 1
+                MEMORIA_RESUMENES.inc(resultado="descartado")
+                return False
+            await self.store.guardar(user_id, nuevo_turno=False)
+        self.stats["consolidadas"] += 1
+        MEMORIA_RESUMENES.inc(resultado="ok")
+        return True
+
+    def iniciar(self):
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._ejecutar())
+
+    async def cerrar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+
+    def resumen(self) -> dict:
+        return {"agendadas": len(self._agendadas), "intervalo_s": self.intervalo, "lote": self.lote, **self.stats}
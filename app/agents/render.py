@@ -0,0 +1,422 @@
+import re
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.config import RENDER_MAX_TOKENS
+from app.schemas.carreras_schema import Carrera, Carreras
+from app.schemas.grupos_schema import GrupoData
+from app.schemas.malla_schema import Malla
+from app.services.cache import carreras_cache, huella, mallas_cache
+from app.services.carreras_resolver import normalizar, tipo_carrera
+from app.utils import contar_tokens
+
+# Preguntas sugeridas por herramienta: viajan como metadata en la respuesta de la API
+PREGUNTAS_SUGERIDAS = {
+    "listar_carreras": [
+        "¿Prefieres que te muestre únicamente las carreras de pregrado o las de postgrado?",
+        "¿Quieres conocer los requisitos de ingreso para una carrera en particular?",
+        "¿Quieres ver cuáles carreras están disponibles en modalidad online, presencial o híbrida?",
+        "¿Quieres información sobre becas, descuentos o facilidades de pago?",
+        "¿Deseas que te muestre los grupos y fechas de inicio más cercanos?",
+        "¿Te gustaría comparar dos carreras para ver cuál se ajusta mejor a lo que buscas?",
+    ],
+    "listar_malla": [
+        "¿Quieres que te dé una descripción más detallada de alguna asignatura?",
+        "¿Deseas saber la duración total de la carrera?",
+        "¿Quieres conocer en qué modalidades (presencial, online, híbrida) se ofrece esta carrera?",
+        "¿Te interesa conocer los precios o facilidades de pago de esta carrera?",
+    ],
+    "listar_grupos": [
+        "¿Quieres que te muestre el proceso de matrícula paso a paso?",
+        "¿Deseas saber si hay facilidades de pago o becas disponibles?",
+        "¿Quieres comparar esta carrera con otra para ver precios y modalidades?",
+        "¿Deseas información sobre requisitos para matricularte en esta carrera?",
+    ],
+    "buscar_carreras": [
+        "¿Quieres ver la malla de alguna de estas carreras?",
+        "¿Deseas conocer los grupos y fechas de inicio de alguna de ellas?",
+        "¿Te gustaría comparar dos de estas carreras lado a lado?",
+    ],
+    "comparar_carreras": [
+        "¿Quieres ver la malla completa de alguna de estas carreras?",
+        "¿Deseas conocer los grupos y horarios disponibles de la carrera que más te interesa?",
+        "¿Te gustaría saber los requisitos para matricularte?",
+    ],
+    "requisitos_matriculacion": [
+        "¿Quieres que te muestre los costos de inscripción y matrícula?",
+        "¿Deseas conocer las fechas de inicio de clases?",
+        "¿Quieres que te muestre carreras en modalidad online para facilitar tu ingreso?",
+        "¿Deseas saber si puedes aplicar a becas o descuentos en la matrícula?",
+    ],
+}
+
+_sugerencias: ContextVar[Optional[List[str]]] = ContextVar("sugerencias", default=None)
+
+
+@contextmanager
+def recolectar_sugerencias():
+    """Junta las preguntas sugeridas por las herramientas usadas dentro del bloque."""
+    preguntas: List[str] = []
+    token = _sugerencias.set(preguntas)
+    try:
+        yield preguntas
+    finally:
+        _sugerencias.reset(token)
+
+
+def sugerir(nombre_tool: str):
+    preguntas = _sugerencias.get()
+    if preguntas is not None:
+        preguntas.extend(p for p in PREGUNTAS_SUGERIDAS.get(nombre_tool, []) if p not in preguntas)
+
+
+def _coincide(buscado: Optional[str], opciones: Iterable[str]) -> bool:
+    """`buscado` ya normalizado; None no filtra. Valor exacto: "presencial" no es "semipresencial"."""
+    if not buscado:
+        return True
+    return buscado in opciones
+
+
+def _mismo_periodo(buscado: str, nivel: str) -> bool:
+    """Con números se comparan como números enteros ("1" no es "10"); si no, el texto normalizado exacto."""
+    numeros = re.findall(r"\d+", buscado)
+    if numeros:
+        return [int(n) for n in numeros] == [int(n) for n in re.findall(r"\d+", nivel)]
+    return buscado == nivel
+
+
+def texto_carrera(carrera: Carrera, incluir_precios: bool = True) -> str:
+    sesiones = ", ".join(carrera.sesiones) if carrera.sesiones else "No disponible"
+    modalidades = ", ".join(carrera.modalidades) if carrera.modalidades else "No disponible"
+    lineas = [f"- {carrera.nombre}. Sesiones: {sesiones}. Modalidades: {modalidades}."]
+    if incluir_precios and carrera.precios:
+        p = carrera.precios
+        lineas.append(
+            f"  Precios: inscripción {p.inscripcion or 'No disponible'}, matrícula {p.matricula or 'No disponible'}, "
+            f"cuotas {p.numero_cuotas or 'No disponible'}, homologación {p.homologacion or 'No disponible'}."
+        )
+    return "\n".join(lineas)
+
+@dataclass
+class CarreraRenderizada:
+    tipo: str
+    carrera: Carrera
+    texto: str
+    tokens: int
+    texto_precios: str
+    tokens_precios: int
+    modalidades: List[str]
+    sesiones: List[str]
+
+
+@dataclass
+class CatalogoRenderizado:
+    carreras: List[CarreraRenderizada]
+    por_id: Dict[int, CarreraRenderizada]
+
+
+@dataclass
+class PeriodoRenderizado:
+    nivel: str
+    resumen: str
+    tokens_resumen: int
+    completo: str
+    tokens_completo: int
+
+
+@dataclass
+class MallaRenderizada:
+    encabezado: str
+    tokens_encabezado: int
+    periodos: List[PeriodoRenderizado]
+    horas_total: float
+    creditos_total: int
+
+
+# Filas del último catálogo construido: al cambiar el catálogo solo se renderizan las carreras que cambiaron
+_filas_previas: Dict[tuple, CarreraRenderizada] = {}
+
+
+def construir_catalogo(carreras: Carreras) -> CatalogoRenderizado:
+    """Renderiza una sola vez el texto de cada carrera (con y sin precios)."""
+    global _filas_previas
+    filas = []
+    for tipo in ("grado", "postgrado"):
+        for carrera in getattr(carreras.data, tipo):
+            # Las carreras son registros inmutables que se comparan por valor
+            previa = _filas_previas.get((tipo, carrera))
+            if previa is not None:
+                render_store.stats["filas_reutilizadas"] += 1
+                filas.append(previa)
+                continue
+            render_store.stats["filas_renderizadas"] += 1
+            texto = texto_carrera(carrera, incluir_precios=False)
+            texto_precios = texto_carrera(carrera, incluir_precios=True)
+            filas.append(CarreraRenderizada(
+                tipo=tipo,
+                carrera=carrera,
+                texto=texto,
+                tokens=contar_tokens(texto),
+                texto_precios=texto_precios,
+                tokens_precios=contar_tokens(texto_precios),
+                modalidades=[normalizar(m) for m in carrera.modalidades],
+                sesiones=[normalizar(x) for x in carrera.sesiones],
+            ))
+    _filas_previas = {(f.tipo, f.carrera): f for f in filas}
+    return CatalogoRenderizado(carreras=filas, por_id={f.carrera.id: f for f in filas})
+
+
+def construir_malla(malla: Malla) -> MallaRenderizada:
+    """Renderiza una sola vez el resumen y el detalle de cada período."""
+    niveles = malla.data
+    horas_total = sum(a.horas for n in niveles for a in n.asignaturas)
+    creditos_total = sum(a.creditos or 0 for n in niveles for a in n.asignaturas)
+    periodos = []
+    for nivel in niveles:
+        horas = sum(a.horas for a in nivel.asignaturas)
+        nombres = ", ".join(a.asignatura for a in nivel.asignaturas)
+        resumen = f"- Período {nivel.nivel_malla} ({len(nivel.asignaturas)} asignaturas, {horas} horas): {nombres}"
+        lineas = [f"### Período: {nivel.nivel_malla}"]
+        for asig in nivel.asignaturas:
+            creditos = f", {asig.creditos} créditos" if asig.creditos is not None else ""
+            lineas.append(f"- {asig.asignatura} ({asig.horas} horas{creditos})")
+        completo = "\n".join(lineas)
+        periodos.append(PeriodoRenderizado(
+            nivel=normalizar(nivel.nivel_malla),
+            resumen=resumen,
+            tokens_resumen=contar_tokens(resumen),
+            completo=completo,
+            tokens_completo=contar_tokens(completo),
+        ))
+    encabezado = f"La malla tiene {len(niveles)} períodos, {horas_total} horas y {creditos_total} créditos en total."
+    return MallaRenderizada(encabezado=encabezado, tokens_encabezado=contar_tokens(encabezado), periodos=periodos,
+                            horas_total=horas_total, creditos_total=creditos_total)
+
+
+class RenderStore:
+    """
+    Textos precalculados por huella de contenido del modelo de origen.
+    Se llena al (re)cargar el catálogo o una malla en la caché, así las
+    herramientas solo buscan bloques ya renderizados.
+    """
+
+    def __init__(self, max_items: int = 512):
+        self.max_items = max_items
+        self._por_huella: "OrderedDict[str, Any]" = OrderedDict()
+        # Evita recalcular la huella cuando llega el mismo objeto de la caché
+        self._huellas: "OrderedDict[int, tuple[Any, str]]" = OrderedDict()
+        self.stats = {"hits": 0, "construcciones": 0, "filas_renderizadas": 0, "filas_reutilizadas": 0}
+
+    def precargar(self, valor: Any, h: str, construir: Callable[[Any], Any]):
+        self._recordar(valor, h)
+        if h not in self._por_huella:
+            self._guardar(h, construir(valor))
+
+    def obtener(self, valor: Any, construir: Callable[[Any], Any]) -> Any:
+        entrada = self._huellas.get(id(valor))
+        if entrada is not None and entrada[0] is valor:
+            h = entrada[1]
+        else:
+            h = huella(valor)
+            self._recordar(valor, h)
+
+        renderizado = self._por_huella.get(h)
+        if renderizado is None:
+            renderizado = construir(valor)
+            self._guardar(h, renderizado)
+        else:
+            self.stats["hits"] += 1
+            self._por_huella.move_to_end(h)
+        return renderizado
+
+    def _recordar(self, valor: Any, h: str):
+        self._huellas[id(valor)] = (valor, h)
+        self._huellas.move_to_end(id(valor))
+        while len(self._huellas) > self.max_items:
+            self._huellas.popitem(last=False)
+
+    def _guardar(self, h: str, renderizado: Any):
+        self.stats["construcciones"] += 1
+        self._por_huella[h] = renderizado
+        while len(self._por_huella) > self.max_items:
+            self._por_huella.popitem(last=False)
+
+    def limpiar(self):
+        self._por_huella.clear()
+        self._huellas.clear()
+
+    def resumen(self) -> dict:
+        return {"items": len(self._por_huella), **self.stats}
+
+
+render_store = RenderStore()
+carreras_cache.al_cargar.append(lambda key, valor, h: render_store.precargar(valor, h, construir_catalogo))
+mallas_cache.al_cargar.append(lambda key, valor, h: render_store.precargar(valor, h, construir_malla))
+
+
+def paginar(bloques: List[tuple[str, int]], pagina: int, max_tokens: int) -> tuple[List[str], int]:
+    """Parte (texto, tokens) en páginas de `max_tokens`; retorna la página pedida y el total de páginas."""
+    paginas: List[List[str]] = [[]]
+    usados = 0
+    for texto, tokens in bloques:
+        if paginas[-1] and usados + tokens > max_tokens:
+            paginas.append([])
+            usados = 0
+        paginas[-1].append(texto)
+        usados += tokens
+    pagina = min(max(pagina, 1), len(paginas))
+    return paginas[pagina - 1], len(paginas)
+
+
+def render_carrera(carreras: Carreras, id_carrera: int) -> Optional[str]:
+    fila = render_store.obtener(carreras, construir_catalogo).por_id.get(id_carrera)
+    return fila.texto_precios if fila else None
+
+
+def render_carreras(carreras: Carreras, tipo: str = None, modalidad: str = None, sesion: str = None,
+                    incluir_precios: bool = False, pagina: int = 1, max_tokens: int = RENDER_MAX_TOKENS) -> str:
+    catalogo: CatalogoRenderizado = render_store.obtener(carreras, construir_catalogo)
+    tipos = {"grado", "postgrado"}
+    if tipo and tipo_carrera(tipo):
+        tipos = {tipo_carrera(tipo)}
+    modalidad = normalizar(modalidad) if modalidad else None
+    sesion = normalizar(sesion) if sesion else None
+    filtradas = [
+        f for f in catalogo.carreras
+        if f.tipo in tipos and _coincide(modalidad, f.modalidades) and _coincide(sesion, f.sesiones)
+    ]
+    if not filtradas:
+        return "No hay carreras que cumplan esos filtros."
+
+    bloques, tipo_actual = [], None
+    for f in filtradas:
+        if f.tipo != tipo_actual:
+            encabezado = f"**Carreras de {f.tipo}:**"
+            bloques.append((encabezado, contar_tokens(encabezado)))
+            tipo_actual = f.tipo
+        bloques.append((f.texto_precios, f.tokens_precios) if incluir_precios else (f.texto, f.tokens))
+
+    seleccion, total = paginar(bloques, pagina, max_tokens)
+    texto = "\n".join(seleccion)
+    if total > 1:
+        texto += f"\n\n(Página {min(max(pagina, 1), total)} de {total}; {len(filtradas)} carreras en total. Pide la siguiente página o filtra por tipo, modalidad o sesión.)"
+    if not incluir_precios:
+        texto += "\n(Precios disponibles si el usuario los solicita.)"
+    return texto
+
+
+ETIQUETAS_ORDEN = {"inscripcion": "inscripción", "matricula": "matrícula", "cuotas": "número de cuotas",
+                  "nombre": "nombre"}
+
+
+def render_busqueda(carreras: Carreras, encontradas: List[Carrera], total: int, orden: str) -> str:
+    """Solo las carreras que cumplen los filtros de `buscar_carreras`, con precios."""
+    if not total:
+        return "No hay carreras que cumplan esos filtros."
+    catalogo: CatalogoRenderizado = render_store.obtener(carreras, construir_catalogo)
+    encabezado = f"Encontré {total} carrera{'s' if total != 1 else ''} que cumple{'n' if total != 1 else ''} los filtros"
+    if total > len(encontradas):
+        encabezado += f"; se muestran las {len(encontradas)} primeras por {ETIQUETAS_ORDEN.get(orden, orden)}"
+    return encabezado + ":\n" + "\n".join(catalogo.por_id[c.id].texto_precios for c in encontradas)
+
+
+def render_malla(malla: Malla, vista: str = "resumen", periodo: str = None,
+                 max_tokens: int = RENDER_MAX_TOKENS) -> str:
+    renderizada: MallaRenderizada = render_store.obtener(malla, construir_malla)
+    buscado = normalizar(periodo) if periodo else None
+    periodos = [p for p in renderizada.periodos if not buscado or _mismo_periodo(buscado, p.nivel)] or renderizada.periodos
+
+    if vista == "completa" and sum(p.tokens_completo for p in periodos) <= max_tokens:
+        texto = "\n".join(p.completo for p in periodos)
+        return f"La malla curricular de la carrera es la siguiente:\n{texto}"
+    # La vista completa que no entra en el presupuesto cae a la vista resumen
+
+    bloques = [(renderizada.encabezado, renderizada.tokens_encabezado)] + [(p.resumen, p.tokens_resumen) for p in periodos]
+    seleccion, total = paginar(bloques, 1, max_tokens)
+    texto = "\n".join(seleccion)
+    if total > 1:
+        texto += "\n(Resumen parcial: pide un período específico para ver el resto.)"
+    return texto + "\n(Para horas y créditos por asignatura, pide la vista completa de un período.)"
+
+
+def render_grupos(grupos: List[GrupoData], modalidad: str = None, sesion: str = None,
+                  max_tokens: int = RENDER_MAX_TOKENS) -> str:
+    modalidad = normalizar(modalidad) if modalidad else None
+    sesion = normalizar(sesion) if sesion else None
+    filtrados = [
+        g for g in grupos
+        if _coincide(modalidad, [normalizar(g.modalidad)]) and _coincide(sesion, [normalizar(g.sesion)])
+    ]
+    if not filtrados:
+        return "No hay grupos con esos filtros que inicien clases próximamente."
+    bloques = [
+        f"- Paralelo: {g.nombre}, Inicio aproximado: {g.fecha_inicio}, Sesión: {g.sesion}, Modalidad: {g.modalidad}"
+        for g in filtrados
+    ]
+    seleccion, total = paginar([(b, contar_tokens(b)) for b in bloques], 1, max_tokens)
+    texto = "Los grupos disponibles son:\n" + "\n".join(seleccion)
+    if total > 1:
+        texto += f"\n(Se muestran {len(seleccion)} de {len(filtrados)} grupos; filtra por modalidad o sesión.)"
+    return texto
+
+
+# Formatos de fecha de los grupos: ISO y los habituales en Ecuador (día primero)
+FORMATOS_FECHA = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d")
+
+
+def parsear_fecha(texto: str) -> Optional[date]:
+    """Fecha de un grupo (se ignora la hora si viene); None si no se reconoce el formato."""
+    texto = texto.strip().split("T")[0].split(" ")[0]
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def proximo_inicio(grupos: Iterable[GrupoData], hoy: date = None) -> Optional[str]:
+    """Fecha de inicio (tal como la publica la API) del grupo que empieza antes, sin contar los ya iniciados."""
+    hoy = hoy or date.today()
+    fechas = [(fecha, g.fecha_inicio) for g in grupos if g.fecha_inicio
+              and (fecha := parsear_fecha(g.fecha_inicio)) is not None and fecha >= hoy]
+    return min(fechas)[1] if fechas else None
+
+
+def render_comparacion(carreras: Carreras,
+                       comparadas: List[tuple[int, Optional[Malla], Optional[List[GrupoData]]]]) -> str:
+    """Tabla lado a lado (una columna por carrera) con precios, modalidades, malla y próximo inicio."""
+    catalogo: CatalogoRenderizado = render_store.obtener(carreras, construir_catalogo)
+    no_disponible = "No disponible"
+    columnas = []
+    for id_carrera, malla, grupos in comparadas:
+        carrera = carreras.data.por_id[id_carrera]
+        precios = carrera.precios
+        renderizada = render_store.obtener(malla, construir_malla) if malla and malla.data else None
+        inicio = proximo_inicio(grupos or [])
+        columnas.append({
+            "Carrera": carrera.nombre,
+            "Tipo": catalogo.por_id[id_carrera].tipo.capitalize(),
+            "Inscripción": precios.inscripcion if precios and precios.inscripcion is not None else no_disponible,
+            "Matrícula": precios.matricula if precios and precios.matricula is not None else no_disponible,
+            "Cuotas": precios.numero_cuotas if precios and precios.numero_cuotas is not None else no_disponible,
+            "Modalidades": ", ".join(carrera.modalidades) or no_disponible,
+            "Sesiones": ", ".join(carrera.sesiones) or no_disponible,
+            "Períodos": len(renderizada.periodos) if renderizada else no_disponible,
+            "Horas totales": f"{renderizada.horas_total:g}" if renderizada else no_disponible,
+            "Créditos": renderizada.creditos_total if renderizada else no_disponible,
+            "Próximo inicio": inicio or ("Sin grupos próximos" if grupos is not None else no_disponible),
+        })
+
+    filas = list(columnas[0])
+    lineas = [
+        "| " + " | ".join(["Carrera"] + [c["Carrera"] for c in columnas]) + " |",
+        "|" + "---|" * (len(columnas) + 1),
+    ]
+    for fila in filas[1:]:
+        lineas.append("| " + " | ".join([fila] + [str(c[fila]) for c in columnas]) + " |")
+    return "\n".join(lineas)
@@ -0,0 +1,186 @@
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app.agents.ventas import listar_carreras, listar_malla, listar_grupos, requisitos_matriculacion
+from app.metrics import metricas_callback
+from app.services.cache import get_carreras
+from app.services.carreras_resolver import TIPOS_CARRERA, get_resolver, normalizar
+from app.services.respuestas_cache import STOPWORDS_CONSULTA, es_seguimiento, nombra_carrera
+
+# Reglas por intención, sobre el texto normalizado (sin tildes ni signos)
+REGLAS = {
+    "malla": re.compile(r"\b(malla|mallas|asignaturas?|materias?|pensum|plan de estudios?|semestres|periodos)\b"),
+    "grupos": re.compile(r"\b(grupos?|cupos?|paralelos?|horarios?|fechas? de inicio|inicio de clases)\b"),
+    "requisitos": re.compile(r"\b(requisitos?|documentos?|papeles)\b"),
+    "carreras": re.compile(r"\b((que|cuales|todas las) carreras|(lista|listado|oferta)( de)? carreras|carreras (tienen|ofrecen|hay))\b"),
+}
+
+# Filtros que se pasan a listar_carreras cuando aparecen en el mensaje
+FILTROS = {
+    "tipo": TIPOS_CARRERA,
+    "modalidad": {"online": "online", "virtual": "online", "presencial": "presencial",
+                  "hibrida": "hibrida", "semipresencial": "semipresencial"},
+    "sesion": {"matutina": "matutina", "vespertina": "vespertina", "nocturna": "nocturna", "semana": "fin de semana"},
+}
+
+# Montos o límites de precio: el listado directo no los aplica, los resuelve el agente con buscar_carreras
+RANGO_PRECIO = re.compile(r"\b(\d+|menos de|mas de|hasta|maximo|minimo|entre|baratas?|economicas?|cuotas?)\b")
+
+# Ejemplos para el clasificador local (bayes ingenuo sobre palabras)
+EJEMPLOS = {
+    "malla": [
+        "cual es la malla de derecho", "malla curricular de enfermeria", "que materias tiene psicologia",
+        "asignaturas de la carrera de derecho", "dame la malla", "plan de estudios de contabilidad",
+        "que se ve en cada semestre de enfermeria", "pensum de la maestria",
+    ],
+    "grupos": [
+        "que grupos hay para fisioterapia", "hay cupos en enfermeria", "horarios de derecho",
+        "cuando inician clases de psicologia", "grupos disponibles de la maestria", "fecha de inicio de derecho",
+        "que paralelos hay", "cupos disponibles para administracion",
+    ],
+    "requisitos": [
+        "cuales son los requisitos de matricula", "requisitos para inscribirme", "que documentos necesito",
+        "requisitos de ingreso a derecho", "que papeles piden para matricularse", "requisitos de admision",
+    ],
+    "carreras": [
+        "que carreras tienen", "cuales carreras ofrecen", "lista de carreras", "oferta academica",
+        "que carreras hay en la ube", "todas las carreras de grado", "carreras de postgrado disponibles",
+    ],
+    "otro": [
+        "cuanto es dos mas dos", "quiero matricularme en derecho", "cual carrera me recomiendas",
+        "compara derecho con psicologia", "hay becas", "cuanto cuesta derecho y que modalidades tiene",
+        "que hace un psicologo", "hola como estas", "gracias", "la malla y los grupos de derecho",
+        "quiero hablar con un asesor", "tienen descuentos", "donde queda la universidad",
+    ],
+}
+
+# Con 5 clases el azar es 0.2: se exige que el modelo confirme la regla con margen
+PROBABILIDAD_MINIMA = 0.35
+
+
+def _tokens(texto: str) -> List[str]:
+    return [t for t in normalizar(texto).split() if t not in STOPWORDS_CONSULTA]
+
+
+def extraer_filtros(texto: str) -> Dict[str, str]:
+    filtros = {}
+    for palabra in normalizar(texto).split():
+        for filtro, valores in FILTROS.items():
+            if palabra in valores and filtro not in filtros:
+                filtros[filtro] = valores[palabra]
+    return filtros
+
+
+class ClasificadorIntencion:
+    """Bayes ingenuo multinomial con suavizado de Laplace; se entrena al importar."""
+
+    def __init__(self, ejemplos: Dict[str, List[str]]):
+        self.conteos: Dict[str, Counter] = {}
+        self.totales: Dict[str, int] = {}
+        self.vocabulario = set()
+        total_ejemplos = sum(len(v) for v in ejemplos.values())
+        self.priors = {clase: math.log(len(v) / total_ejemplos) for clase, v in ejemplos.items()}
+        for clase, textos in ejemplos.items():
+            conteo = Counter(t for texto in textos for t in _tokens(texto))
+            self.conteos[clase] = conteo
+            self.totales[clase] = sum(conteo.values())
+            self.vocabulario |= set(conteo)
+
+    def predecir(self, texto: str) -> Tuple[str, float]:
+        tokens = [t for t in _tokens(texto) if t in self.vocabulario]
+        v = len(self.vocabulario)
+        log_probs = {
+            clase: prior + sum(
+                math.log((self.conteos[clase][t] + 1) / (self.totales[clase] + v)) for t in tokens
+            )
+            for clase, prior in self.priors.items()
+        }
+        maximo = max(log_probs.values())
+        norm = sum(math.exp(lp - maximo) for lp in log_probs.values())
+        clase = max(log_probs, key=log_probs.get)
+        return clase, 1 / norm
+
+
+@dataclass
+class Decision:
+    intencion: Optional[str]
+    motivo: str
+    nombre_carrera: Optional[str] = None
+    confianza: float = 0.0
+
+
+class RouterIntenciones:
+    """
+    Enruta mensajes con una intención evidente directo a la herramienta,
+    sin pasar por el LLM. Todo lo demás sigue al agente.
+    """
+
+    def __init__(self):
+        self.clasificador = ClasificadorIntencion(EJEMPLOS)
+        self.stats = {"total": 0, "directas": 0, "al_agente": 0}
+        self.decisiones: Dict[str, int] = defaultdict(int)
+
+    async def decidir(self, query: str, con_historial: bool = False) -> Decision:
+        texto = normalizar(query)
+        if es_seguimiento(query):
+            return Decision(None, "seguimiento")
+        if con_historial and not nombra_carrera(query):
+            # "¿cuáles son los requisitos?" después de hablar de una carrera se refiere a esa carrera
+            return Decision(None, "con_historial")
+
+        intenciones = [nombre for nombre, regla in REGLAS.items() if regla.search(texto)]
+        if len(intenciones) != 1:
+            return Decision(None, "sin_regla" if not intenciones else "varias_intenciones")
+        intencion = intenciones[0]
+
+        clase, probabilidad = self.clasificador.predecir(query)
+        if clase != intencion or probabilidad < PROBABILIDAD_MINIMA:
+            return Decision(None, "modelo_en_desacuerdo", confianza=probabilidad)
+
+        if intencion == "carreras":
+            if RANGO_PRECIO.search(texto):
+                return Decision(None, "rango_precio", confianza=probabilidad)
+            return Decision(intencion, "regla", confianza=probabilidad)
+
+        carreras = await get_carreras()
+        resolucion, candidatos = get_resolver(carreras.data).resolver(query)
+        if intencion == "requisitos" and not candidatos:
+            return Decision(intencion, "regla", confianza=probabilidad)
+        if resolucion is None:
+            return Decision(None, "carrera_ambigua" if candidatos else "sin_carrera", confianza=probabilidad)
+        return Decision(intencion, "regla", nombre_carrera=resolucion.nombre,
+                        confianza=min(probabilidad, resolucion.confianza))
+
+    async def responder(self, query: str, con_historial: bool = False) -> Optional[str]:
+        """Retorna la respuesta directa, o None si el mensaje debe ir al agente."""
+        self.stats["total"] += 1
+        decision = await self.decidir(query, con_historial)
+        self.decisiones[f"{decision.intencion or 'agente'}:{decision.motivo}"] += 1
+
+        if decision.intencion is None:
+            self.stats["al_agente"] += 1
+            return None
+
+        self.stats["directas"] += 1
+        config = {"callbacks": [metricas_callback]}
+        if decision.intencion == "malla":
+            return await listar_malla.ainvoke({"nombre_carrera": decision.nombre_carrera}, config)
+        if decision.intencion == "grupos":
+            return await listar_grupos.ainvoke({"nombre_carrera": decision.nombre_carrera}, config)
+        if decision.intencion == "requisitos":
+            return await requisitos_matriculacion.ainvoke({"nombre_carrera": decision.nombre_carrera}, config)
+        return await listar_carreras.ainvoke(extraer_filtros(query), config)
+
+    def resumen(self) -> dict:
+        total = self.stats["total"]
+        return {
+            **self.stats,
+            "tasa_al_agente": round(self.stats["al_agente"] / total, 3) if total else 0.0,
+            "decisiones": dict(self.decisiones),
+        }
+
+
+router_intenciones = RouterIntenciones()
@@ -1,177 +1,224 @@
+import asyncio
+from functools import lru_cache
+from typing import List
 from langchain.agents import tool
 from pydantic import BaseModel, Field
-from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain import hub
-from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from app.config import GEMINI_API_KEY, TOKEN_LLAMA, OPENAI_API_KEY
-from app.services.ventas_service import fetch_carreras, fetch_malla, fetch_grupos
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain_core.agents import AgentFinish
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.language_models import BaseChatModel
+from app.config import AGENTE_MAX_ITERACIONES, AGENTE_MAX_TIEMPO, LLM_PROVEEDORES, LLM_TIMEOUT, PROVEEDORES_LLM
+from app.services.cache import (depender_de_carreras, get_carreras, get_malla, get_grupos, marcar_no_cacheable,
+                               nota_respaldo)
 from app.schemas.carreras_schema import Carreras
-from app.utils import formatear_texto_carreras
-from langchain_core.beta.runnables.context import Context
-from app.utils import get_id_by_name
+from app.utils import get_id_by_name, resolver_carrera
+from app.agents.render import (render_busqueda, render_carrera, render_carreras, render_comparacion, render_grupos,
+                               render_malla, sugerir)
+from app.services.busqueda_carreras import ORDENES, get_indice
+from app.services.sesiones import SessionStore, crear_backend
+from app.agents.memoria import ConsolidadorMemorias, MemoriaResumida
+from app.metrics import metricas_callback
+from app.services.concurrencia import limitar_tiempo, turnos_usuario
+from app.services.proveedores_llm import ChatPool, PoolProveedores, registrar_pool
 
 # clasificador basado en prompts
 
-class CarrerasManager:
-    def __init__(self):
-        self.carreras: Carreras = None
-
-    async def get_carreras(self) -> Carreras:
-        if not self.carreras:
-            self.carreras: Carreras = await fetch_carreras()
-        return self.carreras
-
-carreras_manager = CarrerasManager()
-
 @tool
-async def listar_carreras(nombre_carrera: str = None) -> str:
+@limitar_tiempo
+async def listar_carreras(nombre_carrera: str = None, tipo: str = None, modalidad: str = None,
+                          sesion: str = None, incluir_precios: bool = False, pagina: int = 1) -> str:
     """
-    Retorna un resumen completo de las carreras de la UBE.
-    Retorna información de carreras específicas según se solicita.
+    Retorna las carreras de la UBE (nombre, sesiones y modalidades).
     Los IDS se usan solo para apuntar a otro endpoint de ser necesario,
     no se muestran en la conversación con el usuario.
 
-    Incluye:
-    - Nombre de la carrera.
-    - Precios de inscripción, matrícula y número de cuotas.
-    - Sesiones.
-    - Modalidades.
+    Parámetros opcionales:
+    - nombre_carrera: muestra solo esa carrera, con sus precios.
+    - tipo: "grado" o "postgrado".
+    - modalidad: por ejemplo "online", "presencial" o "híbrida".
+    - sesion: por ejemplo "matutina", "nocturna" o "fin de semana".
+    - incluir_precios: True solo si el usuario pregunta por precios (inscripción, matrícula, cuotas).
+    - pagina: página del listado cuando es muy largo.
     """
 
-    carreras: Carreras = await carreras_manager.get_carreras()
-
-    # if nombre_carrera:
-    #     id_carrera = get_id_by_name(carreras.data, nombre_carrera)
-    #     print(f"ID. DE LA CARRERA: {id_carrera}")
-    #     if not id_carrera:
-    #         f"""
-    #             Pregunta si desea conocer información de carreras parecidas a {nombre_carrera}
-    #         """
-    #         return "Lo siento, no encontré esa carrera en nuestra base de datos. ¿Podrías verificar si está bien escrita o prefieres que te muestre todas las carreras disponibles?"
-
-    grado = formatear_texto_carreras(carreras.data.grado, "grado")
-    postgrado = formatear_texto_carreras(carreras.data.postgrado, "postgrado")
-
-    # Preguntas sugeridas mejoradas
-    preguntas_sugeridas = """
-    ¿Prefieres que te muestre únicamente las carreras de pregrado o las de postgrado?
-    ¿Quieres conocer los requisitos de ingreso para una carrera en particular?
-    ¿Te interesa saber la duración promedio de una carrera o una maestría?
-    ¿Quieres ver cuáles carreras están disponibles en modalidad online, presencial o híbrida?
-    ¿Prefieres que te organice las carreras por áreas como salud, tecnología, educación o negocios?
-    ¿Quieres información sobre becas, descuentos o facilidades de pago?
-    ¿Te interesa conocer las oportunidades laborales de una carrera específica?
-    ¿Deseas que te muestre los grupos y fechas de inicio más cercanos?
-    ¿Quieres que te sugiera carreras relacionadas a tus intereses?
-    ¿Te gustaría comparar dos carreras para ver cuál se ajusta mejor a lo que buscas?
-    """
+    # Con una carrera puntual, la respuesta solo cambia si cambia esa carrera
+    carreras: Carreras = await get_carreras(acotado=bool(nombre_carrera))
+    sugerir("listar_carreras")
 
-    response = f"""
-    {grado}
+    if nombre_carrera:
+        id_carrera = await get_id_by_name(carreras.data, nombre_carrera)
+        texto = render_carrera(carreras, id_carrera) if id_carrera else None
+        if texto:
+            depender_de_carreras(id_carrera)
+            return texto + nota_respaldo(("carreras", None))
+        # Se lista todo el catálogo: la respuesta depende de todas las carreras
+        carreras = await get_carreras()
 
-    {postgrado}
+    return render_carreras(carreras, tipo=tipo, modalidad=modalidad, sesion=sesion,
+                           incluir_precios=incluir_precios, pagina=pagina) + nota_respaldo(("carreras", None))
 
-    Preguntas sugeridas para continuar:
-    {preguntas_sugeridas}
-    """
+# Carreras que muestra como máximo una búsqueda
+MAX_RESULTADOS_BUSQUEDA = 25
 
-    return response
 
 @tool
-async def listar_malla(nombre_carrera: str) -> str:
+@limitar_tiempo
+async def buscar_carreras(tipo: str = None, modalidad: str = None, sesion: str = None,
+                          matricula_min: float = None, matricula_max: float = None,
+                          inscripcion_min: float = None, inscripcion_max: float = None,
+                          cuotas_min: int = None, cuotas_max: int = None,
+                          orden: str = "matricula", descendente: bool = False, limite: int = 10) -> str:
+    """
+    Busca carreras que cumplan varias condiciones a la vez y retorna solo las que
+    coinciden, con sus precios. Úsala en lugar de listar_carreras cuando el usuario
+    filtra por precio o combina filtros, por ejemplo:
+    - "carreras online nocturnas de postgrado por menos de $1500 de matrícula"
+    - "las 3 carreras de grado más baratas"
+    - "maestrías que se puedan pagar en 10 cuotas o más"
+
+    Parámetros (todos opcionales):
+    - tipo: "grado" o "postgrado".
+    - modalidad: por ejemplo "online", "presencial" o "híbrida".
+    - sesion: por ejemplo "matutina", "nocturna" o "fin de semana".
+    - matricula_min / matricula_max, inscripcion_min / inscripcion_max: rango de precio en dólares (inclusive).
+    - cuotas_min / cuotas_max: rango del número de cuotas.
+    - orden: "matricula", "inscripcion", "cuotas" o "nombre"; descendente=True para el mayor primero.
+    - limite: cuántas carreras mostrar.
+    """
+    carreras: Carreras = await get_carreras()
+    orden = orden if orden in ORDENES else "matricula"
+    encontradas, total = get_indice(carreras.data).buscar(
+        tipo=tipo, modalidad=modalidad, sesion=sesion,
+        rangos={
+            "matricula": (matricula_min, matricula_max),
+            "inscripcion": (inscripcion_min, inscripcion_max),
+            "cuotas": (cuotas_min, cuotas_max),
+        },
+        orden=orden, descendente=descendente, limite=min(max(limite, 1), MAX_RESULTADOS_BUSQUEDA),
+    )
+    sugerir("buscar_carreras")
+    return render_busqueda(carreras, encontradas, total, orden) + nota_respaldo(("carreras", None))
+
+@tool
+@limitar_tiempo
+async def listar_malla(nombre_carrera: str, vista: str = "resumen", periodo: str = None) -> str:
     """
         Esta tool se activa cuando el usuario pregunta por la malla curricular de una carrera.
         Cada periodo es equivalente a un semestre academico.
 
+        - vista="resumen" (por defecto): asignaturas y horas por período.
+        - vista="completa": horas y créditos de cada asignatura; úsala con `periodo`
+          cuando el usuario pida el detalle de un semestre.
+
         Ejemplo de uso:
         - "¿Cuál es la malla de la carrera de Derecho?"
         - "¿Dame las asignaturas de la carrera de Derecho?"
+        - "¿Cuántos créditos tiene el período 3 de Enfermería?" (vista="completa", periodo="3")
     """
-    carreras: Carreras = await carreras_manager.get_carreras()
-    id_carrera = get_id_by_name(carreras.data, nombre_carrera)
+    # Del catálogo solo se usa el nombre: un cambio de precios no invalida la respuesta
+    carreras: Carreras = await get_carreras(acotado=True)
+    id_carrera = await get_id_by_name(carreras.data, nombre_carrera)
 
     if not id_carrera:
         return "Lo siento, no encontré esa carrera en nuestra base de datos. ¿Podrías verificar si está bien escrita o puedo listarte todas las carreras disponibles?"
 
-    malla_instance = await fetch_malla(id_carrera)
+    malla_instance = await get_malla(id_carrera)
     malla = malla_instance.data
 
     if not malla:
         return "No hay malla disponible para esta carrera."
 
-    result = f"La Malla curricular de la carrera es la siguiente:\n"
-    
-    for nivel in malla:
-        result += f"\n### Período: {nivel.nivel_malla}"
-        result += f"\nLas asignaturas de este período son:"
-
-        for asig in nivel.asignaturas:
-            result += f"\n- Asignatura: {asig.asignatura}"
-            result += f"\n  - Horas: {asig.horas}"
-            if asig.creditos is not None:
-                result += f"\n  - Créditos: {asig.creditos}"
-    result += "\n"
-
-    preguntas_sugeridas = """
-    ¿Quieres que te dé una descripción más detallada de alguna asignatura?
-    ¿Deseas saber la duración total de la carrera?
-    ¿Quieres que te muestre el perfil de egreso de esta carrera?
-    ¿Quieres conocer en qué modalidades (presencial, online, híbrida) se ofrece esta carrera?
-    ¿Quieres que te muestre las oportunidades laborales al finalizar la carrera?
-    ¿Te interesa conocer los precios o facilidades de pago de esta carrera?
-    """
-
-    result += f"\nPreguntas sugeridas para continuar:\n{preguntas_sugeridas}"
-    return result
+    sugerir("listar_malla")
+    return render_malla(malla_instance, vista=vista, periodo=periodo) + nota_respaldo(("mallas", id_carrera))
 
 @tool
-async def listar_grupos(nombre_carrera: str) -> str:
+@limitar_tiempo
+async def listar_grupos(nombre_carrera: str, modalidad: str = None, sesion: str = None) -> str:
     """
     Esta tool se activa cuando el usuario pregunta por:
     - Los grupos o cupos disponibles de una carrera específica.
     - Las modalidades de estudio de una carrera.
-    - Los precios de una carrera.
     - La matrícula o inscripción en una carrera.
+    Puede filtrarse por modalidad y sesión.
+    Para precios usa listar_carreras con nombre_carrera.
 
     Ejemplo de uso:
     - "¿Qué grupos hay para la carrera de Fisioterapia?"
     - "¿Qué modalidades tiene la carrera de Derecho?"
-    - "¿Cuánto cuesta estudiar Psicología?"
     - "Quiero matricularme en Enfermería"
     """
 
-    carreras: Carreras = await carreras_manager.get_carreras()
-    id_carrera = get_id_by_name(carreras.data, nombre_carrera)
+    carreras: Carreras = await get_carreras(acotado=True)
+    id_carrera = await get_id_by_name(carreras.data, nombre_carrera)
 
     if not id_carrera:
         return "Lo siento, no encontré esa carrera en nuestra base de datos. ¿Podrías verificar si está bien escrita o puedo listarte todas las carreras disponibles?"
 
 
-    grupos_instance = await fetch_grupos(id_carrera)
+    grupos_instance = await get_grupos(id_carrera)
     grupos = grupos_instance.data
 
     if not grupos:
         return "No hay grupos disponibles que inicien clase proximamente."
 
-    result = f"Los grupos disponibles son:"
-    result = "\n".join(
-        f"- Paralelo: {grupo.nombre}, Fecha de inicio de clases aproximado: {grupo.fecha_inicio}, Sesion: {grupo.sesion}, Modalidad: {grupo.modalidad}"
-        for grupo in grupos
-    )
+    sugerir("listar_grupos")
+    return render_grupos(grupos, modalidad=modalidad, sesion=sesion) + nota_respaldo(("grupos", id_carrera))
 
-    preguntas_sugeridas = """
-    ¿Quieres que te muestre el proceso de matrícula paso a paso?
-    ¿Deseas saber si hay facilidades de pago o becas disponibles?
-    ¿Quieres comparar esta carrera con otra para ver precios y modalidades?
-    ¿Quieres que te muestre las fechas exactas de inscripción?
-    ¿Deseas información sobre requisitos para matricularte en esta carrera?
+# Carreras por comparación y consultas simultáneas a la API al armarla
+MAX_CARRERAS_COMPARACION = 4
+CONSULTAS_COMPARACION = 6
+
+
+@tool
+@limitar_tiempo
+async def comparar_carreras(nombres_carreras: List[str]) -> str:
     """
+    Compara varias carreras (2 a 4) en una sola tabla: precios, cuotas, modalidades,
+    sesiones, número de períodos, horas y créditos totales y próxima fecha de inicio.
+    Úsala cuando el usuario quiera comparar carreras, en lugar de llamar a
+    listar_malla o listar_grupos por cada una.
+
+    Ejemplo de uso:
+    - "Compara Derecho con Psicología Clínica" (nombres_carreras=["Derecho", "Psicología Clínica"])
+    - "¿Qué me conviene más, Enfermería, Fisioterapia o Nutrición?"
+    """
+    carreras: Carreras = await get_carreras(acotado=True)
+
+    # Solo los nombres ambiguos llegan al clasificador, y en paralelo
+    nombres = nombres_carreras[:MAX_CARRERAS_COMPARACION]
+    resoluciones = await asyncio.gather(*(resolver_carrera(carreras.data, n) for n in nombres))
+    no_encontradas = [n for n, r in zip(nombres, resoluciones) if r is None]
+    ids = list(dict.fromkeys(r.id for r in resoluciones if r is not None))
+    if len(ids) < 2:
+        return ("Necesito al menos dos carreras de la UBE para comparar. "
+                + (f"No encontré: {', '.join(no_encontradas)}." if no_encontradas else ""))
+
+    semaforo = asyncio.Semaphore(CONSULTAS_COMPARACION)
+
+    async def consultar(obtener, id_carrera: int):
+        async with semaforo:
+            try:
+                return await obtener(id_carrera)
+            except Exception:
+                # Una carrera sin datos no debe impedir la comparación de las demás
+                return None
+
+    datos = await asyncio.gather(*(consultar(obtener, i) for i in ids for obtener in (get_malla, get_grupos)))
+    mallas, grupos = datos[0::2], datos[1::2]
+
+    sugerir("comparar_carreras")
+    depender_de_carreras(*ids)
+    texto = render_comparacion(carreras, [
+        (id_carrera, malla, grupo.data if grupo else None)
+        for id_carrera, malla, grupo in zip(ids, mallas, grupos)
+    ])
+    if no_encontradas:
+        texto += f"\n\nNo encontré estas carreras: {', '.join(no_encontradas)}."
+    return texto + nota_respaldo(("carreras", None), *((c, i) for i in ids for c in ("mallas", "grupos")))
 
-    result += f"\n\nPreguntas sugeridas para continuar:\n{preguntas_sugeridas}"
-    return result  
 
 @tool
+@limitar_tiempo
 async def requisitos_matriculacion(nombre_carrera: str = None) -> str:
     """
     Retorna los requisitos de matriculación en la UBE.
@@ -179,50 +226,26 @@ async def requisitos_matriculacion(nombre_carrera: str = None) -> str:
     """
 
     # Requisitos generales
-    requisitos_generales = """
-    Requisitos generales para matriculación:
-    - Copia de cédula de identidad o pasaporte.
-    - Certificado de votación (para mayores de 18 años).
-    - Título de bachiller o acta de grado (apostillado si es extranjero).
-    - Certificado de notas del colegio.
-    - 2 fotografías tamaño carnet.
-    - Pago de inscripción y matrícula según corresponda.
-    """
+    requisitos_generales = """Requisitos generales para matriculación:
+- Copia de cédula de identidad o pasaporte.
+- Certificado de votación (para mayores de 18 años).
+- Título de bachiller o acta de grado (apostillado si es extranjero).
+- Certificado de notas del colegio.
+- 2 fotografías tamaño carnet.
+- Pago de inscripción y matrícula según corresponda."""
 
-    # Obtener todas las carreras
-    carreras_obj = await carreras_manager.get_carreras()
-    
-    # Normalizamos la lista de carreras (grados + postgrados)
-    todas_carreras = []
-    if hasattr(carreras_obj.data, 'grado'):
-        todas_carreras.extend(carreras_obj.data.grado)
-    if hasattr(carreras_obj.data, 'postgrado'):
-        todas_carreras.extend(carreras_obj.data.postgrado)
+    sugerir("requisitos_matriculacion")
 
     if nombre_carrera:
-        id_carrera = get_id_by_name(carreras_obj.data, nombre_carrera)
+        carreras_obj = await get_carreras(acotado=True)
+        id_carrera = await get_id_by_name(carreras_obj.data, nombre_carrera)
         if not id_carrera:
             return f"No encontré la carrera '{nombre_carrera}'. ¿Quieres que te muestre los requisitos generales?"
 
         # Aquí podrías agregar requisitos específicos por carrera si los tienes
         return f"Requisitos específicos para {nombre_carrera}:\n\n{requisitos_generales}\n\n(Pueden variar según la carrera, confirma con admisiones)."
 
-    # Preguntas sugeridas para el usuario
-    preguntas_sugeridas = """
-    ¿Quieres que te muestre los costos de inscripción y matrícula?
-    ¿Deseas conocer las fechas de inicio de clases?
-    ¿Quieres que te muestre carreras en modalidad online para facilitar tu ingreso?
-    ¿Deseas saber si puedes aplicar a becas o descuentos en la matrícula?
-    """
-
-    response = f"""
-    {requisitos_generales}
-
-    Preguntas sugeridas para continuar:
-    {preguntas_sugeridas}
-    """
-
-    return response
+    return requisitos_generales
 
 @tool
 async def matricular(nombre_carrera: str) -> str:
@@ -234,8 +257,11 @@ async def matricular(nombre_carrera: str) -> str:
     if not nombre_carrera:
         return "Por favor, indica el nombre de la carrera que deseas matricular."
 
+    # Cada matrícula es una operación propia: no debe reutilizarse como respuesta
+    marcar_no_cacheable()
+
     # Aquí podrías agregar validaciones reales usando get_id_by_name si quieres
-    # id_carrera = get_id_by_name(await carreras_manager.get_carreras(), nombre_carrera)
+    # id_carrera = await get_id_by_name(await get_carreras(), nombre_carrera)
     # if not id_carrera:
     #     return f"No encontré la carrera '{nombre_carrera}'. Verifica el nombre."
 
@@ -270,7 +296,8 @@ async def default_tool(query: str = None) -> str:
     )
 
 
-tools = [listar_carreras, listar_malla, listar_grupos, default_tool, requisitos_matriculacion, matricular]
+tools = [listar_carreras, buscar_carreras, listar_malla, listar_grupos, comparar_carreras, default_tool, requisitos_matriculacion,
+         matricular]
 
 # El prompt del sistema que define el rol del agente
 system_prompt_template = """
@@ -290,71 +317,118 @@ system_prompt_template = """
     3. Sé cordial, profesional y preciso en tus respuestas
     4. Si no tienes información específica, sugiere al usuario contactar directamente a la UBE
     5. Utiliza las herramientas disponibles para obtener información actualizada
+    6. Si la consulta necesita varias herramientas independientes (por ejemplo, la malla y los grupos de una carrera), llámalas todas en el mismo paso
+    7. Para filtrar carreras por precio, cuotas o varias condiciones a la vez usa buscar_carreras; no filtres tú el listado completo
 
     TONO: Profesional, amigable y servicial.
 
     Si la pregunta no está relacionada con UBE, utiliza siempre la herramienta default_tool.
 """
 
-prompt_template = PromptTemplate.from_template(system_prompt_template)
-prompt = hub.pull("hwchase17/openai-functions-agent")
-prompt.messages[0].prompt.template = system_prompt_template
-
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    google_api_key=GEMINI_API_KEY,
-    temperature=0.1,  # Menos variabilidad en respuestas
-    # max_tokens=2000   # Limitar tokens para evitar respuestas muy largas
-)
-
-# from langchain_openai import ChatOpenAI
-
-# llm = ChatOpenAI(
-#     model="meta-llama/llama-3.3-70b-instruct",   # modelo disponible en OpenRouter
-#     openai_api_key=TOKEN_LLAMA,
-#     openai_api_base="https://openrouter.ai/api/v1",  # base URL de OpenRouter
-#     temperature=0.1,
-#     max_tokens=2000,
-# )
-
-
-# llm = ChatOpenAI(
-#     model="gpt-4o-mini",
-#     openai_api_key=OPENAI_API_KEY,
-#     temperature=0.1,
-#     max_tokens=2000
-# )
-
-# Crea el agente
-from langchain.memory import ConversationBufferMemory
-
-memory = ConversationBufferMemory(
-    memory_key="chat_history",
-    return_messages=True
-)
-
-agent = create_openai_functions_agent(llm, tools, prompt)
-# agent_executor = AgentExecutor(
-#     agent=agent, 
-#     tools=tools, 
-#     verbose=True,
-#     memory=memory
-# )
-
-
-memorias = {}
-
-def get_agent(user_id: str):
-    if user_id not in memorias:
-        memorias[user_id] = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
+# Equivalente local de "hwchase17/openai-tools-agent": evita la descarga desde el hub
+prompt = ChatPromptTemplate.from_messages([
+    ("system", system_prompt_template),
+    MessagesPlaceholder("chat_history", optional=True),
+    ("human", "{input}"),
+    MessagesPlaceholder("agent_scratchpad"),
+])
+
+
+def crear_chat(proveedor: dict, reintentos: int) -> BaseChatModel:
+    """Chat model de un proveedor de `PROVEEDORES_LLM` (SDK de Google o API compatible con OpenAI)."""
+    if proveedor["url"] is None:
+        # Import diferido: el SDK de Google tarda en cargar
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(
+            model=proveedor["modelo"],
+            google_api_key=proveedor["api_key"],
+            temperature=0.1,  # Menos variabilidad en respuestas
+            # max_tokens=2000   # Limitar tokens para evitar respuestas muy largas
+            timeout=LLM_TIMEOUT,
+            max_retries=reintentos,
         )
-    agent_executor = AgentExecutor(
+
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=proveedor["modelo"],
+        api_key=proveedor["api_key"] or "sin-clave",
+        base_url=proveedor["url"],
+        temperature=0.1,
+        timeout=LLM_TIMEOUT,
+        max_retries=reintentos,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_llm() -> BaseChatModel:
+    # Con un solo proveedor los reintentos quedan en su SDK; con varios, el pool cambia de proveedor
+    reintentos = 2 if len(LLM_PROVEEDORES) == 1 else 0
+    pool = registrar_pool(PoolProveedores("agente", {
+        nombre: crear_chat(PROVEEDORES_LLM[nombre], reintentos) for nombre in LLM_PROVEEDORES
+    }))
+    # Mide también las llamadas fuera del agente (resúmenes de memoria)
+    return ChatPool(pool=pool, callbacks=[metricas_callback])
+
+
+# Salidas fijas de AgentExecutor al agotar pasos o tiempo (según el tipo de agente)
+SALIDAS_DETENIDO = {
+    "Agent stopped due to max iterations.",
+    "Agent stopped due to iteration limit or time limit.",
+}
+RESPUESTA_DETENIDO = ("Tu consulta necesitó más pasos de los que puedo dar en un solo mensaje. "
+                      "¿Puedes hacerla por partes o indicarme el nombre exacto de la carrera?")
+
+
+class AgenteVentas(AgentExecutor):
+    """AgentExecutor que, si se agotan los pasos o el tiempo del turno, responde en español sin cachear."""
+
+    @staticmethod
+    def _detenido(output: AgentFinish) -> AgentFinish:
+        if output.return_values.get("output") in SALIDAS_DETENIDO:
+            marcar_no_cacheable()
+            output.return_values["output"] = RESPUESTA_DETENIDO
+        return output
+
+    def _return(self, output: AgentFinish, intermediate_steps: list, run_manager=None) -> dict:
+        return super()._return(self._detenido(output), intermediate_steps, run_manager=run_manager)
+
+    async def _areturn(self, output: AgentFinish, intermediate_steps: list, run_manager=None) -> dict:
+        return await super()._areturn(self._detenido(output), intermediate_steps, run_manager=run_manager)
+
+
+@lru_cache(maxsize=1)
+def get_agent_executor() -> AgentExecutor:
+    """El agente se construye una sola vez; la memoria de cada usuario se asigna por turno."""
+    # Varias herramientas por paso: el executor las corre en paralelo y devuelve todos los resultados juntos
+    agent = create_tool_calling_agent(get_llm(), tools, prompt)
+    # Sin verbose: cada turno queda en un log estructurado y muestreado (ver app.metrics)
+    return AgenteVentas(
         agent=agent,
         tools=tools,
-        verbose=True,
-        memory=memorias[user_id]
+        max_iterations=AGENTE_MAX_ITERACIONES,
+        max_execution_time=AGENTE_MAX_TIEMPO,
     )
-    return agent_executor
 
+
+def crear_memoria() -> MemoriaResumida:
+    return MemoriaResumida(llm=get_llm())
+
+
+session_store = SessionStore(crear_backend(), crear_memoria=crear_memoria)
+# Con sesiones compartidas, dos workers no atienden a la vez al mismo usuario
+turnos_usuario.bloqueo_externo = session_store.bloqueo
+consolidador = ConsolidadorMemorias(session_store)
+
+async def get_agent(user_id: str) -> AgentExecutor:
+    memoria = await session_store.obtener(user_id)
+    # Copia superficial: comparte agente y herramientas, solo cambia la memoria
+    return get_agent_executor().model_copy(update={"memory": memoria})
+
+
+async def guardar_sesion(user_id: str):
+    """Persiste la memoria del usuario al terminar un turno; el resumen se actualiza después."""
+    memoria = await session_store.guardar(user_id)
+    if getattr(memoria, "pendientes", None):
+        consolidador.agendar(user_id)
@@ -8,3 +8,130 @@ API_URL = os.getenv("API_BASE_URL")
 TOKEN_LLAMA = os.getenv("TOKEN_LLAMA")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Endpoint compatible con OpenAI del clasificador de carreras (desempate)
+CLASIFICADOR_BASE_URL = os.getenv("CLASIFICADOR_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/openai/")
+
+# Proveedores de LLM, en orden de preferencia, para el agente y para el clasificador
+LLM_PROVEEDORES = [p.strip() for p in os.getenv("LLM_PROVEEDORES", "gemini").split(",") if p.strip()]
+CLASIFICADOR_PROVEEDORES = [p.strip() for p in os.getenv("CLASIFICADOR_PROVEEDORES", "gemini").split(",") if p.strip()]
+
+# (URL compatible con OpenAI, modelo, API key) de los proveedores conocidos; "gemini" sin URL usa
+# el SDK de Google en el agente y CLASIFICADOR_BASE_URL en el clasificador
+_PROVEEDORES_CONOCIDOS = {
+    "gemini": (None, "gemini-2.0-flash", GEMINI_API_KEY),
+    "openrouter": ("https://openrouter.ai/api/v1", "meta-llama/llama-3.3-70b-instruct", TOKEN_LLAMA),
+    "openai": ("https://api.openai.com/v1", "gpt-4o-mini", OPENAI_API_KEY),
+}
+
+
+def _proveedor(nombre: str) -> dict:
+    """Se puede redefinir (o declarar uno nuevo) con LLM_<NOMBRE>_URL, LLM_<NOMBRE>_MODELO y LLM_<NOMBRE>_API_KEY."""
+    url, modelo, api_key = _PROVEEDORES_CONOCIDOS.get(nombre, (None, None, None))
+    prefijo = f"LLM_{nombre.upper()}_"
+    return {
+        "nombre": nombre,
+        "url": os.getenv(prefijo + "URL", url),
+        "modelo": os.getenv(prefijo + "MODELO", modelo),
+        "api_key": os.getenv(prefijo + "API_KEY", api_key),
+    }
+
+
+PROVEEDORES_LLM = {nombre: _proveedor(nombre) for nombre in dict.fromkeys(LLM_PROVEEDORES + CLASIFICADOR_PROVEEDORES)}
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # segundos por llamada a un proveedor
+# Solicitudes cubiertas: si el proveedor elegido tarda más que su p95, se lanza la misma llamada
+# a otro y gana la primera respuesta
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "si")
+LLM_HEDGE_MIN = float(os.getenv("LLM_HEDGE_MIN", "0.5"))
+LLM_HEDGE_MAX = float(os.getenv("LLM_HEDGE_MAX", "8"))
+# Circuito: tras N fallos seguidos el proveedor se saca de la rotación durante un tiempo
+LLM_CIRCUITO_FALLOS = int(os.getenv("LLM_CIRCUITO_FALLOS", "5"))
+LLM_CIRCUITO_ESPERA = float(os.getenv("LLM_CIRCUITO_ESPERA", "30"))
+
+# Cliente HTTP hacia la API de la UBE
+UBE_MAX_CONEXIONES = int(os.getenv("UBE_MAX_CONEXIONES", "20"))
+UBE_REINTENTOS = int(os.getenv("UBE_REINTENTOS", "2"))
+
+# TTL (segundos) de la caché de datos de la UBE
+CACHE_TTL_CARRERAS = float(os.getenv("CACHE_TTL_CARRERAS", "3600"))
+CACHE_TTL_MALLAS = float(os.getenv("CACHE_TTL_MALLAS", "21600"))
+CACHE_TTL_GRUPOS = float(os.getenv("CACHE_TTL_GRUPOS", "60"))
+
+# Modo multi-worker (python -m app.servidor): workers de uvicorn y catálogo compartido entre ellos.
+# Variable propia y no WEB_CONCURRENCY, que Heroku y otros buildpacks definen por su cuenta
+WORKERS = int(os.getenv("UBE_WORKERS", "1"))
+# Un proceso refrescador publica carreras, mallas y grupos en un archivo mapeado en memoria que leen los workers
+CATALOGO_COMPARTIDO = os.getenv("CATALOGO_COMPARTIDO", "true" if WORKERS > 1 else "false").lower() in ("1", "true", "si")
+CATALOGO_COMPARTIDO_PATH = os.getenv("CATALOGO_COMPARTIDO_PATH", "catalogo_compartido.bin")
+CATALOGO_COMPARTIDO_INTERVALO = float(os.getenv("CATALOGO_COMPARTIDO_INTERVALO", "20"))  # segundos entre refrescos
+CATALOGO_COMPARTIDO_SONDEO = float(os.getenv("CATALOGO_COMPARTIDO_SONDEO", "1"))  # segundos entre revisiones del worker
+
+# Sesiones de conversación (con varios workers, compartidas en SQLite para que cualquiera atienda a un usuario)
+SESIONES_BACKEND = os.getenv("SESIONES_BACKEND", "sqlite" if WORKERS > 1 else "memoria")  # memoria | sqlite
+SESIONES_DB_PATH = os.getenv("SESIONES_DB_PATH", "sesiones.db")
+SESIONES_MAX = int(os.getenv("SESIONES_MAX", "5000"))
+SESIONES_TTL = float(os.getenv("SESIONES_TTL", "86400"))
+SESIONES_MAX_MENSAJES = int(os.getenv("SESIONES_MAX_MENSAJES", "40"))
+SESIONES_MAX_BYTES = int(os.getenv("SESIONES_MAX_BYTES", "65536"))
+# Backend compartido: el turno de un usuario se bloquea entre workers (vence por si el worker muere)
+SESIONES_BLOQUEO_TTL = float(os.getenv("SESIONES_BLOQUEO_TTL", "90"))  # segundos; más que AGENTE_MAX_TIEMPO
+SESIONES_BLOQUEO_ESPERA = float(os.getenv("SESIONES_BLOQUEO_ESPERA", "90"))  # segundos esperando el turno
+
+# Memoria de conversación con presupuesto de tokens
+MEMORIA_TURNOS = int(os.getenv("MEMORIA_TURNOS", "4"))
+MEMORIA_MAX_TOKENS = int(os.getenv("MEMORIA_MAX_TOKENS", "2000"))
+MEMORIA_MAX_TOKENS_RESPUESTA = int(os.getenv("MEMORIA_MAX_TOKENS_RESPUESTA", "250"))
+# Los turnos que salen de la ventana se resumen en segundo plano, por lotes de sesiones
+MEMORIA_CONSOLIDAR_INTERVALO = float(os.getenv("MEMORIA_CONSOLIDAR_INTERVALO", "5"))  # segundos entre lotes
+MEMORIA_CONSOLIDAR_LOTE = int(os.getenv("MEMORIA_CONSOLIDAR_LOTE", "8"))  # sesiones resumidas a la vez
+MEMORIA_MAX_PENDIENTES = int(os.getenv("MEMORIA_MAX_PENDIENTES", "6"))  # turnos sin resumir antes del resumen extractivo
+
+# Caché de respuestas frecuentes
+RESPUESTAS_CACHE_MAX = int(os.getenv("RESPUESTAS_CACHE_MAX", "1000"))
+RESPUESTAS_CACHE_TTL = float(os.getenv("RESPUESTAS_CACHE_TTL", "900"))
+RESPUESTAS_CACHE_UMBRAL = float(os.getenv("RESPUESTAS_CACHE_UMBRAL", "0.8"))
+
+# Presupuesto de tokens para la salida de cada herramienta
+RENDER_MAX_TOKENS = int(os.getenv("RENDER_MAX_TOKENS", "800"))
+
+# Snapshot en disco de carreras, mallas y grupos (arranque en caliente y respaldo si la API cae)
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshot_catalogo.msgpack")  # vacío para desactivar
+SNAPSHOT_INTERVALO = float(os.getenv("SNAPSHOT_INTERVALO", "600"))
+
+# Precarga de la malla y los grupos de cada carrera que aparece en una conversación
+PRECARGA = os.getenv("PRECARGA", "true").lower() in ("1", "true", "si")
+PRECARGA_MAX_EN_VUELO = int(os.getenv("PRECARGA_MAX_EN_VUELO", "4"))  # carreras precargándose a la vez
+PRECARGA_MAX_PENDIENTES = int(os.getenv("PRECARGA_MAX_PENDIENTES", "64"))  # en curso + en espera; el resto se descarta
+PRECARGA_INACTIVIDAD = float(os.getenv("PRECARGA_INACTIVIDAD", "30"))  # segundos sin mensajes antes de cancelar
+
+# Concurrencia: turnos del agente que usan el LLM a la vez y cola de espera
+LLM_MAX_EN_VUELO = int(os.getenv("LLM_MAX_EN_VUELO", "8"))
+LLM_MAX_COLA = int(os.getenv("LLM_MAX_COLA", "32"))
+LLM_MAX_ESPERA = float(os.getenv("LLM_MAX_ESPERA", "20"))  # segundos en cola antes de rechazar
+# Límites de cada turno del agente: pasos (llamadas al LLM), duración total y tiempo de herramientas
+AGENTE_MAX_ITERACIONES = int(os.getenv("AGENTE_MAX_ITERACIONES", "4"))
+AGENTE_MAX_TIEMPO = float(os.getenv("AGENTE_MAX_TIEMPO", "60"))  # segundos
+HERRAMIENTAS_MAX_TIEMPO = float(os.getenv("HERRAMIENTAS_MAX_TIEMPO", "20"))  # segundos con herramientas en curso
+# Responde en un solo turno los mensajes que un usuario envía mientras espera respuesta
+CHAT_FUSIONAR_MENSAJES = os.getenv("CHAT_FUSIONAR_MENSAJES", "false").lower() in ("1", "true", "si")
+
+# Procesamiento por lotes (/ventas/chat/batch y python -m app.lote)
+LOTE_CONCURRENCIA = int(os.getenv("LOTE_CONCURRENCIA", "4"))  # usuarios atendidos a la vez por lote
+LOTE_MAX_ITEMS = int(os.getenv("LOTE_MAX_ITEMS", "1000"))
+LOTE_TIMEOUT = float(os.getenv("LOTE_TIMEOUT", "120"))  # segundos por mensaje
+LOTE_REINTENTOS = int(os.getenv("LOTE_REINTENTOS", "3"))  # reintentos por mensaje si el LLM está saturado
+
+# Webhook de WhatsApp (Cloud API)
+WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
+WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
+WHATSAPP_VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN")
+WHATSAPP_APP_SECRET = os.getenv("WHATSAPP_APP_SECRET")  # valida la firma X-Hub-Signature-256
+WHATSAPP_API_URL = os.getenv("WHATSAPP_API_URL", "https://graph.facebook.com/v20.0/")
+WHATSAPP_CLIENTE = os.getenv("WHATSAPP_CLIENTE", "graph" if WHATSAPP_TOKEN else "local")  # graph | local
+WHATSAPP_TRABAJADORES = int(os.getenv("WHATSAPP_TRABAJADORES", "4"))
+WHATSAPP_MAX_COLA = int(os.getenv("WHATSAPP_MAX_COLA", "1000"))  # mensajes pendientes antes de descartar
+WHATSAPP_VENTANA_FUSION = float(os.getenv("WHATSAPP_VENTANA_FUSION", "1.5"))  # segundos para juntar una ráfaga
+
+# Métricas y logs estructurados por turno
+METRICAS_LOG_MUESTREO = float(os.getenv("METRICAS_LOG_MUESTREO", "0.05"))  # fracción de turnos registrados
+METRICAS_LOG_LENTO = float(os.getenv("METRICAS_LOG_LENTO", "10"))  # segundos; los turnos lentos se registran siempre
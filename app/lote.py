@@ -0,0 +1,62 @@
+"""
+Responde un lote de mensajes sin pasar por HTTP, con las mismas cachés, router
+y agente que la API (útil para colas de WhatsApp atrasadas o conjuntos de evaluación).
+
+Uso:
+    python -m app.lote preguntas.jsonl [-o respuestas.ndjson] [--concurrencia 4] [--debug]
+
+La entrada tiene un objeto JSON por línea, `{"user_id": ..., "query": ...}` (`-`
+lee de stdin). La salida es NDJSON, igual que `/ventas/chat/batch`: una línea por
+mensaje a medida que termina y al final `{"resumen": ...}`.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+from typing import List
+
+from app.schemas.base_schema import ItemLote
+
+
+def leer_items(path: str) -> List[ItemLote]:
+    entrada = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with entrada:
+        return [ItemLote.model_validate_json(linea) for linea in entrada if linea.strip()]
+
+
+async def correr(args) -> int:
+    # Import diferido: app.main carga la configuración (.env) y el agente
+    from app.main import app
+    from app.services.lotes import procesador_lotes
+
+    items = leer_items(args.entrada)
+    errores = 0
+    async with contextlib.AsyncExitStack() as pila:
+        salida = sys.stdout
+        if args.salida is not None:
+            salida = pila.enter_context(open(args.salida, "w", encoding="utf-8"))
+        # Los print de diagnóstico de la app van a stderr para no mezclarse con el NDJSON
+        pila.enter_context(contextlib.redirect_stdout(sys.stderr))
+        # El lifespan inicia el cliente HTTP y carga el snapshot del catálogo, como en la API
+        await pila.enter_async_context(app.router.lifespan_context(app))
+        async for resultado in procesador_lotes.procesar(items, args.concurrencia, debug=args.debug):
+            salida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+            salida.flush()
+            if "resumen" in resultado:
+                errores = resultado["resumen"]["errores"]
+    return 1 if errores else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entrada", help="Archivo JSONL con user_id y query por línea (- para stdin)")
+    parser.add_argument("-o", "--salida", help="Archivo NDJSON de salida (por defecto stdout)")
+    parser.add_argument("--concurrencia", type=int, default=None, help="Usuarios atendidos a la vez")
+    parser.add_argument("--debug", action="store_true", help="Incluye el desglose de tiempos de cada mensaje")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(correr(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
@@ -13,7 +14,16 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 from fastapi import FastAPI
-from app.routers import ventas_route
+from fastapi.responses import PlainTextResponse
+from app.metrics import registro
+from app.routers import ventas_route, whatsapp_route
+from app.config import CATALOGO_COMPARTIDO, WHATSAPP_CLIENTE, WORKERS
+from app.services.catalogo_compartido import catalogo_compartido
+from app.services.http_client import ube_client
+from app.services.snapshot import snapshot_catalogo
+from app.services.whatsapp import cola_whatsapp
+from app.agents.ventas import consolidador, get_agent_executor
+from app.utils import precargar_clasificador, precargar_encoding
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -29,11 +39,49 @@ async def lifespan(app: FastAPI):
         raise RuntimeError(f"Variables de entorno requeridas no encontradas: {missing_vars}")
     else:
         logger.info("✅ Variables de entorno configuradas correctamente")
+
+    await ube_client.iniciar()
+    # El encoding de tiktoken puede descargarse la primera vez: en un hilo, sin retrasar el arranque
+    tarea_encoding = asyncio.create_task(precargar_encoding())
+    # Igual con el SDK del clasificador (~0,8 s de import), antes del primer desempate
+    tarea_clasificador = asyncio.create_task(precargar_clasificador())
+    # El agente (y el cliente de Gemini) se construye aquí y no al importar
+    get_agent_executor()
+
+    # Catálogo desde disco antes del primer mensaje; el refresco corre en segundo plano
+    tarea_snapshot = tarea_catalogo = None
+    if CATALOGO_COMPARTIDO:
+        # Multi-worker: el refrescador consulta la API y publica; este worker solo lee lo publicado
+        catalogo_compartido.conectar()
+        tarea_catalogo = asyncio.create_task(catalogo_compartido.sondear())
+    elif snapshot_catalogo.path:
+        snapshot_catalogo.cargar()
+        tarea_snapshot = asyncio.create_task(snapshot_catalogo.ejecutar())
+
+    if WORKERS > 1 and WHATSAPP_CLIENTE == "graph":
+        logger.warning("⚠️ La cola de WhatsApp deduplica y fusiona por proceso: con varios workers un reintento "
+                       "del webhook puede responderse dos veces; atiéndelo con UBE_WORKERS=1")
+    await cola_whatsapp.iniciar()
+    # Resúmenes de memoria fuera del camino de la respuesta
+    consolidador.iniciar()
     
     yield
     
     # Shutdown
     logger.info("🔄 Cerrando Dr. Matrícula - UBE Chatbot")
+    await cola_whatsapp.cerrar()
+    await consolidador.cerrar()
+    tarea_encoding.cancel()
+    tarea_clasificador.cancel()
+    if tarea_catalogo is not None:
+        tarea_catalogo.cancel()
+    if tarea_snapshot is not None:
+        tarea_snapshot.cancel()
+        try:
+            snapshot_catalogo.guardar()
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el snapshot del catálogo: {e}")
+    await ube_client.cerrar()
 
 # Inicializar FastAPI con configuración mejorada
 app = FastAPI(
@@ -86,5 +134,12 @@ app.add_middleware(
 async def root():
     return {"status": "success", "message": "WhatsApp Chatbot activo"}
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas en formato de Prometheus."""
+    return PlainTextResponse(registro.exportar(), media_type="text/plain; version=0.0.4")
+
 # Incluir router
-app.include_router(ventas_route.router)
\ No newline at end of file
+app.include_router(ventas_route.router)
+app.include_router(whatsapp_route.router)
\ No newline at end of file
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from app.config import METRICAS_LOG_LENTO, METRICAS_LOG_MUESTREO
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_DEFAULT = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+def _etiquetas(etiquetas: Dict[str, Any]) -> Etiquetas:
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _numero(valor: float) -> str:
+    # `:g` corta a 6 dígitos: un contador de 1234567 saldría como 1.23457e+06
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _formatear(nombre: str, etiquetas: Etiquetas, valor: float) -> str:
+    if etiquetas:
+        pares = ",".join(f'{k}="{_escapar(v)}"' for k, v in etiquetas)
+        return f"{nombre}{{{pares}}} {_numero(valor)}"
+    return f"{nombre} {_numero(valor)}"
+
+
+class Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre: str, ayuda: str):
+        self.nombre = nombre
+        self.ayuda = ayuda
+
+    def lineas(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str):
+        super().__init__(nombre, ayuda)
+        self._valores: Dict[Etiquetas, float] = defaultdict(float)
+
+    def inc(self, valor: float = 1.0, **etiquetas):
+        self._valores[_etiquetas(etiquetas)] += valor
+
+    def lineas(self) -> Iterable[str]:
+        for etiquetas, valor in self._valores.items():
+            yield _formatear(self.nombre, etiquetas, valor)
+
+
+class Medidor(Metrica):
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str):
+        super().__init__(nombre, ayuda)
+        self._valores: Dict[Etiquetas, float] = defaultdict(float)
+
+    def set(self, valor: float, **etiquetas):
+        self._valores[_etiquetas(etiquetas)] = valor
+
+    def inc(self, valor: float = 1.0, **etiquetas):
+        self._valores[_etiquetas(etiquetas)] += valor
+
+    def dec(self, valor: float = 1.0, **etiquetas):
+        self._valores[_etiquetas(etiquetas)] -= valor
+
+    def lineas(self) -> Iterable[str]:
+        for etiquetas, valor in self._valores.items():
+            yield _formatear(self.nombre, etiquetas, valor)
+
+
+class Histograma(Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, buckets: Tuple[float, ...] = BUCKETS_DEFAULT):
+        super().__init__(nombre, ayuda)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiquetas: [conteos por bucket..., suma, total]
+        self._series: Dict[Etiquetas, List[float]] = {}
+
+    def observar(self, valor: float, **etiquetas):
+        serie = self._series.get(_etiquetas(etiquetas))
+        if serie is None:
+            serie = self._series[_etiquetas(etiquetas)] = [0.0] * (len(self.buckets) + 2)
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                serie[i] += 1
+                break
+        serie[-2] += valor
+        serie[-1] += 1
+
+    def lineas(self) -> Iterable[str]:
+        for etiquetas, serie in self._series.items():
+            acumulado = 0.0
+            for limite, conteo in zip(self.buckets, serie):
+                acumulado += conteo
+                yield _formatear(f"{self.nombre}_bucket", etiquetas + (("le", f"{limite:g}"),), acumulado)
+            yield _formatear(f"{self.nombre}_bucket", etiquetas + (("le", "+Inf"),), serie[-1])
+            yield _formatear(f"{self.nombre}_sum", etiquetas, serie[-2])
+            yield _formatear(f"{self.nombre}_count", etiquetas, serie[-1])
+
+
+class Registro:
+    """Registro de métricas en formato de exposición de Prometheus (texto 0.0.4)."""
+
+    def __init__(self):
+        self._metricas: Dict[str, Metrica] = {}
+        # Funciones que actualizan medidores justo antes de exportar (p. ej. stats de cachés)
+        self._colectores: List[Callable[[], None]] = []
+
+    def _registrar(self, metrica: Metrica) -> Metrica:
+        existente = self._metricas.get(metrica.nombre)
+        if existente is not None:
+            return existente
+        self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre: str, ayuda: str) -> Contador:
+        return self._registrar(Contador(nombre, ayuda))
+
+    def medidor(self, nombre: str, ayuda: str) -> Medidor:
+        return self._registrar(Medidor(nombre, ayuda))
+
+    def histograma(self, nombre: str, ayuda: str, buckets: Tuple[float, ...] = BUCKETS_DEFAULT) -> Histograma:
+        return self._registrar(Histograma(nombre, ayuda, buckets))
+
+    def colector(self, funcion: Callable[[], None]):
+        self._colectores.append(funcion)
+
+    def exportar(self) -> str:
+        for colector in self._colectores:
+            try:
+                colector()
+            except Exception as e:
+                logger.warning(f"Error en colector de métricas: {e}")
+        lineas = []
+        for metrica in self._metricas.values():
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.lineas())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+CHAT_DURACION = registro.histograma("ube_chat_duracion_segundos", "Duración de cada turno de chat por origen de la respuesta")
+LLM_DURACION = registro.histograma("ube_llm_duracion_segundos", "Duración de cada llamada al LLM")
+LLM_ERRORES = registro.contador("ube_llm_errores_total", "Llamadas al LLM que fallaron")
+LLM_TOKENS = registro.contador("ube_llm_tokens_total", "Tokens consumidos por el LLM (prompt / completion)")
+TOOL_DURACION = registro.histograma("ube_tool_duracion_segundos", "Duración de cada herramienta del agente")
+TOOL_ERRORES = registro.contador("ube_tool_errores_total", "Herramientas que terminaron con error")
+FETCH_DURACION = registro.histograma("ube_fetch_duracion_segundos", "Duración de las peticiones a la API de la UBE")
+FETCH_ERRORES = registro.contador("ube_fetch_errores_total", "Peticiones a la API de la UBE que fallaron")
+CACHE_DURACION = registro.histograma(
+    "ube_cache_duracion_segundos", "Duración de las consultas a la caché (incluye la carga en un miss)"
+)
+CLASIFICADOR_DURACION = registro.histograma(
+    "ube_clasificador_duracion_segundos", "Duración del desempate de carreras con el LLM clasificador"
+)
+
+# Desglose de tiempos del turno actual: {"etapas": [...], "tokens": {...}}
+_desglose: ContextVar[Optional[dict]] = ContextVar("desglose", default=None)
+
+
+@contextmanager
+def desglose():
+    """Junta las etapas (LLM, herramientas, fetch, caché) y los tokens del turno."""
+    datos: dict = {"etapas": [], "tokens": {"prompt": 0, "completion": 0}}
+    token = _desglose.set(datos)
+    inicio = time.perf_counter()
+    try:
+        yield datos
+    finally:
+        datos["total_ms"] = round((time.perf_counter() - inicio) * 1e3, 1)
+        _desglose.reset(token)
+
+
+def registrar_etapa(etapa: str, nombre: str, segundos: float):
+    datos = _desglose.get()
+    if datos is not None:
+        datos["etapas"].append({"etapa": etapa, "nombre": nombre, "ms": round(segundos * 1e3, 1)})
+
+
+@contextmanager
+def medir(histograma: Histograma, etapa: str, errores: Contador = None, **etiquetas):
+    """Observa la duración del bloque en `histograma` y la agrega al desglose del turno."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errores is not None:
+            errores.inc(**etiquetas)
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        histograma.observar(duracion, **etiquetas)
+        registrar_etapa(etapa, "/".join(str(v) for v in etiquetas.values()), duracion)
+
+
+def _seudonimo(user_id: str) -> str:
+    """Huella corta del usuario: agrupa sus turnos en el log sin exponer el número de teléfono."""
+    return hashlib.blake2b(user_id.encode(), digest_size=6).hexdigest()
+
+
+def registrar_turno(user_id: str, origen: str, datos: dict):
+    """Cierra las métricas del turno y lo registra en el log, muestreado (los lentos siempre)."""
+    total = datos.get("total_ms", 0.0) / 1e3
+    CHAT_DURACION.observar(total, origen=origen)
+    if total >= METRICAS_LOG_LENTO or random.random() < METRICAS_LOG_MUESTREO:
+        logger.info(json.dumps(
+            {"evento": "turno", "usuario": _seudonimo(user_id), "origen": origen, **datos}, ensure_ascii=False
+        ))
+
+
+class MetricasCallback(AsyncCallbackHandler):
+    """Mide llamadas al LLM (duración y tokens) y herramientas del agente."""
+
+    def __init__(self):
+        self._inicios: Dict[UUID, Tuple[str, float]] = {}
+
+    def _iniciar(self, run_id: UUID, nombre: str):
+        self._inicios[run_id] = (nombre, time.perf_counter())
+
+    def _terminar(self, run_id: UUID) -> Tuple[str, float]:
+        nombre, inicio = self._inicios.pop(run_id, ("desconocido", time.perf_counter()))
+        return nombre, time.perf_counter() - inicio
+
+    @staticmethod
+    def _modelo(serialized: Optional[dict], kwargs: dict) -> str:
+        metadata = kwargs.get("metadata") or {}
+        return metadata.get("ls_model_name") or (serialized or {}).get("name") or "llm"
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self._iniciar(run_id, self._modelo(serialized, kwargs))
+
+    async def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs):
+        self._iniciar(run_id, self._modelo(serialized, kwargs))
+
+    async def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        modelo, duracion = self._terminar(run_id)
+        LLM_DURACION.observar(duracion, modelo=modelo)
+        registrar_etapa("llm", modelo, duracion)
+
+        prompt = completion = 0
+        for generaciones in response.generations:
+            for generacion in generaciones:
+                uso = getattr(getattr(generacion, "message", None), "usage_metadata", None) or {}
+                prompt += uso.get("input_tokens", 0)
+                completion += uso.get("output_tokens", 0)
+        if not prompt and not completion:
+            uso = (response.llm_output or {}).get("token_usage") or {}
+            prompt, completion = uso.get("prompt_tokens", 0), uso.get("completion_tokens", 0)
+
+        LLM_TOKENS.inc(prompt, modelo=modelo, tipo="prompt")
+        LLM_TOKENS.inc(completion, modelo=modelo, tipo="completion")
+        datos = _desglose.get()
+        if datos is not None:
+            datos["tokens"]["prompt"] += prompt
+            datos["tokens"]["completion"] += completion
+
+    async def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        modelo, _ = self._terminar(run_id)
+        LLM_ERRORES.inc(modelo=modelo)
+
+    async def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs):
+        self._iniciar(run_id, (serialized or {}).get("name") or kwargs.get("name") or "tool")
+
+    async def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        tool, duracion = self._terminar(run_id)
+        TOOL_DURACION.observar(duracion, tool=tool)
+        registrar_etapa("tool", tool, duracion)
+
+    async def on_tool_error(self, error, *, run_id: UUID, **kwargs):
+        tool, duracion = self._terminar(run_id)
+        TOOL_DURACION.observar(duracion, tool=tool)
+        TOOL_ERRORES.inc(tool=tool)
+
+
+metricas_callback = MetricasCallback()
@@ -0,0 +1,63 @@
+"""
+Refrescador del catálogo compartido (modo multi-worker).
+
+Consulta la API de la UBE (carreras, y mallas y grupos de todas las carreras) y
+publica el resultado en `CATALOGO_COMPARTIDO_PATH` cada `CATALOGO_COMPARTIDO_INTERVALO`
+segundos; los workers de uvicorn lo leen mapeado en memoria. `python -m app.servidor`
+lo inicia solo: ejecutarlo a mano sirve para desplegarlo aparte en el mismo host.
+
+Uso:
+    python -m app.refrescador [--salir-con-padre]
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+from app.services.catalogo_compartido import catalogo_compartido
+from app.services.http_client import ube_client
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre revisiones de que el proceso padre sigue vivo
+SONDEO_PADRE = 1.0
+
+
+async def esperar_padre():
+    """Termina cuando muere el proceso que lanzó al refrescador (queda adoptado por otro)."""
+    padre = os.getppid()
+    while os.getppid() == padre:
+        await asyncio.sleep(SONDEO_PADRE)
+
+
+async def correr(salir_con_padre: bool = False):
+    await ube_client.iniciar()
+    try:
+        # Lo último publicado sirve de respaldo si la API no responde al arrancar
+        restauradas = catalogo_compartido.restaurar()
+        if restauradas:
+            logger.info(f"Catálogo compartido {catalogo_compartido.generacion} restaurado: {restauradas} entradas")
+        tareas = [asyncio.create_task(catalogo_compartido.ejecutar())]
+        if salir_con_padre:
+            # uvicorn vuelve a lanzar la señal que lo detuvo, así que app.servidor no siempre alcanza a detenerlo
+            tareas.append(asyncio.create_task(esperar_padre()))
+        _, pendientes = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+        for tarea in pendientes:
+            tarea.cancel()
+    finally:
+        await ube_client.cerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--salir-con-padre", action="store_true", help="Termina cuando termina el proceso que lo lanzó")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(correr(args.salir_con_padre))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,22 @@
+import json
+import os
 from fastapi import APIRouter
-from app.schemas.base_schema import Consulta
-from app.agents.ventas import get_agent
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.schemas.base_schema import Consulta, ConsultaLote
+from app.agents.ventas import consolidador, session_store
+from app.agents.render import render_store
+from app.agents.router import router_intenciones
+from app.services.cache import cache_stats, versiones_carreras
+from app.services.catalogo_compartido import catalogo_compartido
+from app.services.precarga import precargador
+from app.services.ventas_service import sincronizador
+from app.services.chat_service import responder, responder_stream
+from app.services.concurrencia import SaturacionLLM, limitador_llm, turnos_usuario
+from app.services.lotes import procesador_lotes
+from app.services.proveedores_llm import POOLS
+from app.services.respuestas_cache import respuestas_cache
+from app.services.snapshot import snapshot_catalogo
+from app.services.whatsapp import cola_whatsapp
 
 
 router = APIRouter(
@@ -10,10 +26,88 @@ router = APIRouter(
 
 
 @router.post("/chat")
-async def chat_con_agente(consulta: Consulta, user_id: str):
+async def chat_con_agente(consulta: Consulta, user_id: str, debug: bool = False):
+    """Con `debug=true` la respuesta incluye el desglose de tiempos y tokens del turno."""
     try:
-        agent_executor = get_agent(user_id)
-        response = await agent_executor.ainvoke({"input": consulta.query})
-        return {"respuesta": response["output"]}
+        return await responder(user_id, consulta.query, debug=debug)
+    except SaturacionLLM as e:
+        return _saturado(e)
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+
+def _saturado(e: SaturacionLLM) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": str(e), "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _sse(evento: str, datos: dict) -> str:
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_con_agente_stream(consulta: Consulta, user_id: str):
+    """
+    Igual que /chat, pero responde con Server-Sent Events a medida que el agente avanza:
+    `tool_start` / `tool_end` por cada herramienta, `token` por cada fragmento de la
+    respuesta final y `fin` con la respuesta completa.
+    """
+    # Rechazo rápido antes de abrir el stream; si la cola se llena después, llega como evento
+    try:
+        limitador_llm.verificar()
+    except SaturacionLLM as e:
+        return _saturado(e)
+
+    async def eventos():
+        try:
+            async for evento, datos in responder_stream(user_id, consulta.query):
+                yield _sse(evento, datos)
+        except SaturacionLLM as e:
+            yield _sse("error", {"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/chat/batch")
+async def chat_por_lotes(consulta: ConsultaLote, debug: bool = False):
+    """
+    Responde muchos mensajes `(user_id, query)` de una vez. Los resultados llegan como
+    NDJSON a medida que terminan (una línea por mensaje, con su `indice`, `ms` y `ok`
+    o `error`) y la última línea es `{"resumen": ...}`. Los mensajes de un mismo
+    usuario se responden en el orden en que vienen.
+    """
+    async def lineas():
+        async for resultado in procesador_lotes.procesar(consulta.items, consulta.concurrencia, debug=debug):
+            yield json.dumps(resultado, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lineas(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+@router.get("/estado")
+async def estado():
+    return {
+        "cache": cache_stats(),
+        "sincronizacion": {"api": sincronizador.resumen(), "carreras": versiones_carreras.resumen()},
+        "snapshot": snapshot_catalogo.resumen(),
+        # Con varios workers cada respuesta describe solo al worker que la atendió
+        "pid": os.getpid(),
+        "catalogo_compartido": catalogo_compartido.resumen(),
+        "respuestas": respuestas_cache.resumen(),
+        "precarga": precargador.resumen(),
+        "render": render_store.resumen(),
+        "router": router_intenciones.resumen(),
+        "sesiones": {**session_store.resumen(), "consolidacion": consolidador.resumen()},
+        "concurrencia": {"llm": limitador_llm.resumen(), "usuarios": turnos_usuario.resumen()},
+        "proveedores_llm": {nombre: pool.resumen() for nombre, pool in POOLS.items()},
+        "lotes": procesador_lotes.resumen(),
+        "whatsapp": cola_whatsapp.resumen(),
+    }
\ No newline at end of file
@@ -0,0 +1,42 @@
+import json
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.config import WHATSAPP_VERIFY_TOKEN
+from app.services.whatsapp import cola_whatsapp, extraer_mensajes, firma_valida
+
+
+router = APIRouter(
+    prefix="/whatsapp",
+    tags=["WhatsApp"]
+)
+
+
+@router.get("/webhook")
+async def verificar_webhook(
+    modo: str = Query(None, alias="hub.mode"),
+    token: str = Query(None, alias="hub.verify_token"),
+    challenge: str = Query(None, alias="hub.challenge"),
+):
+    """Verificación de la suscripción del webhook (Meta envía `hub.challenge` y espera recibirlo de vuelta)."""
+    if modo == "subscribe" and WHATSAPP_VERIFY_TOKEN and token == WHATSAPP_VERIFY_TOKEN:
+        return PlainTextResponse(challenge or "")
+    return JSONResponse(status_code=403, content={"status": "error", "message": "Token de verificación inválido"})
+
+
+@router.post("/webhook")
+async def recibir_webhook(request: Request):
+    """
+    Recibe las notificaciones de WhatsApp y responde de inmediato: los mensajes
+    se encolan y un pool de trabajadores los responde con el agente.
+    """
+    cuerpo = await request.body()
+    if not firma_valida(cuerpo, request.headers.get("X-Hub-Signature-256")):
+        return JSONResponse(status_code=403, content={"status": "error", "message": "Firma inválida"})
+    try:
+        payload = json.loads(cuerpo)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "JSON inválido"})
+
+    # Siempre 200 aunque se descarte algo: un error haría que WhatsApp reintente la notificación
+    encolados = sum(cola_whatsapp.encolar(mensaje) for mensaje in extraer_mensajes(payload))
+    return {"status": "success", "encolados": encolados}
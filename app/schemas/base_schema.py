@@ -1,9 +1,59 @@
-from pydantic import BaseModel
+import sys
+from typing import Annotated, Any, Dict, List, Optional, Union
+
+from pydantic import AfterValidator, BaseModel, Field, TypeAdapter
+from pydantic.dataclasses import dataclass
+
+from app.config import LOTE_MAX_ITEMS
+
+# Registros de solo lectura y sin __dict__ para los datos que viven en las cachés
+compacto = dataclass(frozen=True, slots=True)
+
+# Valores que se repiten en todo el catálogo (modalidades, sesiones...): una sola copia por proceso
+TextoInternado = Annotated[str, AfterValidator(sys.intern)]
+
+_ADAPTADORES: Dict[type, TypeAdapter] = {}
+
+
+class Registro:
+    """
+    Base de los registros `@compacto`. Expone la misma interfaz que un BaseModel
+    (`model_validate_json`, `model_validate`, `model_dump`, `model_dump_json`),
+    así las cachés, el snapshot y las huellas no distinguen entre ambos.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def _adaptador(cls) -> TypeAdapter:
+        adaptador = _ADAPTADORES.get(cls)
+        if adaptador is None:
+            adaptador = _ADAPTADORES[cls] = TypeAdapter(cls)
+        return adaptador
+
+    @classmethod
+    def model_validate_json(cls, datos: Union[bytes, str]):
+        """Valida directo desde el JSON de la respuesta, sin pasar por dicts intermedios."""
+        return cls._adaptador().validate_json(datos)
+
+    @classmethod
+    def model_validate(cls, datos: Any):
+        return cls._adaptador().validate_python(datos)
+
+    def model_dump(self) -> dict:
+        return self._adaptador().dump_python(self, mode="json")
+
+    def model_dump_json(self) -> str:
+        return self._adaptador().dump_json(self).decode()
 
 
 class Response(BaseModel):
     status: str
 
+
+@compacto
+class RespuestaCompacta(Registro):
+    status: str
+
 class Error(Response):
     message: str
 
@@ -11,4 +61,13 @@ class Matricular(Response):
     message: str
 
 class Consulta(BaseModel):
-    query: str
\ No newline at end of file
+    query: str
+
+class ItemLote(BaseModel):
+    user_id: str
+    query: str
+
+class ConsultaLote(BaseModel):
+    items: List[ItemLote] = Field(min_length=1, max_length=LOTE_MAX_ITEMS)
+    # Usuarios atendidos a la vez; por defecto LOTE_CONCURRENCIA (nunca más que ese valor)
+    concurrencia: Optional[int] = Field(default=None, ge=1)
@@ -1,25 +1,34 @@
-from .base_schema import Response
-from pydantic import BaseModel
-from typing import List, Optional
-from langgraph.graph import StateGraph, MessagesState
+from dataclasses import field
+from typing import Dict, Optional, Tuple
 
+from .base_schema import RespuestaCompacta, Registro, TextoInternado, compacto
 
-class Precios(BaseModel):
-    inscripcion: float = None
-    matricula: float = None
-    numero_cuotas: int = None
+
+@compacto
+class Precios(Registro):
+    inscripcion: Optional[float] = None
+    matricula: Optional[float] = None
+    numero_cuotas: Optional[int] = None
     homologacion: Optional[float] = None
 
-class Carrera(BaseModel):
+@compacto
+class Carrera(Registro):
     id: int
     nombre: str
-    sesiones: List[str]
-    modalidades: List[str]
+    sesiones: Tuple[TextoInternado, ...]
+    modalidades: Tuple[TextoInternado, ...]
     precios: Optional[Precios] = None
 
-class DataCarreras(BaseModel):
-    grado: List[Carrera]
-    postgrado: List[Carrera]
+@compacto
+class DataCarreras(Registro):
+    grado: Tuple[Carrera, ...]
+    postgrado: Tuple[Carrera, ...]
+    # Índice id -> Carrera, armado una vez al validar (no se serializa)
+    por_id: Dict[int, Carrera] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "por_id", {c.id: c for c in self.grado + self.postgrado})
 
-class Carreras(Response):
+@compacto
+class Carreras(RespuestaCompacta):
     data: DataCarreras
@@ -1,16 +1,18 @@
-from pydantic import BaseModel
-from .base_schema import Response
-from typing import List
+from typing import Tuple
 
-class GrupoData(BaseModel):
-    carrera: str
+from .base_schema import RespuestaCompacta, Registro, TextoInternado, compacto
+
+@compacto
+class GrupoData(Registro):
+    carrera: TextoInternado
     nombre: str
-    fecha_inicio: str
-    fecha_fin: str
+    fecha_inicio: TextoInternado
+    fecha_fin: TextoInternado
     capacidad: int
-    sesion: str
-    modalidad: str
-    nivel: str
+    sesion: TextoInternado
+    modalidad: TextoInternado
+    nivel: TextoInternado
 
-class Grupos(Response):
-    data: List[GrupoData]
\ No newline at end of file
+@compacto
+class Grupos(RespuestaCompacta):
+    data: Tuple[GrupoData, ...]
@@ -1,15 +1,18 @@
-from pydantic import BaseModel
-from typing import List, Optional
-from app.schemas.base_schema import Response
+from typing import Optional, Tuple
 
-class Asignatura(BaseModel):
+from app.schemas.base_schema import RespuestaCompacta, Registro, TextoInternado, compacto
+
+@compacto
+class Asignatura(Registro):
     asignatura: str
     horas: int | float
     creditos: Optional[int] = None
 
-class DataMalla(BaseModel):
-    nivel_malla: str
-    asignaturas: List[Asignatura]
+@compacto
+class DataMalla(Registro):
+    nivel_malla: TextoInternado
+    asignaturas: Tuple[Asignatura, ...]
 
-class Malla(Response):
-    data: List[DataMalla]
+@compacto
+class Malla(RespuestaCompacta):
+    data: Tuple[DataMalla, ...]
@@ -0,0 +1,123 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from app.schemas.carreras_schema import Carrera, DataCarreras
+from app.services.cache import carreras_cache
+from app.services.carreras_resolver import normalizar, tipo_carrera
+
+# Campos con búsqueda por rango: nombre -> valor de la carrera (None si no lo publica)
+CAMPOS_RANGO: Dict[str, Callable[[Carrera], Optional[float]]] = {
+    "inscripcion": lambda c: c.precios.inscripcion if c.precios else None,
+    "matricula": lambda c: c.precios.matricula if c.precios else None,
+    "cuotas": lambda c: c.precios.numero_cuotas if c.precios else None,
+}
+ORDENES = set(CAMPOS_RANGO) | {"nombre"}
+
+Rango = Tuple[Optional[float], Optional[float]]
+
+
+class IndiceCarreras:
+    """
+    Índice invertido del catálogo para búsquedas por facetas y rangos.
+
+    - Facetas (tipo, modalidad, sesión): valor normalizado -> ids de carreras.
+    - Rangos (inscripción, matrícula, cuotas): valores ordenados con sus ids; un
+      rango es un corte con bisect.
+    Los filtros se intersectan empezando por el conjunto más chico, y el top-N se
+    toma recorriendo el orden ya calculado del campo, sin ordenar el resultado.
+    """
+
+    def __init__(self, carreras: DataCarreras):
+        self.carreras: Dict[int, Carrera] = carreras.por_id
+        self.todas: FrozenSet[int] = frozenset(self.carreras)
+        self.tipos: Dict[str, FrozenSet[int]] = {
+            "grado": frozenset(c.id for c in carreras.grado),
+            "postgrado": frozenset(c.id for c in carreras.postgrado),
+        }
+
+        facetas: Dict[str, Dict[str, Set[int]]] = {"modalidad": defaultdict(set), "sesion": defaultdict(set)}
+        # Modalidades y sesiones se repiten en todo el catálogo: se normaliza cada valor una vez
+        normalizados: Dict[str, str] = {}
+        for carrera in self.carreras.values():
+            for campo, valores in (("modalidad", carrera.modalidades), ("sesion", carrera.sesiones)):
+                for valor in valores:
+                    if valor not in normalizados:
+                        normalizados[valor] = normalizar(valor)
+                    facetas[campo][normalizados[valor]].add(carrera.id)
+        self.facetas: Dict[str, Dict[str, FrozenSet[int]]] = {
+            campo: {valor: frozenset(ids) for valor, ids in valores.items()} for campo, valores in facetas.items()
+        }
+
+        self._valores: Dict[str, List[float]] = {}
+        # Ids en el orden de cada campo (solo las carreras que publican el valor)
+        self._ids: Dict[str, List[int]] = {}
+        for campo, valor_de in CAMPOS_RANGO.items():
+            pares = sorted((valor, c.id) for c in self.carreras.values() if (valor := valor_de(c)) is not None)
+            self._valores[campo] = [valor for valor, _ in pares]
+            self._ids[campo] = [id_carrera for _, id_carrera in pares]
+        self._ids["nombre"] = sorted(self.carreras, key=lambda i: (normalizar(self.carreras[i].nombre), i))
+
+    def _faceta(self, campo: str, buscado: str) -> FrozenSet[int]:
+        # Misma coincidencia que los filtros de listar_carreras: "hibrida" encuentra "Híbrida",
+        # pero "presencial" no encuentra "Semipresencial"
+        return self.facetas[campo].get(normalizar(buscado), frozenset())
+
+    def _rango(self, campo: str, minimo: Optional[float], maximo: Optional[float]) -> List[int]:
+        valores = self._valores[campo]
+        desde = bisect_left(valores, minimo) if minimo is not None else 0
+        hasta = bisect_right(valores, maximo) if maximo is not None else len(valores)
+        return self._ids[campo][desde:hasta]
+
+    def buscar(self, tipo: str = None, modalidad: str = None, sesion: str = None,
+               rangos: Dict[str, Rango] = None, orden: str = "matricula", descendente: bool = False,
+               limite: int = 10) -> Tuple[List[Carrera], int]:
+        """Retorna (las primeras `limite` carreras en el orden pedido, total de coincidencias)."""
+        conjuntos = []
+        if tipo and tipo_carrera(tipo):
+            conjuntos.append(self.tipos[tipo_carrera(tipo)])
+        if modalidad:
+            conjuntos.append(self._faceta("modalidad", modalidad))
+        if sesion:
+            conjuntos.append(self._faceta("sesion", sesion))
+        for campo, (minimo, maximo) in (rangos or {}).items():
+            if minimo is not None or maximo is not None:
+                conjuntos.append(self._rango(campo, minimo, maximo))
+
+        conjuntos.sort(key=len)
+        resultado = set(conjuntos[0]) if conjuntos else set(self.todas)
+        for conjunto in conjuntos[1:]:
+            if not resultado:
+                break
+            resultado.intersection_update(conjunto)
+
+        ordenados = self._ids[orden if orden in ORDENES else "matricula"]
+        primeras = []
+        for id_carrera in reversed(ordenados) if descendente else ordenados:
+            if len(primeras) == limite:
+                break
+            if id_carrera in resultado:
+                primeras.append(id_carrera)
+        if len(primeras) < limite and len(resultado) > len(primeras):
+            # Las carreras sin el valor publicado van al final, en orden de id
+            con_valor = set(ordenados)
+            primeras += heapq.nsmallest(limite - len(primeras), (i for i in resultado if i not in con_valor))
+        return [self.carreras[i] for i in primeras], len(resultado)
+
+
+_indice: Optional[IndiceCarreras] = None
+_catalogo: Optional[DataCarreras] = None
+
+
+def get_indice(carreras: DataCarreras) -> IndiceCarreras:
+    """Retorna el índice del catálogo, reconstruyéndolo cuando el catálogo cambia."""
+    global _indice, _catalogo
+    if carreras is not _catalogo:
+        _indice = IndiceCarreras(carreras)
+        _catalogo = carreras
+    return _indice
+
+
+# Se reconstruye al (re)cargar el catálogo en la caché, no en la primera búsqueda
+carreras_cache.al_cargar.append(lambda key, valor, h: get_indice(valor.data))
@@ -0,0 +1,369 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from app.config import CACHE_TTL_CARRERAS, CACHE_TTL_MALLAS, CACHE_TTL_GRUPOS
+from app.metrics import CACHE_DURACION, medir, registro
+from app.schemas.carreras_schema import Carreras
+from app.schemas.grupos_schema import Grupos
+from app.schemas.malla_schema import Malla
+from app.services.ventas_service import fetch_carreras, fetch_malla, fetch_grupos
+
+logger = logging.getLogger(__name__)
+
+# Con la API caída, el valor de respaldo se sirve sin esperar y se reintenta en segundo plano cada tanto
+REINTENTO_TRAS_FALLO = 30.0
+
+PRECARGA_AHORRO = registro.histograma(
+    "ube_precarga_ahorro_segundos", "Latencia de la API que se evitó al encontrar un dato ya precargado"
+)
+
+# Datos consultados durante el turno actual: {(cache, llave): huella}
+_dependencias: ContextVar[Optional[dict]] = ContextVar("dependencias", default=None)
+
+
+def huella(valor: Any) -> str:
+    """Hash del contenido de un valor (modelos Pydantic o cualquier objeto con repr estable)."""
+    contenido = valor.model_dump_json() if hasattr(valor, "model_dump_json") else repr(valor)
+    return hashlib.blake2b(contenido.encode(), digest_size=8).hexdigest()
+
+
+class AsyncTTLCache:
+    """
+    Caché asíncrona con TTL, LRU acotado y coalescencia de peticiones.
+
+    - Dentro del TTL el valor se sirve directo.
+    - Pasado el TTL, y mientras no supere `ttl + stale_ttl`, se sirve el valor
+      viejo y se refresca en segundo plano (stale-while-revalidate).
+    - N fallos concurrentes para la misma llave hacen una sola llamada al loader.
+    - Si el loader falla (API caída) y hay un valor viejo, se sirve ese valor;
+      `antiguedad_respaldo` indica su edad para avisarle al usuario.
+    """
+
+    def __init__(self, nombre: str, loader: Callable[[Hashable], Awaitable[Any]],
+                 ttl: float, stale_ttl: float = None, max_items: int = 256):
+        self.nombre = nombre
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = ttl if stale_ttl is None else stale_ttl
+        self.max_items = max_items
+        self._datos: "OrderedDict[Hashable, tuple[Any, float]]" = OrderedDict()
+        self._en_vuelo: Dict[Hashable, asyncio.Task] = {}
+        # Huella de cada valor guardado: permite saber si un dato cambió. Se descarta con
+        # el valor (las respuestas cacheadas que dependían de él dejan de estar vigentes)
+        self._huellas: Dict[Hashable, str] = {}
+        # Callbacks (llave, valor, huella) al cargar un valor, p. ej. para precalcular textos
+        self.al_cargar: List[Callable[[Hashable, Any, str], None]] = []
+        # Llaves cuyo último refresco falló: su valor se sirve como respaldo
+        self._fallos: Dict[Hashable, float] = {}
+        # Llaves precargadas que nadie consultó todavía -> segundos que tardó la carga
+        self._precargadas: Dict[Hashable, float] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refrescos": 0, "errores": 0, "evictions": 0,
+                      "respaldos": 0, "sin_cambios": 0, "precargas": 0, "precargas_usadas": 0, "precarga_ahorro_ms": 0}
+
+    async def get(self, key: Hashable = None, registrar: bool = True) -> Any:
+        """Con `registrar=False` la consulta no cuenta como dependencia del turno (ver `rastrear_dependencias`)."""
+        with medir(CACHE_DURACION, "cache", cache=self.nombre):
+            valor = await self._get(key)
+        if key in self._precargadas:
+            # La consulta no pagó la ida a la API: la precarga se adelantó
+            ahorro = self._precargadas.pop(key)
+            self.stats["precargas_usadas"] += 1
+            self.stats["precarga_ahorro_ms"] += round(ahorro * 1000)
+            PRECARGA_AHORRO.observar(ahorro, cache=self.nombre)
+        dependencias = _dependencias.get()
+        if dependencias is not None and registrar:
+            dependencias[(self.nombre, key)] = self._huellas.get(key)
+        return valor
+
+    async def _get(self, key: Hashable) -> Any:
+        entrada = self._datos.get(key)
+        if entrada is not None:
+            valor, guardado = entrada
+            edad = time.monotonic() - guardado
+            self._datos.move_to_end(key)
+            if edad < self.ttl:
+                self.stats["hits"] += 1
+                return valor
+            if edad < self.ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                self._cargar(key)
+                return valor
+            if key in self._fallos:
+                self.stats["respaldos"] += 1
+                if time.monotonic() - self._fallos[key] > REINTENTO_TRAS_FALLO:
+                    self._cargar(key)
+                return valor
+
+        self.stats["misses"] += 1
+        try:
+            return await asyncio.shield(self._cargar(key))
+        except Exception:
+            if entrada is None:
+                raise
+            self.stats["respaldos"] += 1
+            return entrada[0]
+
+    async def refrescar(self, key: Hashable = None) -> Any:
+        """Recarga `key` desde el loader (coalesciendo con las consultas en curso) y reemplaza el valor."""
+        return await asyncio.shield(self._cargar(key))
+
+    async def precargar(self, key: Hashable) -> bool:
+        """
+        Carga `key` antes de que alguien la consulte. No hace nada si el valor sigue
+        servible (vigente o dentro de `stale_ttl`) o si ya se está cargando.
+        Retorna True si la cargó.
+        """
+        entrada = self._datos.get(key)
+        if key in self._en_vuelo or (entrada is not None and time.monotonic() - entrada[1] < self.ttl + self.stale_ttl):
+            return False
+        inicio = time.perf_counter()
+        # shield: cancelar la precarga no corta una carga a la que ya se sumó una consulta real
+        await asyncio.shield(self._cargar(key))
+        self._precargadas[key] = time.perf_counter() - inicio
+        self.stats["precargas"] += 1
+        return True
+
+    def _cargar(self, key: Hashable) -> asyncio.Task:
+        task = self._en_vuelo.get(key)
+        if task is None:
+            task = asyncio.create_task(self._refrescar(key))
+            self._en_vuelo[key] = task
+            task.add_done_callback(lambda t: self._terminar(key, t))
+        return task
+
+    async def _refrescar(self, key: Hashable) -> Any:
+        self.stats["refrescos"] += 1
+        valor = await self.loader(key)
+        self.set(key, valor)
+        return valor
+
+    def _terminar(self, key: Hashable, task: asyncio.Task):
+        self._en_vuelo.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self._fallos[key] = time.monotonic()
+            self.stats["errores"] += 1
+            logger.warning(f"Error refrescando {self.nombre}[{key}]: {task.exception()}")
+
+    def set(self, key: Hashable, valor: Any, edad: float = 0.0):
+        """Guarda `valor`; `edad` (s) permite restaurar datos viejos, p. ej. desde un snapshot."""
+        entrada = self._datos.get(key)
+        if entrada is not None and entrada[0] is valor:
+            # La API respondió que no hubo cambios (mismo objeto): solo se renueva el TTL,
+            # sin recalcular la huella ni los callbacks (textos, índices)
+            self._datos[key] = (valor, time.monotonic() - edad)
+            self._datos.move_to_end(key)
+            self._fallos.pop(key, None)
+            self.stats["sin_cambios"] += 1
+            return
+        self._huellas[key] = huella(valor)
+        self._datos[key] = (valor, time.monotonic() - edad)
+        self._fallos.pop(key, None)
+        for callback in self.al_cargar:
+            try:
+                callback(key, valor, self._huellas[key])
+            except Exception as e:
+                logger.warning(f"Error en al_cargar de {self.nombre}[{key}]: {e}")
+        self._datos.move_to_end(key)
+        while len(self._datos) > self.max_items:
+            expulsada, _ = self._datos.popitem(last=False)
+            self._huellas.pop(expulsada, None)
+            self._precargadas.pop(expulsada, None)
+            self.stats["evictions"] += 1
+
+    def invalidar(self, key: Hashable = None):
+        self._datos.pop(key, None)
+        self._huellas.pop(key, None)
+
+    def limpiar(self):
+        self._datos.clear()
+        self._huellas.clear()
+
+    def huella(self, key: Hashable = None) -> Optional[str]:
+        return self._huellas.get(key)
+
+    def entradas(self) -> List[tuple[Hashable, Any, float]]:
+        """(llave, valor, edad en segundos) de cada valor guardado."""
+        ahora = time.monotonic()
+        return [(key, valor, ahora - guardado) for key, (valor, guardado) in self._datos.items()]
+
+    def antiguedad_respaldo(self, key: Hashable = None) -> Optional[float]:
+        """Edad (s) del valor si se sirve vencido porque la API falló; None si está al día."""
+        entrada = self._datos.get(key)
+        if key not in self._fallos or entrada is None:
+            return None
+        edad = time.monotonic() - entrada[1]
+        return edad if edad >= self.ttl else None
+
+    def resumen(self) -> dict:
+        return {"items": len(self._datos), **self.stats}
+
+
+carreras_cache = AsyncTTLCache("carreras", lambda _: fetch_carreras(), ttl=CACHE_TTL_CARRERAS, max_items=1)
+mallas_cache = AsyncTTLCache("mallas", fetch_malla, ttl=CACHE_TTL_MALLAS, max_items=512)
+# Los grupos cambian de capacidad: TTL corto y poco margen para servir datos viejos
+grupos_cache = AsyncTTLCache("grupos", fetch_grupos, ttl=CACHE_TTL_GRUPOS, stale_ttl=CACHE_TTL_GRUPOS, max_items=512)
+
+
+class VersionesCarreras:
+    """
+    Versión de cada carrera del catálogo, para que un cambio de precio en una
+    carrera no invalide las respuestas que solo usaron otras.
+
+    Cada catálogo nuevo se compara con el anterior carrera por carrera: las
+    agregadas y modificadas toman la generación actual y las quitadas salen.
+    `estructura` es la huella de los ids, nombres y tipos: si cambia, también
+    puede cambiar a qué carrera se resuelve un nombre.
+    """
+
+    def __init__(self):
+        self.generacion = 0
+        self._carreras: Dict[int, Any] = {}
+        self._versiones: Dict[int, int] = {}
+        self.estructura: Optional[str] = None
+        self.ultimo_cambio: Dict[str, List[int]] = {"agregadas": [], "quitadas": [], "modificadas": []}
+        self.stats = {"catalogos": 0, "carreras_modificadas": 0}
+
+    def actualizar(self, carreras: Carreras):
+        nuevas = carreras.data.por_id
+        anteriores = self._carreras
+        agregadas = [i for i in nuevas if i not in anteriores]
+        quitadas = [i for i in anteriores if i not in nuevas]
+        modificadas = [i for i, c in nuevas.items() if i in anteriores and anteriores[i] != c]
+
+        self.generacion += 1
+        for id_carrera in agregadas + modificadas:
+            self._versiones[id_carrera] = self.generacion
+        for id_carrera in quitadas:
+            del self._versiones[id_carrera]
+        self._carreras = nuevas
+        self.estructura = huella(tuple(
+            (tipo, c.id, c.nombre) for tipo in ("grado", "postgrado") for c in getattr(carreras.data, tipo)
+        ))
+        self.ultimo_cambio = {"agregadas": agregadas, "quitadas": quitadas, "modificadas": modificadas}
+        self.stats["catalogos"] += 1
+        self.stats["carreras_modificadas"] += len(modificadas)
+
+    def version(self, id_carrera: int) -> Optional[int]:
+        return self._versiones.get(id_carrera)
+
+    def resumen(self) -> dict:
+        return {
+            "generacion": self.generacion,
+            "carreras": len(self._versiones),
+            "ultimo_cambio": {k: len(v) for k, v in self.ultimo_cambio.items()},
+            **self.stats,
+        }
+
+
+versiones_carreras = VersionesCarreras()
+carreras_cache.al_cargar.append(lambda key, valor, h: versiones_carreras.actualizar(valor))
+
+
+async def get_carreras(acotado: bool = False) -> Carreras:
+    """
+    Con `acotado` el turno no depende del catálogo completo sino de qué carreras
+    existen; la herramienta registra con `depender_de_carreras` las que usa.
+    """
+    carreras = await carreras_cache.get(registrar=not acotado)
+    dependencias = _dependencias.get()
+    if acotado and dependencias is not None:
+        dependencias[("catalogo", "estructura")] = versiones_carreras.estructura
+    return carreras
+
+
+def depender_de_carreras(*ids: int):
+    """Registra que la respuesta del turno usa los datos (precios, modalidades...) de estas carreras."""
+    dependencias = _dependencias.get()
+    if dependencias is not None:
+        for id_carrera in ids:
+            dependencias[("carrera", id_carrera)] = versiones_carreras.version(id_carrera)
+
+
+async def get_malla(id_carrera: int) -> Malla:
+    return await mallas_cache.get(id_carrera)
+
+
+async def get_grupos(id_carrera: int) -> Grupos:
+    return await grupos_cache.get(id_carrera)
+
+
+CACHES = {c.nombre: c for c in (carreras_cache, mallas_cache, grupos_cache)}
+
+
+def cache_stats() -> dict:
+    return {nombre: c.resumen() for nombre, c in CACHES.items()}
+
+
+CACHE_ITEMS = registro.medidor("ube_cache_items", "Valores guardados en cada caché")
+CACHE_EVENTOS = registro.medidor("ube_cache_eventos", "Eventos acumulados de cada caché (hits, misses, refrescos...)")
+
+
+def _colectar_metricas():
+    for nombre, cache in CACHES.items():
+        CACHE_ITEMS.set(len(cache._datos), cache=nombre)
+        for evento, valor in cache.stats.items():
+            CACHE_EVENTOS.set(valor, cache=nombre, evento=evento)
+
+
+registro.colector(_colectar_metricas)
+
+
+@contextmanager
+def rastrear_dependencias():
+    """Registra qué datos (y en qué versión) se consultan dentro del bloque."""
+    dependencias: dict = {}
+    token = _dependencias.set(dependencias)
+    try:
+        yield dependencias
+    finally:
+        _dependencias.reset(token)
+
+
+def _formatear_edad(segundos: float) -> str:
+    if segundos < 3600:
+        return f"{max(1, round(segundos / 60))} min"
+    if segundos < 2 * 86400:
+        return f"{round(segundos / 3600)} h"
+    return f"{round(segundos / 86400)} días"
+
+
+def nota_respaldo(*consultas: tuple[str, Hashable]) -> str:
+    """
+    Aviso para agregar a la respuesta de una herramienta cuando alguno de los
+    datos consultados (cache, llave) se sirvió vencido por una falla de la API.
+    """
+    edades = [CACHES[nombre].antiguedad_respaldo(key) for nombre, key in consultas]
+    edades = [e for e in edades if e is not None]
+    if not edades:
+        return ""
+    return (f"\n\n(Aviso: el sistema de la UBE no responde en este momento; "
+            f"esta información es de hace {_formatear_edad(max(edades))} y podría haber cambiado.)")
+
+
+def marcar_no_cacheable():
+    """Indica que el turno actual no debe reutilizarse (p. ej. una matrícula)."""
+    dependencias = _dependencias.get()
+    if dependencias is not None:
+        dependencias[("no_cacheable", None)] = None
+
+
+def _version_actual(nombre: str, key: Hashable) -> Any:
+    if nombre == "carrera":
+        return versiones_carreras.version(key)
+    if nombre == "catalogo":
+        return versiones_carreras.estructura
+    return CACHES[nombre].huella(key)
+
+
+def dependencias_vigentes(dependencias: dict) -> bool:
+    """True si ninguno de los datos registrados cambió desde entonces."""
+    return all(
+        (nombre in CACHES or nombre in ("carrera", "catalogo")) and _version_actual(nombre, key) == h
+        for (nombre, key), h in dependencias.items()
+    )
@@ -0,0 +1,177 @@
+import re
+import hashlib
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app.schemas.carreras_schema import DataCarreras
+
+# Palabras que no aportan para identificar una carrera
+STOPWORDS = {
+    "a", "al", "como", "con", "cual", "cuales", "cuanto", "cuesta", "da", "dame",
+    "de", "del", "el", "en", "es", "esta", "este", "hay", "la", "las", "lo", "los",
+    "me", "mi", "muestra", "muestrame", "para", "por", "que", "quiero", "se", "sobre",
+    "su", "sus", "tiene", "tienen", "un", "una", "y", "o", "ver", "saber", "conocer",
+    "informacion", "info", "carrera", "carreras", "malla", "mallas", "curricular",
+    "grupo", "grupos", "cupos", "requisito", "requisitos", "matricula", "matricular",
+    "matricularme", "inscripcion", "precio", "precios", "asignaturas", "materias",
+    "estudiar", "programa",
+}
+
+# Abreviaturas frecuentes en los mensajes de los usuarios
+ALIAS = {
+    "psico": "psicologia",
+    "psicolo": "psicologia",
+    "fisio": "fisioterapia",
+    "enfer": "enfermeria",
+    "admin": "administracion",
+    "adm": "administracion",
+    "conta": "contabilidad",
+    "compu": "computacion",
+    "edu": "educacion",
+    "mkt": "marketing",
+    "rrhh": "talento humano",
+    "ti": "tecnologias informacion",
+    "tics": "tecnologias informacion",
+    "ing": "ingenieria",
+    "lic": "licenciatura",
+    "mgs": "maestria",
+    "msc": "maestria",
+    "mba": "maestria administracion empresas",
+}
+
+# Palabras (normalizadas) que indican el tipo de carrera en un filtro
+TIPOS_CARRERA = {
+    "postgrado": "postgrado", "posgrado": "postgrado", "maestria": "postgrado", "maestrias": "postgrado",
+    "magister": "postgrado", "especializacion": "postgrado", "doctorado": "postgrado",
+    "pregrado": "grado", "grado": "grado", "licenciatura": "grado",
+}
+
+# Umbrales de decisión del resolver
+CONFIANZA_MINIMA = 0.25
+CONFIANZA_ALTA = 0.75
+MARGEN_AMBIGUEDAD = 0.12
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y sin signos de puntuación."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9ñ]+", " ", texto).strip()
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Normaliza, expande alias y elimina stopwords."""
+    tokens = []
+    for token in normalizar(texto).split():
+        token = ALIAS.get(token, token)
+        tokens.extend(t for t in token.split() if t not in STOPWORDS)
+    return tokens
+
+
+def tipo_carrera(texto: str) -> Optional[str]:
+    """"grado" o "postgrado" según el texto ("posgrado", "maestría", "MSc"...); None si no lo indica."""
+    for palabra in normalizar(texto).split():
+        for token in ALIAS.get(palabra, palabra).split():
+            if token in TIPOS_CARRERA:
+                return TIPOS_CARRERA[token]
+    return None
+
+
+def trigramas(texto: str) -> set:
+    texto = f"  {texto} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def huella_catalogo(carreras: DataCarreras) -> str:
+    """Hash de ids y nombres; cambia solo si cambia algo relevante para el resolver."""
+    h = hashlib.blake2b(digest_size=16)
+    for carrera in carreras.grado + carreras.postgrado:
+        h.update(f"{carrera.id}\x1f{carrera.nombre}\x1e".encode())
+    return h.hexdigest()
+
+
+@dataclass(frozen=True)
+class Resolucion:
+    id: int
+    nombre: str
+    confianza: float
+
+
+class CarrerasResolver:
+    """
+    Índice local para resolver el nombre de una carrera a su ID sin llamar al LLM.
+    Combina similitud de trigramas (errores de tipeo) con cobertura de tokens.
+    """
+
+    def __init__(self, carreras: DataCarreras):
+        self.huella = huella_catalogo(carreras)
+        self.nombres: Dict[int, str] = {}
+        self._tokens: Dict[int, set] = {}
+        self._trigramas: Dict[int, set] = {}
+        self._indice: Dict[str, List[int]] = defaultdict(list)
+
+        for carrera in carreras.grado + carreras.postgrado:
+            tokens = tokenizar(carrera.nombre)
+            texto = " ".join(tokens)
+            grams = trigramas(texto)
+            self.nombres[carrera.id] = carrera.nombre
+            self._tokens[carrera.id] = set(tokens)
+            self._trigramas[carrera.id] = grams
+            for gram in grams:
+                self._indice[gram].append(carrera.id)
+
+    def candidatos(self, mensaje: str, limite: int = 5) -> List[Resolucion]:
+        tokens = tokenizar(mensaje)
+        if not tokens:
+            return []
+
+        grams = trigramas(" ".join(tokens))
+        comunes: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for id_carrera in self._indice.get(gram, ()):
+                comunes[id_carrera] += 1
+
+        consulta = set(tokens)
+        puntajes: List[Tuple[float, int]] = []
+        for id_carrera, n in comunes.items():
+            dice = 2 * n / (len(grams) + len(self._trigramas[id_carrera]))
+            cobertura = len(consulta & self._tokens[id_carrera]) / len(consulta)
+            puntajes.append((0.6 * dice + 0.4 * cobertura, id_carrera))
+
+        puntajes.sort(reverse=True)
+        return [
+            Resolucion(id=id_carrera, nombre=self.nombres[id_carrera], confianza=round(score, 3))
+            for score, id_carrera in puntajes[:limite]
+        ]
+
+    def resolver(self, mensaje: str) -> Tuple[Optional[Resolucion], List[Resolucion]]:
+        """
+        Retorna (resolución, candidatos).
+        La resolución es None si no hay una coincidencia clara; en ese caso
+        los candidatos son los que deben desempatarse (p. ej. con el LLM).
+        """
+        candidatos = self.candidatos(mensaje)
+        if not candidatos or candidatos[0].confianza < CONFIANZA_MINIMA:
+            return None, []
+
+        mejor = candidatos[0]
+        segundo = candidatos[1].confianza if len(candidatos) > 1 else 0.0
+        if mejor.confianza >= CONFIANZA_ALTA or mejor.confianza - segundo >= MARGEN_AMBIGUEDAD:
+            return mejor, candidatos
+        return None, candidatos
+
+
+_resolver: Optional[CarrerasResolver] = None
+_catalogo: Optional[DataCarreras] = None
+
+
+def get_resolver(carreras: DataCarreras) -> CarrerasResolver:
+    """Retorna el índice del catálogo, reconstruyéndolo solo si el catálogo cambió."""
+    global _resolver, _catalogo
+    if carreras is not _catalogo:
+        if _resolver is None or _resolver.huella != huella_catalogo(carreras):
+            _resolver = CarrerasResolver(carreras)
+        _catalogo = carreras
+    return _resolver
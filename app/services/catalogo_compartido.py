@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import ormsgpack
+
+from app.config import CATALOGO_COMPARTIDO_INTERVALO, CATALOGO_COMPARTIDO_PATH, CATALOGO_COMPARTIDO_SONDEO
+from app.metrics import registro
+from app.services.cache import CACHES, AsyncTTLCache
+from app.services.snapshot import MODELOS, REFRESCOS_CONCURRENTES
+
+logger = logging.getLogger(__name__)
+
+MAGIA = b"UBECAT01"
+# Encabezado del archivo: magia, generación y largo del índice (msgpack)
+ENCABEZADO = struct.Struct("<8sQI")
+# Archivo `<path>.gen`: la generación publicada, que los workers leen mapeada en memoria
+CONTADOR = struct.Struct("<Q")
+
+CATALOGO_GENERACION = registro.medidor(
+    "ube_catalogo_generacion", "Generación del catálogo compartido vista por este proceso"
+)
+
+
+class CatalogoCompartido:
+    """
+    Carreras, mallas y grupos compartidos entre los workers de uvicorn.
+
+    Un solo proceso, el refrescador (`python -m app.refrescador`), consulta la API y
+    `publicar()` escribe el archivo: encabezado, índice y el JSON de cada valor. Los
+    workers lo mapean con mmap, así el sistema operativo guarda una sola copia para
+    todos, y decodifican directo desde esos bytes solo las entradas que usan.
+
+    El reemplazo es atómico (`os.replace`) y después se avanza un contador de
+    generación en `<path>.gen`; cada worker lo revisa cada `sondeo` segundos y, si
+    cambió, vuelve a mapear el archivo y actualiza solo las entradas cuya huella cambió.
+    """
+
+    def __init__(self, path: str = CATALOGO_COMPARTIDO_PATH, intervalo: float = CATALOGO_COMPARTIDO_INTERVALO,
+                 sondeo: float = CATALOGO_COMPARTIDO_SONDEO):
+        self.path = path
+        self.intervalo = intervalo
+        self.sondeo = sondeo
+        self.generacion = 0
+        self.creado: Optional[float] = None
+        self._mapa: Optional[mmap.mmap] = None
+        self._contador: Optional[mmap.mmap] = None
+        # nombre de la caché -> llave -> (offset, largo, guardado, huella)
+        self._indice: Dict[str, Dict[Hashable, tuple]] = {}
+        # Refrescador: JSON ya serializado por huella, para no volver a serializar lo que no cambió
+        self._serializados: Dict[str, bytes] = {}
+        self.stats = {"publicaciones": 0, "generaciones": 0, "lecturas": 0, "sincronizadas": 0, "a_la_api": 0}
+
+    # --- Generación ---
+
+    def _abrir_contador(self, crear: bool = False) -> Optional[mmap.mmap]:
+        if self._contador is None:
+            ruta = f"{self.path}.gen"
+            if not os.path.exists(ruta):
+                if not crear:
+                    return None
+                with open(ruta, "wb") as f:
+                    f.write(CONTADOR.pack(0))
+            with open(ruta, "r+b") as f:
+                self._contador = mmap.mmap(f.fileno(), CONTADOR.size)
+        return self._contador
+
+    def generacion_publicada(self) -> int:
+        contador = self._abrir_contador()
+        return CONTADOR.unpack_from(contador)[0] if contador is not None else 0
+
+    # --- Refrescador ---
+
+    def publicar(self) -> int:
+        """Escribe el contenido de las cachés y avanza la generación; retorna la nueva generación."""
+        if not CACHES["carreras"].entradas():
+            # Sin catálogo no hay nada útil que publicar: se conserva la generación anterior
+            return self.generacion
+        ahora = time.time()
+        indice, partes, offset = {}, [], 0
+        serializados = {}
+        for nombre in MODELOS:
+            cache = CACHES[nombre]
+            filas = []
+            for key, valor, edad in cache.entradas():
+                h = cache.huella(key)
+                datos = self._serializados.get(h) or valor.model_dump_json().encode()
+                serializados[h] = datos
+                filas.append([key, offset, len(datos), ahora - edad, h])
+                partes.append(datos)
+                offset += len(datos)
+            indice[nombre] = filas
+        self._serializados = serializados
+
+        generacion = self.generacion_publicada() + 1
+        datos_indice = ormsgpack.packb({"creado": ahora, "caches": indice})
+        temporal = f"{self.path}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(ENCABEZADO.pack(MAGIA, generacion, len(datos_indice)))
+            f.write(datos_indice)
+            f.writelines(partes)
+        os.replace(temporal, self.path)
+        # Recién con el archivo en su lugar se avisa a los workers
+        self._abrir_contador(crear=True)[:CONTADOR.size] = CONTADOR.pack(generacion)
+
+        self.generacion, self.creado = generacion, ahora
+        self.stats["publicaciones"] += 1
+        CATALOGO_GENERACION.set(generacion)
+        return generacion
+
+    async def refrescar(self):
+        """Trae de la API lo que está por vencer (y las carreras nuevas del catálogo) y publica."""
+        carreras = CACHES["carreras"]
+        if self._por_vencer(carreras, [None]):
+            await carreras.refrescar()
+        catalogo = await carreras.get()
+        ids = list(catalogo.data.por_id)
+        if not self.generacion:
+            # Primera publicación solo con el catálogo: los workers arrancan sin esperar todas las mallas
+            self.publicar()
+
+        semaforo = asyncio.Semaphore(REFRESCOS_CONCURRENTES)
+
+        async def refrescar_llave(cache: AsyncTTLCache, key: Hashable):
+            async with semaforo:
+                try:
+                    await cache.refrescar(key)
+                except Exception as e:
+                    # Se publica el valor anterior; los workers lo usan si la API tampoco les responde
+                    logger.warning(f"No se pudo refrescar {cache.nombre}[{key}]: {e}")
+
+        tareas = []
+        for nombre in ("mallas", "grupos"):
+            cache = CACHES[nombre]
+            # El refrescador guarda el catálogo completo, no solo lo más consultado
+            cache.max_items = max(cache.max_items, len(ids))
+            tareas += [refrescar_llave(cache, key) for key in self._por_vencer(cache, ids)]
+        await asyncio.gather(*tareas)
+        self.publicar()
+
+    @staticmethod
+    def _por_vencer(cache: AsyncTTLCache, llaves: list) -> list:
+        # A mitad del TTL: lo publicado nunca llega vencido a los workers
+        edades = {key: edad for key, _, edad in cache.entradas()}
+        return [key for key in llaves if edades.get(key, math.inf) >= cache.ttl / 2]
+
+    def restaurar(self) -> int:
+        """Carga en las cachés la última versión publicada (arranque del refrescador con la API caída)."""
+        if not self.abrir():
+            return 0
+        restauradas = 0
+        for nombre, entradas in self._indice.items():
+            for key in entradas:
+                valor, edad = self.leer(nombre, key)
+                CACHES[nombre].set(key, valor, edad=edad)
+                restauradas += 1
+        return restauradas
+
+    async def ejecutar(self):
+        """Tarea del refrescador: refresca y publica cada `intervalo` segundos."""
+        while True:
+            try:
+                await self.refrescar()
+            except Exception as e:
+                logger.warning(f"Error refrescando el catálogo compartido: {e}")
+            await asyncio.sleep(self.intervalo)
+
+    # --- Workers ---
+
+    def abrir(self) -> bool:
+        """Mapea la última versión publicada si la generación cambió; True si se abrió una nueva."""
+        if self.generacion_publicada() == self.generacion or not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magia, generacion, largo = ENCABEZADO.unpack_from(mapa)
+        if magia != MAGIA or generacion == self.generacion:
+            if magia != MAGIA:
+                logger.warning(f"{self.path} no es un catálogo compartido; se ignora")
+            mapa.close()
+            return False
+
+        datos = ormsgpack.unpackb(mapa[ENCABEZADO.size:ENCABEZADO.size + largo])
+        base = ENCABEZADO.size + largo
+        self._indice = {
+            nombre: {key: (base + offset, n, guardado, h) for key, offset, n, guardado, h in filas}
+            for nombre, filas in datos["caches"].items()
+        }
+        # Las lecturas son síncronas en el event loop: nadie usa el mapa anterior al cerrarlo
+        anterior, self._mapa = self._mapa, mapa
+        if anterior is not None:
+            anterior.close()
+        self.generacion, self.creado = generacion, datos["creado"]
+        self.stats["generaciones"] += 1
+        CATALOGO_GENERACION.set(generacion)
+        return True
+
+    def leer(self, nombre: str, key: Hashable = None) -> Optional[Tuple[Any, float]]:
+        """(valor, edad en segundos) publicado para `key`, o None si no está en el archivo."""
+        entrada = self._indice.get(nombre, {}).get(key)
+        if entrada is None or self._mapa is None:
+            return None
+        offset, largo, guardado, _ = entrada
+        self.stats["lecturas"] += 1
+        return MODELOS[nombre].model_validate_json(self._mapa[offset:offset + largo]), max(0.0, time.time() - guardado)
+
+    def _loader(self, cache: AsyncTTLCache, api: Callable) -> Callable:
+        async def loader(key: Hashable = None):
+            publicado = self.leer(cache.nombre, key)
+            if publicado is not None and publicado[1] < cache.ttl:
+                return publicado[0]
+            # Dato nuevo o refrescador atrasado: este worker va a la API
+            self.stats["a_la_api"] += 1
+            try:
+                return await api(key)
+            except Exception:
+                if publicado is None:
+                    raise
+                return publicado[0]
+        return loader
+
+    def conectar(self):
+        """Worker: las cachés leen primero del archivo compartido; la API queda como respaldo."""
+        for cache in CACHES.values():
+            cache.loader = self._loader(cache, cache.loader)
+        if self.abrir():
+            # El catálogo se usa en casi todos los mensajes: se carga ya (y con él sus índices)
+            publicado = self.leer("carreras")
+            if publicado is not None:
+                CACHES["carreras"].set(None, publicado[0], edad=publicado[1])
+
+    def sincronizar(self) -> int:
+        """Reemplaza en las cachés del worker los valores cuya huella cambió en la nueva generación."""
+        sincronizadas = 0
+        for nombre, entradas in self._indice.items():
+            cache = CACHES[nombre]
+            for key, _, _ in cache.entradas():
+                entrada = entradas.get(key)
+                if entrada is not None and entrada[3] != cache.huella(key):
+                    valor, edad = self.leer(nombre, key)
+                    cache.set(key, valor, edad=edad)
+                    sincronizadas += 1
+        self.stats["sincronizadas"] += sincronizadas
+        return sincronizadas
+
+    async def sondear(self):
+        """Tarea de cada worker: detecta generaciones nuevas y sincroniza sus cachés."""
+        while True:
+            await asyncio.sleep(self.sondeo)
+            try:
+                if self.abrir():
+                    self.sincronizar()
+            except Exception as e:
+                logger.warning(f"Error leyendo el catálogo compartido: {e}")
+
+    def resumen(self) -> dict:
+        return {
+            "path": self.path,
+            "generacion": self.generacion,
+            "edad_s": round(time.time() - self.creado, 1) if self.creado else None,
+            "entradas": {nombre: len(entradas) for nombre, entradas in self._indice.items()},
+            "mapeado_kb": round(len(self._mapa) / 1024, 1) if self._mapa is not None else 0,
+            **self.stats,
+        }
+
+
+catalogo_compartido = CatalogoCompartido()
@@ -0,0 +1,133 @@
+import time
+from typing import AsyncIterator, Optional, Tuple
+
+from app.agents.ventas import get_agent, guardar_sesion
+from app.agents.render import recolectar_sugerencias
+from app.agents.router import router_intenciones
+from app.metrics import desglose, metricas_callback, registrar_turno
+from app.services.cache import rastrear_dependencias
+from app.services.concurrencia import limitador_llm, presupuesto_herramientas, turnos_usuario
+from app.services.precarga import precargador
+from app.services.respuestas_cache import respuestas_cache
+
+# Callbacks por turno: heredados por las llamadas al LLM y las herramientas del agente
+CONFIG_AGENTE = {"callbacks": [metricas_callback]}
+
+
+def _tiene_historial(memoria) -> bool:
+    """True si la sesión ya tiene turnos (en la ventana, pendientes de resumir o resumidos)."""
+    return bool(memoria.chat_memory.messages or getattr(memoria, "pendientes", None) or getattr(memoria, "resumen", ""))
+
+
+async def _respuesta_rapida(user_id: str, query: str, memoria) -> Optional[dict]:
+    """
+    Intenta responder sin el agente: primero la caché de respuestas y luego el
+    router de intenciones. Retorna None si el mensaje debe ir al agente.
+    """
+    # Con turnos previos, una pregunta que no nombra la carrera depende de la conversación
+    con_historial = _tiene_historial(memoria)
+    cacheada = respuestas_cache.buscar(query, con_historial=con_historial)
+    if cacheada is not None:
+        resultado = {"respuesta": cacheada.respuesta, "origen": "cache",
+                     "preguntas_sugeridas": cacheada.preguntas_sugeridas}
+    else:
+        with recolectar_sugerencias() as preguntas:
+            respuesta = await router_intenciones.responder(query, con_historial=con_historial)
+        if respuesta is None:
+            return None
+        resultado = {"respuesta": respuesta, "origen": "router", "preguntas_sugeridas": preguntas}
+
+    # El intercambio queda en la memoria como si lo hubiera respondido el agente
+    await memoria.asave_context({"input": query}, {"output": resultado["respuesta"]})
+    await guardar_sesion(user_id)
+    return resultado
+
+
+async def responder(user_id: str, query: str, debug: bool = False) -> dict:
+    """
+    Responde un turno: caché de respuestas, router de intenciones y, si no, el agente.
+    Con `debug` agrega el desglose de tiempos y tokens del turno en `tiempos`.
+
+    Los turnos de un mismo usuario se procesan en orden (ver `TurnosPorUsuario`).
+    Lanza `SaturacionLLM` si el turno necesita el LLM y la cola está llena.
+    """
+    async def turno(mensaje: str) -> dict:
+        with desglose() as datos, precargador.conversacion(user_id):
+            resultado = await _responder(user_id, mensaje)
+        registrar_turno(user_id, resultado["origen"], datos)
+        if debug:
+            resultado["tiempos"] = datos
+        return resultado
+
+    return await turnos_usuario.ejecutar(user_id, query, turno)
+
+
+async def _responder(user_id: str, query: str) -> dict:
+    agent_executor = await get_agent(user_id)
+
+    resultado = await _respuesta_rapida(user_id, query, agent_executor.memory)
+    if resultado is not None:
+        return resultado
+
+    con_historial = _tiene_historial(agent_executor.memory)
+    inicio = time.perf_counter()
+    async with limitador_llm.permiso():
+        with rastrear_dependencias() as dependencias, recolectar_sugerencias() as preguntas, \
+                presupuesto_herramientas():
+            response = await agent_executor.ainvoke({"input": query}, CONFIG_AGENTE)
+    await guardar_sesion(user_id)
+
+    respuestas_cache.guardar(query, response["output"], dependencias, time.perf_counter() - inicio, preguntas,
+                             con_historial=con_historial)
+    return {"respuesta": response["output"], "origen": "agente", "preguntas_sugeridas": preguntas}
+
+
+async def responder_stream(user_id: str, query: str) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Igual que `responder`, pero produce eventos a medida que el agente avanza:
+    `tool_start` / `tool_end` por cada herramienta, `token` por cada fragmento
+    de la respuesta final y `fin` con la respuesta completa.
+
+    Se serializa con los demás turnos del usuario, pero nunca se fusiona.
+    """
+    async with turnos_usuario.turno(user_id):
+        with desglose() as datos, precargador.conversacion(user_id):
+            async for evento, contenido in _responder_stream(user_id, query):
+                if evento != "fin":
+                    yield evento, contenido
+        registrar_turno(user_id, contenido["origen"], datos)
+    yield "fin", contenido
+
+
+async def _responder_stream(user_id: str, query: str) -> AsyncIterator[Tuple[str, dict]]:
+    agent_executor = await get_agent(user_id)
+
+    resultado = await _respuesta_rapida(user_id, query, agent_executor.memory)
+    if resultado is not None:
+        yield "fin", resultado
+        return
+
+    con_historial = _tiene_historial(agent_executor.memory)
+    inicio = time.perf_counter()
+    respuesta = ""
+    async with limitador_llm.permiso():
+        with rastrear_dependencias() as dependencias, recolectar_sugerencias() as preguntas, \
+                presupuesto_herramientas():
+            async for evento in agent_executor.astream_events({"input": query}, CONFIG_AGENTE, version="v2"):
+                tipo = evento["event"]
+                if tipo == "on_tool_start":
+                    yield "tool_start", {"tool": evento["name"], "input": evento["data"].get("input")}
+                elif tipo == "on_tool_end":
+                    yield "tool_end", {"tool": evento["name"]}
+                elif tipo == "on_chat_model_stream":
+                    # Los pasos de function calling llegan sin contenido
+                    texto = evento["data"]["chunk"].content
+                    if texto and isinstance(texto, str):
+                        yield "token", {"texto": texto}
+                elif tipo == "on_chain_end" and not evento.get("parent_ids"):
+                    respuesta = evento["data"]["output"]["output"]
+
+    await guardar_sesion(user_id)
+    respuestas_cache.guardar(query, respuesta, dependencias, time.perf_counter() - inicio, preguntas,
+                             con_historial=con_historial)
+    yield "fin", {"respuesta": respuesta, "origen": "agente", "preguntas_sugeridas": preguntas}
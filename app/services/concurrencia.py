@@ -0,0 +1,288 @@
+import asyncio
+import functools
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncContextManager, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import (CHAT_FUSIONAR_MENSAJES, HERRAMIENTAS_MAX_TIEMPO, LLM_MAX_COLA, LLM_MAX_EN_VUELO,
+                        LLM_MAX_ESPERA)
+from app.metrics import registro
+from app.services.cache import marcar_no_cacheable
+
+LLM_COLA = registro.medidor("ube_llm_cola", "Turnos esperando un cupo para usar el LLM")
+LLM_EN_VUELO = registro.medidor("ube_llm_en_vuelo", "Turnos del agente usando el LLM")
+LLM_ESPERA = registro.histograma("ube_llm_espera_segundos", "Tiempo en cola antes de obtener un cupo del LLM")
+LLM_RECHAZOS = registro.contador("ube_llm_rechazos_total", "Turnos rechazados por saturación del LLM")
+USUARIOS_EN_COLA = registro.medidor("ube_usuarios_mensajes_en_espera", "Mensajes esperando el turno anterior del mismo usuario")
+MENSAJES_FUSIONADOS = registro.contador("ube_mensajes_fusionados_total", "Mensajes respondidos dentro del turno de otro mensaje")
+HERRAMIENTAS_CORTADAS = registro.contador(
+    "ube_tool_cortadas_total", "Herramientas cortadas o no ejecutadas por agotar el tiempo de herramientas del turno"
+)
+
+# Lo que ve el agente cuando una herramienta se corta por tiempo
+AVISO_SIN_TIEMPO = ("No se pudo obtener esta información a tiempo. Responde con lo que ya tienes y ofrece "
+                    "al usuario volver a consultar en unos minutos o contactar directamente a la UBE.")
+
+
+class SaturacionLLM(Exception):
+    """La cola del LLM está llena (o la espera fue excesiva): el cliente debe reintentar."""
+
+    def __init__(self, retry_after: int, motivo: str):
+        super().__init__(f"Servicio saturado ({motivo}), reintenta en {retry_after} s")
+        self.retry_after = retry_after
+        self.motivo = motivo
+
+
+class LimitadorLLM:
+    """
+    Limita los turnos del agente que usan el LLM al mismo tiempo.
+
+    Cada turno hace sus llamadas al LLM en secuencia, así que acotar los turnos
+    acota las llamadas en vuelo. Con la cola llena se rechaza de inmediato en
+    vez de acumular peticiones que terminarían por timeout.
+    """
+
+    def __init__(self, max_en_vuelo: int = LLM_MAX_EN_VUELO, max_cola: int = LLM_MAX_COLA,
+                 max_espera: float = LLM_MAX_ESPERA):
+        self.max_en_vuelo = max_en_vuelo
+        self.max_cola = max_cola
+        self.max_espera = max_espera
+        self._semaforo = asyncio.Semaphore(max_en_vuelo)
+        self.en_vuelo = 0
+        self.esperando = 0
+        # Promedio móvil de la duración de un turno, para estimar Retry-After
+        self.duracion_promedio = 5.0
+        self.stats = {"admitidos": 0, "rechazos_cola": 0, "rechazos_espera": 0}
+
+    def lleno(self) -> bool:
+        return self.en_vuelo + self.esperando >= self.max_en_vuelo + self.max_cola
+
+    def retry_after(self) -> int:
+        turnos_delante = self.esperando + 1
+        return max(1, math.ceil(self.duracion_promedio * turnos_delante / self.max_en_vuelo))
+
+    def _rechazar(self, motivo: str):
+        self.stats[f"rechazos_{motivo}"] += 1
+        LLM_RECHAZOS.inc(motivo=motivo)
+        raise SaturacionLLM(self.retry_after(), motivo)
+
+    def verificar(self):
+        """Lanza `SaturacionLLM` si un turno nuevo sería rechazado ahora."""
+        if self.lleno():
+            self._rechazar("cola")
+
+    @asynccontextmanager
+    async def permiso(self):
+        self.verificar()
+
+        inicio = time.perf_counter()
+        self.esperando += 1
+        LLM_COLA.set(self.esperando)
+        try:
+            # No con wait_for: en 3.11, si el plazo vence justo cuando acquire() termina, el cupo
+            # queda tomado sin que nadie lo libere. Cancelado desde adentro, acquire() lo devuelve
+            async with asyncio.timeout(self.max_espera):
+                await self._semaforo.acquire()
+        except TimeoutError:
+            self._rechazar("espera")
+        finally:
+            self.esperando -= 1
+            LLM_COLA.set(self.esperando)
+        LLM_ESPERA.observar(time.perf_counter() - inicio)
+
+        self.stats["admitidos"] += 1
+        self.en_vuelo += 1
+        LLM_EN_VUELO.set(self.en_vuelo)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.duracion_promedio = 0.8 * self.duracion_promedio + 0.2 * (time.perf_counter() - inicio)
+            self.en_vuelo -= 1
+            LLM_EN_VUELO.set(self.en_vuelo)
+            self._semaforo.release()
+
+    def resumen(self) -> dict:
+        return {
+            "en_vuelo": self.en_vuelo,
+            "esperando": self.esperando,
+            "max_en_vuelo": self.max_en_vuelo,
+            "max_cola": self.max_cola,
+            "duracion_promedio_s": round(self.duracion_promedio, 3),
+            **self.stats,
+        }
+
+
+@dataclass
+class _EstadoUsuario:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    pendientes: List[Tuple[str, asyncio.Future]] = field(default_factory=list)
+    referencias: int = 0
+
+
+class TurnosPorUsuario:
+    """
+    Procesa los mensajes de cada usuario de a uno, en orden de llegada, para que
+    dos turnos no lean y escriban la misma memoria a la vez.
+
+    Con `fusionar`, los mensajes que llegan mientras un turno está en curso se
+    responden juntos en el siguiente turno (un solo recorrido del agente) y
+    todos reciben la misma respuesta.
+
+    El orden es por proceso; `bloqueo_externo` (user_id -> context manager async)
+    extiende la exclusión a los demás workers, p. ej. con `SessionStore.bloqueo`.
+    """
+
+    def __init__(self, fusionar: bool = CHAT_FUSIONAR_MENSAJES,
+                 bloqueo_externo: Callable[[str], AsyncContextManager] = None):
+        self.fusionar = fusionar
+        self.bloqueo_externo = bloqueo_externo
+        self._estados: Dict[str, _EstadoUsuario] = {}
+        self.stats = {"turnos": 0, "fusionados": 0}
+
+    @asynccontextmanager
+    async def _estado(self, user_id: str):
+        estado = self._estados.get(user_id)
+        if estado is None:
+            estado = self._estados[user_id] = _EstadoUsuario()
+        estado.referencias += 1
+        try:
+            yield estado
+        finally:
+            estado.referencias -= 1
+            if estado.referencias == 0:
+                del self._estados[user_id]
+
+    @asynccontextmanager
+    async def turno(self, user_id: str, contar: bool = True):
+        """
+        Serializa el bloque con los demás turnos del usuario (sin fusionar). Con
+        `contar=False` no cuenta como turno (p. ej. la consolidación de su memoria).
+        """
+        async with self._estado(user_id) as estado:
+            USUARIOS_EN_COLA.inc()
+            try:
+                await estado.lock.acquire()
+            finally:
+                USUARIOS_EN_COLA.dec()
+            try:
+                self.stats["turnos"] += contar
+                if self.bloqueo_externo is None:
+                    yield
+                else:
+                    async with self.bloqueo_externo(user_id):
+                        yield
+            finally:
+                estado.lock.release()
+
+    async def ejecutar(self, user_id: str, mensaje: str, funcion: Callable[[str], Awaitable[dict]]) -> dict:
+        if not self.fusionar:
+            async with self.turno(user_id):
+                return await funcion(mensaje)
+
+        async with self._estado(user_id) as estado:
+            futuro = asyncio.get_running_loop().create_future()
+            estado.pendientes.append((mensaje, futuro))
+            try:
+                return await self._turno_fusionado(user_id, estado, futuro, funcion)
+            except BaseException:
+                # Si el cliente se fue antes de su turno, su mensaje no se responde
+                estado.pendientes = [(m, f) for m, f in estado.pendientes if f is not futuro]
+                raise
+
+    async def _turno_fusionado(self, user_id: str, estado: _EstadoUsuario, futuro: asyncio.Future,
+                               funcion: Callable[[str], Awaitable[dict]]) -> dict:
+        async with self.turno(user_id):
+            if futuro.done():
+                # Otro turno ya respondió este mensaje junto con el suyo
+                return futuro.result()
+
+            lote, estado.pendientes = estado.pendientes, []
+            try:
+                resultado = await funcion("\n".join(m for m, _ in lote))
+            except BaseException:
+                # Los demás mensajes vuelven a la cola y se responden en su propio turno
+                estado.pendientes[:0] = [(m, f) for m, f in lote if f is not futuro]
+                raise
+
+            for _, f in lote:
+                if f is not futuro and not f.done():
+                    f.set_result(resultado)
+            if len(lote) > 1:
+                self.stats["fusionados"] += len(lote) - 1
+                MENSAJES_FUSIONADOS.inc(len(lote) - 1)
+            return resultado
+
+    def resumen(self) -> dict:
+        return {"usuarios_activos": len(self._estados), "fusionar": self.fusionar, **self.stats}
+
+
+class PresupuestoHerramientas:
+    """
+    Tiempo de reloj con al menos una herramienta en curso durante un turno. Las
+    herramientas que corren en paralelo consumen el presupuesto una sola vez.
+    """
+
+    def __init__(self, limite: float):
+        self.limite = limite
+        self.usado = 0.0
+        self.en_curso = 0
+        self._desde = 0.0
+
+    def restante(self) -> float:
+        en_curso = time.perf_counter() - self._desde if self.en_curso else 0.0
+        return self.limite - self.usado - en_curso
+
+    @contextmanager
+    def usar(self):
+        if self.en_curso == 0:
+            self._desde = time.perf_counter()
+        self.en_curso += 1
+        try:
+            yield
+        finally:
+            self.en_curso -= 1
+            if self.en_curso == 0:
+                self.usado += time.perf_counter() - self._desde
+
+
+_presupuesto: ContextVar[Optional[PresupuestoHerramientas]] = ContextVar("presupuesto_herramientas", default=None)
+
+
+@contextmanager
+def presupuesto_herramientas(limite: float = HERRAMIENTAS_MAX_TIEMPO):
+    """Acota el tiempo de herramientas de las llamadas a `limitar_tiempo` dentro del bloque (un turno)."""
+    token = _presupuesto.set(PresupuestoHerramientas(limite))
+    try:
+        yield
+    finally:
+        _presupuesto.reset(token)
+
+
+def limitar_tiempo(funcion):
+    """Corta la herramienta (y avisa al agente) si se agota el tiempo de herramientas del turno."""
+    @functools.wraps(funcion)
+    async def envoltura(*args, **kwargs):
+        presupuesto = _presupuesto.get()
+        if presupuesto is None:
+            return await funcion(*args, **kwargs)
+        restante = presupuesto.restante()
+        if restante > 0:
+            with presupuesto.usar():
+                try:
+                    return await asyncio.wait_for(funcion(*args, **kwargs), timeout=restante)
+                except asyncio.TimeoutError:
+                    pass
+        HERRAMIENTAS_CORTADAS.inc(tool=funcion.__name__)
+        # Una respuesta sin los datos no debe quedar en la caché de respuestas
+        marcar_no_cacheable()
+        return AVISO_SIN_TIEMPO
+
+    return envoltura
+
+
+limitador_llm = LimitadorLLM()
+turnos_usuario = TurnosPorUsuario()
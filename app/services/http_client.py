@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import random
+from typing import Optional
+
+import httpx
+
+from app.config import API_URL, UBE_MAX_CONEXIONES, UBE_REINTENTOS
+from app.metrics import FETCH_DURACION, FETCH_ERRORES, medir
+
+logger = logging.getLogger(__name__)
+
+# Timeouts (segundos) por endpoint de la API de la UBE
+TIMEOUTS = {
+    "carreras": httpx.Timeout(15.0, connect=5.0),
+    "malla": httpx.Timeout(10.0, connect=5.0),
+    "grupos": httpx.Timeout(5.0, connect=3.0),
+    "matricular": httpx.Timeout(20.0, connect=5.0),
+}
+TIMEOUT_DEFAULT = httpx.Timeout(10.0, connect=5.0)
+
+# Errores que vale la pena reintentar
+STATUS_REINTENTABLES = {429, 502, 503, 504}
+
+
+class UBEClient:
+    """
+    Cliente asíncrono compartido para la API de la UBE.
+    Reutiliza conexiones (keep-alive), limita las conexiones concurrentes
+    y reintenta las lecturas con backoff exponencial y jitter.
+    """
+
+    def __init__(self, base_url: str = API_URL, max_conexiones: int = UBE_MAX_CONEXIONES,
+                 reintentos: int = UBE_REINTENTOS):
+        self.base_url = base_url
+        self.max_conexiones = max_conexiones
+        self.reintentos = reintentos
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def iniciar(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=TIMEOUT_DEFAULT,
+                limits=httpx.Limits(
+                    max_connections=self.max_conexiones,
+                    max_keepalive_connections=self.max_conexiones,
+                    keepalive_expiry=30.0,
+                ),
+            )
+
+    async def cerrar(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        # Permite usar el cliente fuera de FastAPI (scripts, pruebas)
+        if self._client is None:
+            await self.iniciar()
+        return self._client
+
+    async def request(self, method: str, endpoint: str, path: str = "", **kwargs) -> httpx.Response:
+        """
+        Ejecuta una petición contra `endpoint` (carreras, malla, grupos, matricular).
+        Solo los GET se reintentan; un POST podría duplicar la operación.
+        """
+        client = await self._get_client()
+        with medir(FETCH_DURACION, "fetch", FETCH_ERRORES, endpoint=endpoint):
+            return await self._request(client, method, endpoint, path, **kwargs)
+
+    async def _request(self, client: httpx.AsyncClient, method: str, endpoint: str, path: str,
+                       **kwargs) -> httpx.Response:
+        url = f"{endpoint}/{path}" if path else endpoint
+        timeout = TIMEOUTS.get(endpoint, TIMEOUT_DEFAULT)
+        intentos = self.reintentos + 1 if method == "GET" else 1
+
+        for intento in range(intentos):
+            try:
+                response = await client.request(method, url, timeout=timeout, **kwargs)
+                if response.status_code not in STATUS_REINTENTABLES or intento == intentos - 1:
+                    # 304: respuesta a un GET condicional, el llamador conserva su versión
+                    if response.status_code != 304:
+                        response.raise_for_status()
+                    return response
+            except httpx.TransportError as e:
+                if intento == intentos - 1:
+                    raise
+                logger.warning(f"Error de red en {url} (intento {intento + 1}): {e}")
+
+            # Backoff exponencial con jitter completo
+            await asyncio.sleep(random.uniform(0, 0.25 * 2 ** intento))
+
+    async def get(self, endpoint: str, path: str = "", **kwargs) -> httpx.Response:
+        return await self.request("GET", endpoint, path, **kwargs)
+
+    async def post(self, endpoint: str, path: str = "", **kwargs) -> httpx.Response:
+        return await self.request("POST", endpoint, path, **kwargs)
+
+
+ube_client = UBEClient()
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterable, Optional, Tuple
+
+from app.config import LOTE_CONCURRENCIA, LOTE_REINTENTOS, LOTE_TIMEOUT
+from app.metrics import registro
+from app.schemas.base_schema import ItemLote
+from app.services.chat_service import responder
+from app.services.concurrencia import SaturacionLLM
+
+LOTE_ITEMS = registro.contador("ube_lote_items_total", "Mensajes procesados por lotes, por resultado")
+LOTE_ACTIVOS = registro.medidor("ube_lote_activos", "Lotes en proceso")
+
+
+class ProcesadorLotes:
+    """
+    Responde muchos mensajes (user_id, query) con el mismo camino que `/ventas/chat`
+    (cachés, router, agente y cliente HTTP compartidos).
+
+    Cada usuario queda asignado a un solo trabajador, que procesa sus mensajes en
+    orden; hasta `concurrencia` usuarios se atienden a la vez. Un mensaje que falla
+    no detiene el lote: se reporta con `ok: false` y se sigue con el siguiente.
+    """
+
+    def __init__(self, concurrencia: int = LOTE_CONCURRENCIA, timeout: float = LOTE_TIMEOUT,
+                 reintentos: int = LOTE_REINTENTOS):
+        self.concurrencia = concurrencia
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.activos = 0
+        self.stats = {"lotes": 0, "items": 0, "errores": 0, "reintentos": 0}
+
+    async def _procesar_item(self, indice: int, user_id: str, query: str, debug: bool) -> dict:
+        inicio = time.perf_counter()
+        salida = {"indice": indice, "user_id": user_id}
+        intentos = 0
+        while True:
+            try:
+                resultado = await asyncio.wait_for(responder(user_id, query, debug=debug), timeout=self.timeout)
+                salida.update(ok=True, **resultado)
+                break
+            except SaturacionLLM as e:
+                # El lote cede el LLM al tráfico interactivo y reintenta más tarde
+                if intentos >= self.reintentos:
+                    salida.update(ok=False, error=str(e))
+                    break
+                intentos += 1
+                self.stats["reintentos"] += 1
+                await asyncio.sleep(e.retry_after)
+            except asyncio.TimeoutError:
+                salida.update(ok=False, error=f"Sin respuesta en {self.timeout:g} s")
+                break
+            except Exception as e:
+                salida.update(ok=False, error=str(e))
+                break
+
+        salida["ms"] = round((time.perf_counter() - inicio) * 1e3, 1)
+        self.stats["items"] += 1
+        if not salida["ok"]:
+            self.stats["errores"] += 1
+        LOTE_ITEMS.inc(resultado="ok" if salida["ok"] else "error")
+        return salida
+
+    async def procesar(self, items: Iterable[ItemLote], concurrencia: Optional[int] = None,
+                       debug: bool = False) -> AsyncIterator[dict]:
+        """
+        Produce un resultado por mensaje a medida que terminan (con su `indice` en
+        la entrada) y al final `{"resumen": {...}}`.
+        """
+        por_usuario: Dict[str, Deque[Tuple[int, str]]] = {}
+        total = 0
+        for indice, item in enumerate(items):
+            por_usuario.setdefault(item.user_id, deque()).append((indice, item.query))
+            total += 1
+
+        # Primero los usuarios con más mensajes: su cadena secuencial marca la duración del lote
+        usuarios: asyncio.Queue = asyncio.Queue()
+        for user_id in sorted(por_usuario, key=lambda u: len(por_usuario[u]), reverse=True):
+            usuarios.put_nowait(user_id)
+        resultados: asyncio.Queue = asyncio.Queue()
+
+        async def trabajador():
+            while not usuarios.empty():
+                user_id = usuarios.get_nowait()
+                for indice, query in por_usuario[user_id]:
+                    resultados.put_nowait(await self._procesar_item(indice, user_id, query, debug))
+
+        concurrencia = min(concurrencia or self.concurrencia, self.concurrencia)
+        inicio = time.perf_counter()
+        errores = 0
+        self.stats["lotes"] += 1
+        self.activos += 1
+        LOTE_ACTIVOS.inc()
+        tareas = [asyncio.create_task(trabajador()) for _ in range(min(concurrencia, len(por_usuario)))]
+        try:
+            for _ in range(total):
+                resultado = await resultados.get()
+                errores += not resultado["ok"]
+                yield resultado
+        finally:
+            # Si el cliente se desconecta, no se siguen respondiendo los mensajes pendientes
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
+            self.activos -= 1
+            LOTE_ACTIVOS.dec()
+
+        yield {"resumen": {
+            "items": total,
+            "ok": total - errores,
+            "errores": errores,
+            "usuarios": len(por_usuario),
+            "concurrencia": concurrencia,
+            "duracion_s": round(time.perf_counter() - inicio, 3),
+        }}
+
+    def resumen(self) -> dict:
+        return {"activos": self.activos, "concurrencia": self.concurrencia, **self.stats}
+
+
+procesador_lotes = ProcesadorLotes()
@@ -0,0 +1,150 @@
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Set
+
+from app.config import PRECARGA, PRECARGA_INACTIVIDAD, PRECARGA_MAX_EN_VUELO, PRECARGA_MAX_PENDIENTES
+from app.metrics import registro
+from app.services.cache import AsyncTTLCache, grupos_cache, mallas_cache
+
+PRECARGA_EVENTOS = registro.contador(
+    "ube_precarga_total", "Precargas de malla y grupos por resultado (cargada, en_cache, descartada, cancelada, error)"
+)
+PRECARGA_PENDIENTES = registro.medidor("ube_precarga_pendientes", "Carreras precargándose o esperando cupo")
+
+# Usuario del turno en curso: las herramientas no lo reciben como argumento
+_usuario: ContextVar[Optional[str]] = ContextVar("usuario_precarga", default=None)
+
+
+class Precargador:
+    """
+    Precarga especulativa: cuando una herramienta resuelve una carrera, trae en
+    segundo plano su malla y sus grupos, que suelen ser las siguientes preguntas.
+
+    - Presupuesto global: `max_en_vuelo` carreras a la vez y `max_pendientes` en
+      total (en curso + esperando cupo); lo que no entra se descarta.
+    - Si el usuario pasa `inactividad` segundos sin escribir, se cancela lo que
+      aún espera cupo; lo que ya consultó la API termina y queda en la caché.
+    - Las consultas que encuentran el dato precargado se cuentan en la caché
+      (`precargas_usadas` y `ube_precarga_ahorro_segundos`).
+    """
+
+    def __init__(self, caches: Sequence[AsyncTTLCache] = (mallas_cache, grupos_cache), activo: bool = PRECARGA,
+                 max_en_vuelo: int = PRECARGA_MAX_EN_VUELO, max_pendientes: int = PRECARGA_MAX_PENDIENTES,
+                 inactividad: float = PRECARGA_INACTIVIDAD):
+        self.caches = caches
+        self.activo = activo
+        self.max_pendientes = max_pendientes
+        self.inactividad = inactividad
+        self._semaforo = asyncio.Semaphore(max_en_vuelo)
+        # usuario -> id de carrera -> tarea de precarga
+        self._tareas: Dict[str, Dict[int, asyncio.Task]] = {}
+        self._actividad: Dict[str, float] = {}
+        self._en_turno: Dict[str, int] = defaultdict(int)
+        self._vigilados: Set[str] = set()
+        # Precargas que ya tienen cupo (no se cancelan por inactividad)
+        self._cargando: Set[asyncio.Task] = set()
+        self.pendientes = 0
+        self.stats = {"solicitadas": 0, "iniciadas": 0, "cargadas": 0, "en_cache": 0, "descartadas": 0,
+                      "canceladas": 0, "errores": 0}
+
+    @contextmanager
+    def conversacion(self, user_id: str):
+        """Marca el turno de `user_id`: las carreras resueltas dentro del bloque se precargan para él."""
+        token = _usuario.set(user_id)
+        self._en_turno[user_id] += 1
+        self._actividad[user_id] = time.monotonic()
+        try:
+            yield
+        finally:
+            _usuario.reset(token)
+            self._en_turno[user_id] -= 1
+            if not self._en_turno[user_id]:
+                del self._en_turno[user_id]
+            self._actividad[user_id] = time.monotonic()
+            if user_id not in self._tareas:
+                self._actividad.pop(user_id, None)
+
+    def carrera_resuelta(self, id_carrera: int):
+        """Programa la precarga de la carrera para el usuario del turno en curso (fuera de un turno no hace nada)."""
+        user_id = _usuario.get()
+        if not self.activo or user_id is None:
+            return
+        tareas = self._tareas.setdefault(user_id, {})
+        if id_carrera in tareas:
+            return
+        self.stats["solicitadas"] += 1
+        if self.pendientes >= self.max_pendientes:
+            self.stats["descartadas"] += 1
+            PRECARGA_EVENTOS.inc(resultado="descartada")
+            if not tareas:
+                del self._tareas[user_id]
+            return
+
+        tarea = asyncio.create_task(self._precargar(id_carrera))
+        tareas[id_carrera] = tarea
+        self.pendientes += 1
+        PRECARGA_PENDIENTES.set(self.pendientes)
+        tarea.add_done_callback(lambda t: self._terminar(user_id, id_carrera, t))
+        self._vigilar(user_id, self.inactividad)
+
+    async def _precargar(self, id_carrera: int):
+        async with self._semaforo:
+            self._cargando.add(asyncio.current_task())
+            self.stats["iniciadas"] += 1
+            resultados = await asyncio.gather(*(c.precargar(id_carrera) for c in self.caches), return_exceptions=True)
+        for resultado in resultados:
+            if isinstance(resultado, Exception):
+                evento = "errores"
+            else:
+                evento = "cargadas" if resultado else "en_cache"
+            self.stats[evento] += 1
+            PRECARGA_EVENTOS.inc(resultado={"cargadas": "cargada", "en_cache": "en_cache", "errores": "error"}[evento])
+
+    def _terminar(self, user_id: str, id_carrera: int, tarea: asyncio.Task):
+        self._cargando.discard(tarea)
+        self.pendientes -= 1
+        PRECARGA_PENDIENTES.set(self.pendientes)
+        if tarea.cancelled():
+            self.stats["canceladas"] += 1
+            PRECARGA_EVENTOS.inc(resultado="cancelada")
+        tareas = self._tareas.get(user_id, {})
+        tareas.pop(id_carrera, None)
+        if not tareas:
+            self._tareas.pop(user_id, None)
+            if user_id not in self._en_turno:
+                self._actividad.pop(user_id, None)
+
+    def _vigilar(self, user_id: str, espera: float):
+        if user_id not in self._vigilados:
+            self._vigilados.add(user_id)
+            asyncio.get_running_loop().call_later(espera, self._revisar, user_id)
+
+    def _revisar(self, user_id: str):
+        self._vigilados.discard(user_id)
+        if user_id not in self._tareas:
+            return
+        inactivo = time.monotonic() - self._actividad.get(user_id, 0.0)
+        if user_id in self._en_turno or inactivo < self.inactividad:
+            self._vigilar(user_id, max(self.inactividad - inactivo, 0.1))
+            return
+        # Sesión inactiva: lo que todavía espera cupo ya no se va a consultar pronto
+        for tarea in list(self._tareas[user_id].values()):
+            if tarea not in self._cargando:
+                tarea.cancel()
+
+    def resumen(self) -> dict:
+        usadas = sum(c.stats["precargas_usadas"] for c in self.caches)
+        return {
+            "activo": self.activo,
+            "pendientes": self.pendientes,
+            "usuarios": len(self._tareas),
+            **self.stats,
+            "usadas": usadas,
+            "ahorro_ms": sum(c.stats["precarga_ahorro_ms"] for c in self.caches),
+        }
+
+
+precargador = Precargador()
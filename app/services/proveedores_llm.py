@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import random
+import statistics
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Generic, List, Optional, Sequence, TypeVar
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from app.config import LLM_CIRCUITO_ESPERA, LLM_CIRCUITO_FALLOS, LLM_HEDGE, LLM_HEDGE_MAX, LLM_HEDGE_MIN
+from app.metrics import registro
+
+logger = logging.getLogger(__name__)
+
+PROVEEDOR_DURACION = registro.histograma(
+    "ube_llm_proveedor_duracion_segundos", "Duración de las llamadas exitosas a cada proveedor de LLM"
+)
+PROVEEDOR_ERRORES = registro.contador("ube_llm_proveedor_errores_total", "Llamadas fallidas a cada proveedor de LLM")
+PROVEEDOR_HEDGES = registro.contador(
+    "ube_llm_hedges_total", "Llamadas repetidas en un segundo proveedor por lentitud del primero, por ganador"
+)
+PROVEEDOR_FAILOVER = registro.contador("ube_llm_failover_total", "Llamadas reintentadas en otro proveedor tras un error")
+PROVEEDOR_CIRCUITO = registro.medidor(
+    "ube_llm_circuito_abierto", "1 si el circuito del proveedor está abierto (fuera de rotación), 0.5 si está a prueba"
+)
+
+# Llamadas recientes que se consideran para latencia y tasa de error
+VENTANA = 50
+# Muestras mínimas para confiar en la latencia medida de un proveedor
+MIN_MUESTRAS = 3
+# Fracción de llamadas que van a otro proveedor disponible para mantener sus estadísticas al día
+EXPLORACION = 0.05
+# Peso de la tasa de error al ordenar por latencia
+PENALIZACION_ERROR = 4.0
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class ProveedoresNoDisponibles(Exception):
+    """Todos los proveedores del pool tienen el circuito abierto."""
+
+
+class SaludProveedor:
+    """Latencias y errores recientes de un proveedor, y el estado de su circuito."""
+
+    def __init__(self, nombre: str, fallos_circuito: int = LLM_CIRCUITO_FALLOS,
+                 espera_circuito: float = LLM_CIRCUITO_ESPERA):
+        self.nombre = nombre
+        self.fallos_circuito = fallos_circuito
+        self.espera_circuito = espera_circuito
+        self.latencias: deque = deque(maxlen=VENTANA)
+        self.resultados: deque = deque(maxlen=VENTANA)
+        self.fallos_seguidos = 0
+        self.abierto_hasta = 0.0
+        # Con el circuito semiabierto se deja pasar una sola llamada de prueba
+        self.probando = False
+
+    def estado(self) -> str:
+        if self.fallos_seguidos < self.fallos_circuito:
+            return "cerrado"
+        return "abierto" if time.monotonic() < self.abierto_hasta else "semiabierto"
+
+    def disponible(self) -> bool:
+        estado = self.estado()
+        return estado == "cerrado" or (estado == "semiabierto" and not self.probando)
+
+    def percentil(self, p: int) -> Optional[float]:
+        if len(self.latencias) < MIN_MUESTRAS:
+            return None
+        return statistics.quantiles(self.latencias, n=100, method="inclusive")[p - 1]
+
+    def tasa_error(self) -> float:
+        return self.resultados.count(False) / len(self.resultados) if self.resultados else 0.0
+
+    def puntaje(self) -> Optional[float]:
+        """Latencia típica penalizada por errores (menor es mejor); None si aún no hay datos."""
+        p50 = self.percentil(50)
+        return None if p50 is None else p50 * (1 + PENALIZACION_ERROR * self.tasa_error())
+
+    def exito(self, duracion: float):
+        self.latencias.append(duracion)
+        self.resultados.append(True)
+        self.fallos_seguidos = 0
+        self.probando = False
+
+    def fallo(self):
+        self.resultados.append(False)
+        self.fallos_seguidos += 1
+        self.probando = False
+        if self.fallos_seguidos >= self.fallos_circuito:
+            if self.fallos_seguidos == self.fallos_circuito:
+                logger.warning(f"Circuito abierto para el proveedor {self.nombre} tras {self.fallos_seguidos} fallos")
+            self.abierto_hasta = time.monotonic() + self.espera_circuito
+
+    def resumen(self) -> dict:
+        p50, p95 = self.percentil(50), self.percentil(95)
+        return {
+            "estado": self.estado(),
+            "p50_s": round(p50, 3) if p50 is not None else None,
+            "p95_s": round(p95, 3) if p95 is not None else None,
+            "tasa_error": round(self.tasa_error(), 3),
+            "muestras": len(self.resultados),
+        }
+
+
+class PoolProveedores(Generic[T]):
+    """
+    Reparte las llamadas entre proveedores equivalentes (clientes de LLM) según su
+    latencia y errores recientes.
+
+    Cada llamada va al proveedor disponible más rápido; si falla, se reintenta en
+    el siguiente. Con `hedge`, si el elegido tarda más que su p95 se lanza la misma
+    llamada al siguiente y gana la primera respuesta. Tras `LLM_CIRCUITO_FALLOS`
+    fallos seguidos un proveedor sale de la rotación por `LLM_CIRCUITO_ESPERA`
+    segundos y vuelve con una llamada de prueba.
+    """
+
+    def __init__(self, nombre: str, proveedores: Dict[str, T], hedge: bool = LLM_HEDGE,
+                 hedge_min: float = LLM_HEDGE_MIN, hedge_max: float = LLM_HEDGE_MAX):
+        self.nombre = nombre
+        self.proveedores = proveedores
+        self.salud = {n: SaludProveedor(n) for n in proveedores}
+        self.hedge = hedge
+        self.hedge_min = hedge_min
+        self.hedge_max = hedge_max
+        self.stats = {"llamadas": 0, "hedges": 0, "hedges_ganados": 0, "failover": 0}
+
+    def ordenar(self) -> List[str]:
+        """Proveedores disponibles, del preferido al último."""
+        disponibles = [n for n in self.proveedores if self.salud[n].disponible()]
+        if not disponibles:
+            raise ProveedoresNoDisponibles(f"Ningún proveedor disponible para {self.nombre}")
+        # Los que aún no tienen datos conservan el orden de la configuración, después de los medidos
+        orden = {n: i for i, n in enumerate(self.proveedores)}
+        disponibles.sort(key=lambda n: (self.salud[n].puntaje() is None, self.salud[n].puntaje() or 0.0, orden[n]))
+        if len(disponibles) > 1 and random.random() < EXPLORACION:
+            explorado = random.choice(disponibles[1:])
+            disponibles.remove(explorado)
+            disponibles.insert(0, explorado)
+        return disponibles
+
+    def retraso_hedge(self, nombre: str) -> float:
+        p95 = self.salud[nombre].percentil(95)
+        return self.hedge_max if p95 is None else min(max(p95, self.hedge_min), self.hedge_max)
+
+    @contextmanager
+    def medir(self, nombre: str):
+        """Registra el resultado de un bloque que usa el proveedor; una cancelación no cuenta."""
+        salud = self.salud[nombre]
+        if salud.estado() == "semiabierto":
+            salud.probando = True
+        inicio = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            salud.probando = False
+            raise
+        except Exception:
+            salud.fallo()
+            PROVEEDOR_ERRORES.inc(pool=self.nombre, proveedor=nombre)
+            raise
+        duracion = time.perf_counter() - inicio
+        salud.exito(duracion)
+        PROVEEDOR_DURACION.observar(duracion, pool=self.nombre, proveedor=nombre)
+
+    async def _llamar(self, nombre: str, llamada: Callable[[T], Awaitable[R]]) -> R:
+        with self.medir(nombre):
+            return await llamada(self.proveedores[nombre])
+
+    async def ejecutar(self, llamada: Callable[[T], Awaitable[R]]) -> R:
+        """Ejecuta `llamada(cliente)` con el mejor proveedor, con failover y (opcional) hedge."""
+        self.stats["llamadas"] += 1
+        candidatos = self.ordenar()
+        pendientes: Dict[asyncio.Task, str] = {}
+        siguiente = 0
+        cubierta = False
+        ultimo_error: Optional[BaseException] = None
+
+        def lanzar():
+            nonlocal siguiente
+            nombre = candidatos[siguiente]
+            siguiente += 1
+            pendientes[asyncio.ensure_future(self._llamar(nombre, llamada))] = nombre
+
+        lanzar()
+        try:
+            while pendientes:
+                # Una sola llamada cubierta por hedge, y solo mientras la primera sigue en curso
+                espera = None
+                if self.hedge and not cubierta and siguiente < len(candidatos) and len(pendientes) == 1:
+                    espera = self.retraso_hedge(next(iter(pendientes.values())))
+                hechas, _ = await asyncio.wait(pendientes, timeout=espera, return_when=asyncio.FIRST_COMPLETED)
+
+                if not hechas:
+                    cubierta = True
+                    self.stats["hedges"] += 1
+                    lanzar()
+                    continue
+
+                for tarea in hechas:
+                    nombre = pendientes.pop(tarea)
+                    if tarea.exception() is None:
+                        if cubierta:
+                            ganador = "segundo" if nombre != candidatos[0] else "primero"
+                            self.stats["hedges_ganados"] += ganador == "segundo"
+                            PROVEEDOR_HEDGES.inc(pool=self.nombre, ganador=ganador)
+                        return tarea.result()
+                    ultimo_error = tarea.exception()
+                    logger.warning(f"Falló el proveedor {nombre} ({self.nombre}): {ultimo_error}")
+
+                if not pendientes and siguiente < len(candidatos):
+                    self.stats["failover"] += 1
+                    PROVEEDOR_FAILOVER.inc(pool=self.nombre)
+                    lanzar()
+        finally:
+            for tarea in pendientes:
+                tarea.cancel()
+        raise ultimo_error
+
+    def actualizar_metricas(self):
+        for nombre, salud in self.salud.items():
+            estado = salud.estado()
+            PROVEEDOR_CIRCUITO.set({"cerrado": 0, "semiabierto": 0.5, "abierto": 1}[estado],
+                                   pool=self.nombre, proveedor=nombre)
+
+    def resumen(self) -> dict:
+        return {
+            "hedge": self.hedge,
+            "proveedores": {n: s.resumen() for n, s in self.salud.items()},
+            **self.stats,
+        }
+
+
+class ChatPool(BaseChatModel):
+    """
+    Chat model de LangChain que delega cada llamada en un `PoolProveedores` de chat
+    models. Los argumentos enlazados por el agente (herramientas) pasan tal cual al
+    proveedor elegido. En streaming no hay hedge: se cambia de proveedor solo si
+    falla antes del primer fragmento.
+    """
+
+    pool: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "pool"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        # Formato de OpenAI: lo aceptan tanto ChatOpenAI como ChatGoogleGenerativeAI
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        ultimo_error = None
+        for nombre in self.pool.ordenar():
+            try:
+                with self.pool.medir(nombre):
+                    return self.pool.proveedores[nombre]._generate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                ultimo_error = e
+        raise ultimo_error
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        return await self.pool.ejecutar(lambda modelo: modelo._agenerate(messages, stop=stop, **kwargs))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        ultimo_error = None
+        for nombre in self.pool.ordenar():
+            emitido = False
+            try:
+                with self.pool.medir(nombre):
+                    async for chunk in self.pool.proveedores[nombre]._astream(messages, stop=stop, **kwargs):
+                        emitido = True
+                        yield chunk
+                return
+            except Exception as e:
+                if emitido:
+                    raise
+                ultimo_error = e
+                logger.warning(f"Falló el proveedor {nombre} ({self.pool.nombre}) en streaming: {e}")
+        raise ultimo_error
+
+
+# Pools creados (agente, clasificador), para /estado y las métricas
+POOLS: Dict[str, PoolProveedores] = {}
+
+
+def registrar_pool(pool: PoolProveedores) -> PoolProveedores:
+    POOLS[pool.nombre] = pool
+    return pool
+
+
+registro.colector(lambda: [pool.actualizar_metricas() for pool in POOLS.values()])
@@ -0,0 +1,224 @@
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from app.config import RESPUESTAS_CACHE_MAX, RESPUESTAS_CACHE_TTL, RESPUESTAS_CACHE_UMBRAL
+from app.services.cache import carreras_cache, dependencias_vigentes
+from app.services.carreras_resolver import get_resolver, normalizar, trigramas
+
+# Solo palabras vacías generales: "malla", "grupos" o "precio" cambian la respuesta
+STOPWORDS_CONSULTA = {
+    "a", "al", "como", "con", "cual", "cuales", "de", "del", "el", "en", "es", "hola",
+    "la", "las", "lo", "los", "me", "mi", "para", "por", "porfa", "porfavor", "favor",
+    "que", "se", "su", "sus", "un", "una", "unos", "unas", "ustedes", "buenas", "buenos",
+    "dias", "tardes", "noches", "gracias", "quisiera", "quiero", "saber", "podrian",
+    "puede", "pueden", "dime", "dame", "decir", "informacion", "info",
+}
+
+# Palabras que indican que la pregunta depende de turnos anteriores
+MARCADORES_SEGUIMIENTO = {
+    "ese", "esa", "esos", "esas", "eso", "este", "esta", "estos", "estas", "ella", "ello",
+    "anterior", "mismo", "misma", "tambien", "otra", "otro", "otras", "otros", "primera",
+    "segunda", "ultima", "dicha", "dicho", "aquella", "aquel", "entonces", "ahi",
+}
+
+
+def tokens_consulta(query: str) -> List[str]:
+    return [t for t in normalizar(query).split() if t not in STOPWORDS_CONSULTA]
+
+
+def es_seguimiento(query: str) -> bool:
+    """Heurística: preguntas con referencias a la conversación no se cachean."""
+    palabras = normalizar(query).split()
+    if not palabras:
+        return True
+    return palabras[0] in {"y", "pero", "entonces"} or any(p in MARCADORES_SEGUIMIENTO for p in palabras)
+
+
+def nombra_carrera(query: str) -> bool:
+    """True si la consulta nombra sin ambigüedad una carrera del catálogo en caché."""
+    entradas = carreras_cache.entradas()
+    if not entradas:
+        return False
+    resolucion, _ = get_resolver(entradas[0][1].data).resolver(query)
+    return resolucion is not None
+
+
+def _a_un_cambio(a: str, b: str) -> bool:
+    """True si `b` sale de `a` con una letra agregada, quitada, cambiada o dos letras vecinas invertidas."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    return a[i + 1:] == b[i + 1:] or (a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2]
+                                      and a[i + 2:] == b[i + 2:])
+
+
+def mismas_palabras(a: Set[str], b: Set[str], min_largo: int = 4) -> bool:
+    """
+    True si las dos consultas tienen las mismas palabras salvo errores de tipeo: cada
+    palabra distinta se empareja con una sola de la otra consulta, a un cambio de
+    distancia y de al menos `min_largo` letras (números y siglas deben coincidir).
+    """
+    sobrantes_a, sobrantes_b = sorted(a - b), list(b - a)
+    if len(sobrantes_a) != len(sobrantes_b):
+        return False
+    for palabra in sobrantes_a:
+        pareja = next((p for p in sobrantes_b if min(len(p), len(palabra)) >= min_largo
+                       and _a_un_cambio(palabra, p)), None)
+        if pareja is None:
+            return False
+        sobrantes_b.remove(pareja)
+    return True
+
+
+@dataclass
+class RespuestaCacheada:
+    llave: str
+    respuesta: str
+    tokens: Set[str]
+    trigramas: Set[str]
+    dependencias: dict
+    latencia: float
+    preguntas_sugeridas: List[str] = field(default_factory=list)
+    creada: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+class RespuestasCache:
+    """
+    Caché de respuestas a preguntas frecuentes.
+
+    Busca primero por llave exacta (tokens normalizados) y luego por similitud
+    léxica local (Dice de trigramas) entre consultas con las mismas palabras salvo
+    errores de tipeo. Una respuesta deja de
+    ser válida cuando cambian los datos (carreras, grupos, mallas) con los que
+    se construyó, o al vencer su TTL.
+    """
+
+    def __init__(self, max_items: int = RESPUESTAS_CACHE_MAX, ttl: float = RESPUESTAS_CACHE_TTL,
+                 umbral: float = RESPUESTAS_CACHE_UMBRAL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.umbral = umbral
+        self._entradas: "OrderedDict[str, RespuestaCacheada]" = OrderedDict()
+        self._indice: Dict[str, Set[str]] = defaultdict(set)
+        self.stats = {"hits": 0, "hits_similares": 0, "misses": 0, "bypass": 0, "invalidadas": 0,
+                      "con_contexto": 0, "latencia_ahorrada_s": 0.0}
+
+    def buscar(self, query: str, con_historial: bool = False) -> Optional[RespuestaCacheada]:
+        """
+        Con `con_historial` y sin una carrera nombrada no se busca: la respuesta
+        cacheada no conoce la carrera de la que viene hablando el usuario.
+        """
+        if es_seguimiento(query) or (con_historial and not nombra_carrera(query)):
+            self.stats["bypass"] += 1
+            return None
+
+        tokens = tokens_consulta(query)
+        llave = " ".join(sorted(set(tokens)))
+        entrada = self._vigente(llave)
+        if entrada is not None:
+            self.stats["hits"] += 1
+        else:
+            entrada = self._similar(set(tokens), trigramas(" ".join(tokens)))
+            if entrada is not None:
+                self.stats["hits_similares"] += 1
+
+        if entrada is None:
+            self.stats["misses"] += 1
+            return None
+
+        entrada.hits += 1
+        self.stats["latencia_ahorrada_s"] += entrada.latencia
+        self._entradas.move_to_end(entrada.llave)
+        return entrada
+
+    def guardar(self, query: str, respuesta: str, dependencias: dict, latencia: float,
+                preguntas_sugeridas: List[str] = None, con_historial: bool = False):
+        """
+        Con `con_historial` (la sesión ya tenía turnos) solo se guarda si la consulta
+        nombra una carrera: "¿y cuánto cuesta?" se responde con la carrera de la
+        conversación y esa respuesta no sirve para otro usuario.
+        """
+        if es_seguimiento(query) or ("no_cacheable", None) in dependencias:
+            return
+        if con_historial and not nombra_carrera(query):
+            self.stats["con_contexto"] += 1
+            return
+        tokens = tokens_consulta(query)
+        if not tokens:
+            return
+
+        llave = " ".join(sorted(set(tokens)))
+        self._quitar(llave)
+        self._entradas[llave] = RespuestaCacheada(
+            llave=llave,
+            respuesta=respuesta,
+            tokens=set(tokens),
+            trigramas=trigramas(" ".join(tokens)),
+            dependencias=dict(dependencias),
+            latencia=latencia,
+            preguntas_sugeridas=list(preguntas_sugeridas or []),
+        )
+        for token in set(tokens):
+            self._indice[token].add(llave)
+        while len(self._entradas) > self.max_items:
+            self._quitar(next(iter(self._entradas)))
+
+    def _vigente(self, llave: str) -> Optional[RespuestaCacheada]:
+        entrada = self._entradas.get(llave)
+        if entrada is None:
+            return None
+        if time.monotonic() - entrada.creada > self.ttl or not dependencias_vigentes(entrada.dependencias):
+            self.stats["invalidadas"] += 1
+            self._quitar(llave)
+            return None
+        return entrada
+
+    def _similar(self, tokens: Set[str], grams: Set[str]) -> Optional[RespuestaCacheada]:
+        candidatas = set()
+        for token in tokens:
+            candidatas |= self._indice.get(token, set())
+
+        mejor, mejor_score = None, self.umbral
+        for llave in candidatas:
+            entrada = self._entradas[llave]
+            # Solo se toleran errores de tipeo: una palabra de más o distinta ("Derecho Penal"
+            # frente a "Derecho") es otra pregunta aunque se parezca mucho
+            if not mismas_palabras(tokens, entrada.tokens):
+                continue
+            score = 2 * len(grams & entrada.trigramas) / (len(grams) + len(entrada.trigramas))
+            if score >= mejor_score:
+                mejor, mejor_score = entrada, score
+
+        return self._vigente(mejor.llave) if mejor else None
+
+    def _quitar(self, llave: str):
+        entrada = self._entradas.pop(llave, None)
+        if entrada is None:
+            return
+        for token in entrada.tokens:
+            llaves = self._indice.get(token)
+            if llaves is not None:
+                llaves.discard(llave)
+                if not llaves:
+                    del self._indice[token]
+
+    def resumen(self) -> dict:
+        consultas = self.stats["hits"] + self.stats["hits_similares"] + self.stats["misses"]
+        aciertos = self.stats["hits"] + self.stats["hits_similares"]
+        return {
+            "items": len(self._entradas),
+            "hit_rate": round(aciertos / consultas, 3) if consultas else 0.0,
+            **self.stats,
+        }
+
+
+respuestas_cache = RespuestasCache()
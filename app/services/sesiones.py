@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable, Optional, Tuple
+
+import orjson
+from langchain.memory import ConversationBufferMemory
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+from app.config import (
+    SESIONES_BACKEND, SESIONES_BLOQUEO_ESPERA, SESIONES_BLOQUEO_TTL, SESIONES_DB_PATH, SESIONES_MAX,
+    SESIONES_TTL, SESIONES_MAX_MENSAJES, SESIONES_MAX_BYTES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MemoriaBackend:
+    """Backend en memoria del proceso. Solo para desarrollo: no sobrevive reinicios."""
+
+    compartido = False
+
+    def __init__(self, max_items: int = SESIONES_MAX):
+        self.max_items = max_items
+        self._datos: "OrderedDict[str, tuple[bytes, float, int]]" = OrderedDict()
+
+    def cargar(self, user_id: str) -> Optional[Tuple[bytes, int]]:
+        fila = self._datos.get(user_id)
+        return (fila[0], fila[2]) if fila else None
+
+    def guardar(self, user_id: str, datos: bytes, version: int) -> Optional[int]:
+        fila = self._datos.get(user_id)
+        if (fila[2] if fila else 0) != version:
+            return None
+        self._datos[user_id] = (datos, time.time(), version + 1)
+        self._datos.move_to_end(user_id)
+        while len(self._datos) > self.max_items:
+            self._datos.popitem(last=False)
+        return version + 1
+
+    def borrar(self, user_id: str):
+        self._datos.pop(user_id, None)
+
+    def purgar(self, antes_de: float) -> int:
+        viejas = [u for u, (_, ts, _) in self._datos.items() if ts < antes_de]
+        for user_id in viejas:
+            del self._datos[user_id]
+        return len(viejas)
+
+
+class SQLiteBackend:
+    """
+    Backend en un archivo SQLite (modo WAL).
+    Sobrevive reinicios y puede compartirse entre varios workers de uvicorn.
+
+    Cada sesión tiene una versión: `guardar` solo escribe si nadie la cambió desde
+    que se cargó. La tabla `bloqueos` guarda, por usuario, qué proceso tiene su
+    turno en curso y hasta cuándo (para que un worker caído no lo retenga).
+    """
+
+    compartido = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sesiones ("
+            " user_id TEXT PRIMARY KEY, datos BLOB NOT NULL, actualizado REAL NOT NULL,"
+            " version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(sesiones)")}
+        if "version" not in columnas:
+            # Archivo creado antes de versionar las sesiones
+            conn.execute("ALTER TABLE sesiones ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_actualizado ON sesiones(actualizado)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS bloqueos (user_id TEXT PRIMARY KEY, dueno TEXT NOT NULL, vence REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo: las llamadas llegan desde asyncio.to_thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def cargar(self, user_id: str) -> Optional[Tuple[bytes, int]]:
+        fila = self._conn().execute("SELECT datos, version FROM sesiones WHERE user_id = ?", (user_id,)).fetchone()
+        return (fila[0], fila[1]) if fila else None
+
+    def guardar(self, user_id: str, datos: bytes, version: int) -> Optional[int]:
+        """Escribe si la versión guardada sigue siendo `version`; retorna la nueva o None si hubo conflicto."""
+        if version == 0:
+            cursor = self._conn().execute(
+                "INSERT INTO sesiones (user_id, datos, actualizado, version) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT(user_id) DO NOTHING",
+                (user_id, datos, time.time()),
+            )
+        else:
+            cursor = self._conn().execute(
+                "UPDATE sesiones SET datos = ?, actualizado = ?, version = version + 1 "
+                "WHERE user_id = ? AND version = ?",
+                (datos, time.time(), user_id, version),
+            )
+        return version + 1 if cursor.rowcount == 1 else None
+
+    def borrar(self, user_id: str):
+        self._conn().execute("DELETE FROM sesiones WHERE user_id = ?", (user_id,))
+
+    def purgar(self, antes_de: float) -> int:
+        self._conn().execute("DELETE FROM bloqueos WHERE vence < ?", (time.time(),))
+        return self._conn().execute("DELETE FROM sesiones WHERE actualizado < ?", (antes_de,)).rowcount
+
+    def bloquear(self, user_id: str, dueno: str, duracion: float) -> bool:
+        """Toma el turno del usuario si está libre o vencido; True si quedó a nombre de `dueno`."""
+        ahora = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO bloqueos (user_id, dueno, vence) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET dueno = excluded.dueno, vence = excluded.vence "
+            "WHERE bloqueos.vence < ?",
+            (user_id, dueno, ahora + duracion, ahora),
+        )
+        return cursor.rowcount == 1
+
+    def liberar(self, user_id: str, dueno: str):
+        self._conn().execute("DELETE FROM bloqueos WHERE user_id = ? AND dueno = ?", (user_id, dueno))
+
+
+def crear_memoria_default() -> ConversationBufferMemory:
+    return ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+
+
+class SessionStore:
+    """
+    Memorias de conversación por usuario, acotadas en cantidad, tiempo y tamaño.
+
+    - Las sesiones inactivas más de `ttl` segundos se descartan.
+    - Como máximo `max_sesiones` quedan en memoria del proceso (LRU).
+    - Cada sesión guarda a lo sumo `max_mensajes` mensajes y `max_bytes` serializados.
+
+    Con un backend compartido, `bloqueo` serializa los turnos de un usuario entre
+    workers, y `guardar` detecta si otro proceso escribió la sesión desde que se
+    cargó: en ese caso recarga la versión guardada y le agrega el intercambio del turno.
+    """
+
+    def __init__(self, backend, crear_memoria: Callable[[], ConversationBufferMemory] = crear_memoria_default,
+                 max_sesiones: int = SESIONES_MAX, ttl: float = SESIONES_TTL,
+                 max_mensajes: int = SESIONES_MAX_MENSAJES, max_bytes: int = SESIONES_MAX_BYTES):
+        self.backend = backend
+        self.crear_memoria = crear_memoria
+        self.max_sesiones = max_sesiones
+        self.ttl = ttl
+        self.max_mensajes = max_mensajes
+        self.max_bytes = max_bytes
+        self._sesiones: "OrderedDict[str, tuple[ConversationBufferMemory, float]]" = OrderedDict()
+        # Versión guardada de cada sesión abierta, la que `guardar` espera encontrar en el backend
+        self._versiones: dict[str, int] = {}
+        self._ultima_purga = time.monotonic()
+        self.stats = {"evictions_lru": 0, "evictions_ttl": 0, "recortes": 0, "conflictos": 0,
+                      "esperas_bloqueo": 0, "bloqueos_vencidos": 0}
+
+    async def obtener(self, user_id: str):
+        self._purgar_locales()
+        entrada = self._sesiones.pop(user_id, None)
+        memoria = entrada[0] if entrada else None
+
+        # Con un backend compartido otro worker pudo haber avanzado la conversación
+        if memoria is None or self.backend.compartido:
+            cargado = await asyncio.to_thread(self.backend.cargar, user_id)
+            memoria = memoria or self.crear_memoria()
+            self._versiones[user_id] = cargado[1] if cargado else 0
+            if cargado:
+                self.restaurar(memoria, cargado[0])
+
+        self._sesiones[user_id] = (memoria, time.monotonic())
+        while len(self._sesiones) > self.max_sesiones:
+            desalojado, _ = self._sesiones.popitem(last=False)
+            self._versiones.pop(desalojado, None)
+            self.stats["evictions_lru"] += 1
+        return memoria
+
+    async def guardar(self, user_id: str, nuevo_turno: bool = True):
+        """
+        Persiste la sesión del usuario; retorna su memoria (None si no estaba abierta).
+
+        Si otro proceso la escribió desde que se cargó, con `nuevo_turno` se conserva
+        lo guardado y se le agrega el último intercambio (pregunta y respuesta) de
+        esta memoria; sin `nuevo_turno` (p. ej. un resumen) se descartan los cambios.
+        """
+        entrada = self._sesiones.get(user_id)
+        if entrada is None:
+            return None
+        memoria = entrada[0]
+        intercambio = list(memoria.chat_memory.messages[-2:])
+        for _ in range(3):
+            datos = self.serializar(memoria)
+            version = await asyncio.to_thread(self.backend.guardar, user_id, datos, self._versiones.get(user_id, 0))
+            if version is not None:
+                self._versiones[user_id] = version
+                break
+            self.stats["conflictos"] += 1
+            logger.warning(f"La sesión de {user_id} cambió en otro proceso durante el turno; se recarga")
+            cargado = await asyncio.to_thread(self.backend.cargar, user_id)
+            self._versiones[user_id] = cargado[1] if cargado else 0
+            if cargado:
+                self.restaurar(memoria, cargado[0])
+            else:
+                memoria.clear()
+            if not nuevo_turno:
+                break
+            memoria.chat_memory.add_messages(intercambio)
+
+        if time.monotonic() - self._ultima_purga > 60:
+            self._ultima_purga = time.monotonic()
+            await asyncio.to_thread(self.backend.purgar, time.time() - self.ttl)
+        return entrada[0]
+
+    async def borrar(self, user_id: str):
+        self._sesiones.pop(user_id, None)
+        self._versiones.pop(user_id, None)
+        await asyncio.to_thread(self.backend.borrar, user_id)
+
+    @asynccontextmanager
+    async def bloqueo(self, user_id: str, duracion: float = SESIONES_BLOQUEO_TTL,
+                      max_espera: float = SESIONES_BLOQUEO_ESPERA):
+        """
+        Turno exclusivo del usuario entre todos los procesos que comparten el backend.
+        Vence a los `duracion` segundos por si el proceso muere a mitad de turno; si
+        no se obtiene en `max_espera`, el turno sigue y `guardar` resuelve el conflicto.
+        """
+        if not self.backend.compartido:
+            yield
+            return
+        dueno = f"{os.getpid()}:{uuid.uuid4().hex}"
+        limite = time.monotonic() + max_espera
+        pausa = 0.02
+        while not await asyncio.to_thread(self.backend.bloquear, user_id, dueno, duracion):
+            if time.monotonic() >= limite:
+                self.stats["bloqueos_vencidos"] += 1
+                logger.warning(f"El turno de {user_id} sigue tomado en otro proceso; se continúa sin bloqueo")
+                break
+            self.stats["esperas_bloqueo"] += 1
+            await asyncio.sleep(pausa)
+            pausa = min(pausa * 2, 0.5)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self.backend.liberar, user_id, dueno)
+
+    def serializar(self, memoria) -> bytes:
+        """Serializa la memoria recortando los mensajes más viejos si excede el presupuesto."""
+        mensajes = memoria.chat_memory.messages
+        while True:
+            datos = orjson.dumps({
+                "mensajes": messages_to_dict(mensajes),
+                "resumen": getattr(memoria, "resumen", ""),
+                # Turnos que todavía no se incorporaron al resumen (ver ConsolidadorMemorias)
+                "pendientes": messages_to_dict(getattr(memoria, "pendientes", [])),
+            })
+            if len(mensajes) <= self.max_mensajes and len(datos) <= self.max_bytes or len(mensajes) <= 2:
+                break
+            # Se descarta de a un turno (pregunta + respuesta)
+            mensajes = mensajes[2:]
+            self.stats["recortes"] += 1
+        memoria.chat_memory.messages = mensajes
+        return datos
+
+    def restaurar(self, memoria, datos: bytes):
+        try:
+            sesion = orjson.loads(datos)
+            memoria.chat_memory.messages = messages_from_dict(sesion["mensajes"])
+            if hasattr(memoria, "resumen"):
+                memoria.resumen = sesion.get("resumen", "")
+            if hasattr(memoria, "pendientes"):
+                memoria.pendientes = messages_from_dict(sesion.get("pendientes", []))
+        except Exception as e:
+            logger.warning(f"Sesión corrupta, se descarta: {e}")
+
+    def _purgar_locales(self):
+        limite = time.monotonic() - self.ttl
+        while self._sesiones:
+            user_id, (_, acceso) = next(iter(self._sesiones.items()))
+            if acceso >= limite:
+                break
+            del self._sesiones[user_id]
+            self._versiones.pop(user_id, None)
+            self.stats["evictions_ttl"] += 1
+
+    def resumen(self) -> dict:
+        return {"sesiones_activas": len(self._sesiones), **self.stats}
+
+
+def crear_backend():
+    if SESIONES_BACKEND == "sqlite":
+        return SQLiteBackend(SESIONES_DB_PATH)
+    return MemoriaBackend()
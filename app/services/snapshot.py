@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+import ormsgpack
+
+from app.config import SNAPSHOT_INTERVALO, SNAPSHOT_PATH
+from app.schemas.carreras_schema import Carreras
+from app.schemas.grupos_schema import Grupos
+from app.schemas.malla_schema import Malla
+from app.services.cache import CACHES, carreras_cache
+
+logger = logging.getLogger(__name__)
+
+# Cambia si cambia la estructura del archivo (no los datos)
+FORMATO = 1
+
+MODELOS = {"carreras": Carreras, "mallas": Malla, "grupos": Grupos}
+
+# Peticiones simultáneas a la API al refrescar mallas y grupos
+REFRESCOS_CONCURRENTES = 4
+
+
+class SnapshotCatalogo:
+    """
+    Copia en disco (msgpack) de las cachés de carreras, mallas y grupos.
+
+    Se carga en el arranque, antes de atender peticiones, para no depender de la
+    API de la UBE en el primer mensaje; un refresco periódico trae los datos nuevos,
+    los reemplaza en las cachés y reescribe el archivo de forma atómica.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH, intervalo: float = SNAPSHOT_INTERVALO):
+        self.path = path
+        self.intervalo = intervalo
+        self.version: Optional[str] = None
+        self.creado: Optional[float] = None
+        self.stats = {"cargas": 0, "guardados": 0, "refrescos": 0, "errores_refresco": 0}
+
+    def guardar(self) -> int:
+        """Escribe el contenido actual de las cachés; retorna el número de entradas."""
+        if not carreras_cache.entradas():
+            # Sin catálogo no hay nada útil que guardar: se conserva el snapshot anterior
+            return 0
+        ahora = time.time()
+        caches = {
+            nombre: [[key, valor.model_dump(), ahora - edad] for key, valor, edad in CACHES[nombre].entradas()]
+            for nombre in MODELOS
+        }
+        huellas = sorted(f"{n}:{k}:{CACHES[n].huella(k)}" for n, entradas in caches.items() for k, _, _ in entradas)
+        version = hashlib.blake2b("|".join(huellas).encode(), digest_size=8).hexdigest()
+
+        datos = ormsgpack.packb({"formato": FORMATO, "version": version, "creado": ahora, "caches": caches})
+        temporal = f"{self.path}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(datos)
+        # Reemplazo atómico: otro proceso nunca ve un archivo a medio escribir
+        os.replace(temporal, self.path)
+
+        self.version, self.creado = version, ahora
+        self.stats["guardados"] += 1
+        return sum(len(e) for e in caches.values())
+
+    def cargar(self) -> int:
+        """Restaura las cachés desde el archivo; retorna el número de entradas restauradas."""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, "rb") as f:
+                datos = ormsgpack.unpackb(f.read())
+        except Exception as e:
+            logger.warning(f"Snapshot ilegible en {self.path}: {e}")
+            return 0
+        if datos.get("formato") != FORMATO:
+            logger.warning(f"Snapshot con formato {datos.get('formato')} (se esperaba {FORMATO}); se ignora")
+            return 0
+
+        ahora = time.time()
+        restauradas = 0
+        for nombre, entradas in datos["caches"].items():
+            modelo, cache = MODELOS.get(nombre), CACHES.get(nombre)
+            if modelo is None or cache is None:
+                continue
+            for key, valor, guardado in entradas:
+                try:
+                    cache.set(key, modelo.model_validate(valor), edad=max(0.0, ahora - guardado))
+                    restauradas += 1
+                except Exception as e:
+                    logger.warning(f"Entrada inválida en el snapshot {nombre}[{key}]: {e}")
+
+        self.version, self.creado = datos.get("version"), datos.get("creado")
+        self.stats["cargas"] += 1
+        logger.info(f"Snapshot {self.version} cargado: {restauradas} entradas, de hace {ahora - self.creado:.0f} s")
+        return restauradas
+
+    async def refrescar(self):
+        """Trae de la API el catálogo y las mallas y grupos ya conocidos, y guarda el snapshot."""
+        await carreras_cache.refrescar()
+
+        semaforo = asyncio.Semaphore(REFRESCOS_CONCURRENTES)
+
+        async def refrescar_llave(cache, key):
+            async with semaforo:
+                try:
+                    await cache.refrescar(key)
+                except Exception as e:
+                    # Se conserva el valor anterior (y se sirve como respaldo)
+                    logger.warning(f"No se pudo refrescar {cache.nombre}[{key}]: {e}")
+
+        await asyncio.gather(*(
+            refrescar_llave(CACHES[nombre], key)
+            for nombre in ("mallas", "grupos")
+            for key, _, _ in CACHES[nombre].entradas()
+        ))
+        self.guardar()
+        self.stats["refrescos"] += 1
+
+    async def ejecutar(self):
+        """Tarea de fondo: refresca al iniciar y luego cada `intervalo` segundos."""
+        while True:
+            try:
+                await self.refrescar()
+            except Exception as e:
+                self.stats["errores_refresco"] += 1
+                logger.warning(f"Error refrescando el snapshot del catálogo: {e}")
+            await asyncio.sleep(self.intervalo)
+
+    def resumen(self) -> dict:
+        return {
+            "path": self.path,
+            "version": self.version,
+            "edad_s": round(time.time() - self.creado, 1) if self.creado else None,
+            **self.stats,
+        }
+
+
+snapshot_catalogo = SnapshotCatalogo()
@@ -1,39 +1,107 @@
-import requests
-from app.schemas.carreras_schema import Carreras, DataCarreras
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple, Type
+
+from app.schemas.carreras_schema import Carreras
 from app.schemas.grupos_schema import Grupos
 from app.schemas.malla_schema import Malla
 from app.schemas.base_schema import Matricular
-from app.config import API_URL
-import httpx
+from app.metrics import registro
+from app.services.http_client import ube_client
+
+# Las respuestas se validan directo desde los bytes: sin json() ni dicts intermedios
+
+SINCRONIZACION = registro.contador(
+    "ube_sincronizacion_total",
+    "Descargas de la API de la UBE por resultado (no_modificado = 304, sin_cambios = mismo contenido, cambio)",
+)
+BYTES_EVITADOS = registro.contador(
+    "ube_sincronizacion_bytes_evitados_total", "Bytes que no se descargaron gracias a un 304"
+)
+
+# Versiones recordadas (catálogo + mallas + grupos); las más viejas se descargan completas otra vez
+MAX_VERSIONES = 2048
+
+
+@dataclass
+class VersionRemota:
+    valor: Any
+    huella: str
+    largo: int
+    etag: Optional[str]
+    modificado: Optional[str]
+
+
+class SincronizadorUBE:
+    """
+    Descargas incrementales de la API de la UBE.
+
+    Cada recurso recuerda su último valor con su `ETag` / `Last-Modified` y la
+    huella de sus bytes. La siguiente descarga es un GET condicional: con 304, o
+    con los mismos bytes si la API no manda validadores, se retorna el MISMO
+    objeto sin parsear, y la caché lo reconoce y no recalcula huellas ni textos.
+    """
+
+    def __init__(self, max_items: int = MAX_VERSIONES):
+        self.max_items = max_items
+        self._versiones: "OrderedDict[Tuple[str, str], VersionRemota]" = OrderedDict()
+        self.stats = {"descargas": 0, "no_modificadas": 0, "sin_cambios": 0, "cambios": 0, "bytes_evitados": 0}
+
+    async def obtener(self, endpoint: str, path: str, modelo: Type) -> Any:
+        llave = (endpoint, path)
+        anterior = self._versiones.get(llave)
+        encabezados = {}
+        if anterior is not None:
+            if anterior.etag:
+                encabezados["If-None-Match"] = anterior.etag
+            if anterior.modificado:
+                encabezados["If-Modified-Since"] = anterior.modificado
+
+        response = await ube_client.get(endpoint, path, headers=encabezados)
+        self.stats["descargas"] += 1
+        if response.status_code == 304 and anterior is not None:
+            self.stats["no_modificadas"] += 1
+            self.stats["bytes_evitados"] += anterior.largo
+            SINCRONIZACION.inc(endpoint=endpoint, resultado="no_modificado")
+            BYTES_EVITADOS.inc(anterior.largo, endpoint=endpoint)
+            self._versiones.move_to_end(llave)
+            return anterior.valor
+
+        contenido = response.content
+        h = hashlib.blake2b(contenido, digest_size=16).hexdigest()
+        if anterior is not None and anterior.huella == h:
+            # Sin validadores (o validadores que cambian solos): se compara el contenido
+            valor, resultado = anterior.valor, "sin_cambios"
+        else:
+            valor, resultado = modelo.model_validate_json(contenido), "cambios"
+        self.stats[resultado] += 1
+        SINCRONIZACION.inc(endpoint=endpoint, resultado="cambio" if resultado == "cambios" else resultado)
+
+        self._versiones[llave] = VersionRemota(valor, h, len(contenido), response.headers.get("etag"),
+                                               response.headers.get("last-modified"))
+        self._versiones.move_to_end(llave)
+        while len(self._versiones) > self.max_items:
+            self._versiones.popitem(last=False)
+        return valor
+
+    def resumen(self) -> dict:
+        return {"versiones": len(self._versiones), **self.stats}
+
+
+sincronizador = SincronizadorUBE()
 
 
 async def fetch_carreras() -> Carreras:
-    async with httpx.AsyncClient() as client:
-        r = await client.get(f"{API_URL}carreras")
-        r.raise_for_status()
-        data = r.json()
-        # print(data)
-        return Carreras(**data)
+    return await sincronizador.obtener("carreras", "", Carreras)
 
 
-async def fetch_grupos(id_carrera: int):
-    response = requests.get(f"{API_URL}grupos/{id_carrera}")
-    response.raise_for_status()
-    data = response.json()
-    grupos_instance = Grupos(**data)
-    return grupos_instance
+async def fetch_grupos(id_carrera: int) -> Grupos:
+    return await sincronizador.obtener("grupos", str(id_carrera), Grupos)
 
 async def fetch_malla(id_carrera: int) -> Malla:
-    response = requests.get(f"{API_URL}malla/{id_carrera}")
-    response.raise_for_status()
-    data = response.json()
-    # print(data)
-    malla_instance = Malla(**data)
-    return malla_instance
-
-async def matricular():
-    response = requests.post(f"{API_URL}matricular", json={"aprove": True})
-    response.raise_for_status()
-    data = response.json()
-    malla_instance = Matricular(**data)
-    return malla_instance
\ No newline at end of file
+    return await sincronizador.obtener("malla", str(id_carrera), Malla)
+
+async def matricular() -> Matricular:
+    response = await ube_client.post("matricular", json={"aprove": True})
+    return Matricular.model_validate_json(response.content)
@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from app.config import (WHATSAPP_API_URL, WHATSAPP_APP_SECRET, WHATSAPP_CLIENTE, WHATSAPP_MAX_COLA,
+                        WHATSAPP_PHONE_NUMBER_ID, WHATSAPP_TOKEN, WHATSAPP_TRABAJADORES, WHATSAPP_VENTANA_FUSION)
+from app.metrics import registro
+from app.services.chat_service import responder
+from app.services.concurrencia import SaturacionLLM
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_COLA = registro.medidor("ube_whatsapp_cola", "Mensajes de WhatsApp recibidos y aún sin procesar")
+WHATSAPP_ANTIGUEDAD = registro.medidor(
+    "ube_whatsapp_antiguedad_segundos", "Antigüedad del mensaje pendiente más viejo de la cola de WhatsApp"
+)
+WHATSAPP_RETRASO = registro.histograma(
+    "ube_whatsapp_retraso_segundos", "Tiempo desde que llega un mensaje de WhatsApp hasta que se empieza a responder"
+)
+WHATSAPP_MENSAJES = registro.contador(
+    "ube_whatsapp_mensajes_total", "Mensajes de WhatsApp por resultado (respondido, fusionado, duplicado, descartado...)"
+)
+WHATSAPP_ENVIOS = registro.contador("ube_whatsapp_envios_total", "Respuestas enviadas a WhatsApp por resultado")
+
+# Límite de caracteres de un mensaje de texto de WhatsApp
+MAX_CARACTERES = 4096
+# Ids ya recibidos: WhatsApp reintenta la notificación si no recibe un 200 a tiempo
+MAX_IDS_VISTOS = 5000
+# Reintentos de un turno cuando el LLM está saturado, antes de descartar los mensajes
+REINTENTOS_SATURACION = 3
+MENSAJE_ERROR = "Lo siento, tuve un problema para responderte. ¿Puedes escribirme de nuevo en unos minutos?"
+
+
+@dataclass
+class MensajeEntrante:
+    numero: str
+    texto: str
+    id: str = ""
+    recibido: float = field(default_factory=time.monotonic)
+
+
+def firma_valida(cuerpo: bytes, firma: Optional[str], secreto: Optional[str] = WHATSAPP_APP_SECRET,
+                 exigir: bool = WHATSAPP_CLIENTE == "graph") -> bool:
+    """
+    Verifica `X-Hub-Signature-256` (HMAC-SHA256 del cuerpo con el secreto de la app).
+    Sin secreto solo se aceptan mensajes con el cliente local: con `exigir` (el
+    cliente de Graph envía mensajes reales) se rechaza todo.
+    """
+    if not secreto:
+        return not exigir
+    esperada = "sha256=" + hmac.new(secreto.encode(), cuerpo, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(esperada, firma or "")
+
+
+def extraer_mensajes(payload: dict) -> List[MensajeEntrante]:
+    """Mensajes de texto de una notificación del webhook (se ignoran estados de entrega, multimedia, etc.)."""
+    mensajes = []
+    for entrada in payload.get("entry") or []:
+        for cambio in entrada.get("changes") or []:
+            for mensaje in (cambio.get("value") or {}).get("messages") or []:
+                if mensaje.get("type") != "text" or not mensaje.get("from"):
+                    continue
+                texto = (mensaje.get("text") or {}).get("body", "").strip()
+                if texto:
+                    mensajes.append(MensajeEntrante(numero=mensaje["from"], texto=texto, id=mensaje.get("id", "")))
+    return mensajes
+
+
+def dividir(texto: str, maximo: int = MAX_CARACTERES) -> List[str]:
+    """Parte el texto en mensajes de hasta `maximo` caracteres, cortando en saltos de línea si se puede."""
+    partes = []
+    while len(texto) > maximo:
+        corte = texto.rfind("\n", 0, maximo)
+        if corte <= 0:
+            corte = maximo
+        partes.append(texto[:corte])
+        texto = texto[corte:].lstrip("\n")
+    if texto:
+        partes.append(texto)
+    return partes
+
+
+class ClienteGraph:
+    """Envía mensajes de texto con la Cloud API de WhatsApp."""
+
+    def __init__(self, token: str = WHATSAPP_TOKEN, phone_number_id: str = WHATSAPP_PHONE_NUMBER_ID,
+                 base_url: str = WHATSAPP_API_URL):
+        self.token = token
+        self.phone_number_id = phone_number_id
+        self.base_url = base_url
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def iniciar(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.token}"},
+                timeout=httpx.Timeout(10.0, connect=5.0),
+            )
+
+    async def cerrar(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def enviar(self, numero: str, texto: str):
+        await self.iniciar()
+        response = await self._client.post(f"{self.phone_number_id}/messages", json={
+            "messaging_product": "whatsapp",
+            "to": numero,
+            "type": "text",
+            "text": {"body": texto},
+        })
+        response.raise_for_status()
+
+
+class ClienteLocal:
+    """Guarda las respuestas en memoria en lugar de enviarlas (desarrollo y pruebas sin credenciales)."""
+
+    def __init__(self):
+        self.enviados: List[Tuple[str, str]] = []
+
+    async def iniciar(self):
+        pass
+
+    async def cerrar(self):
+        pass
+
+    async def enviar(self, numero: str, texto: str):
+        self.enviados.append((numero, texto))
+
+
+def crear_cliente():
+    if WHATSAPP_CLIENTE == "graph":
+        return ClienteGraph()
+    return ClienteLocal()
+
+
+class ColaWhatsApp:
+    """
+    Cola de mensajes entrantes de WhatsApp atendida por un pool de trabajadores.
+
+    El webhook solo encola (`encolar` no espera nada) y responde de inmediato. El
+    primer mensaje de un número abre una ventana de `ventana` segundos: lo que ese
+    número escriba en ella, o mientras se responde su turno anterior, se junta en
+    un solo turno del agente. Un número nunca se procesa en dos trabajadores a la vez.
+
+    La deduplicación de reintentos de Meta y la fusión son del proceso: el webhook
+    debe atenderse en uno solo (`UBE_WORKERS=1`). Con varios workers, un reintento
+    que cae en otro worker se respondería dos veces.
+    """
+
+    def __init__(self, cliente=None, trabajadores: int = WHATSAPP_TRABAJADORES, max_cola: int = WHATSAPP_MAX_COLA,
+                 ventana: float = WHATSAPP_VENTANA_FUSION):
+        self.cliente = cliente or crear_cliente()
+        self.trabajadores = trabajadores
+        self.max_cola = max_cola
+        self.ventana = ventana
+        self.en_cola = 0
+        self._pendientes: Dict[str, List[MensajeEntrante]] = {}
+        # Números con un turno programado (ventana abierta o esperando trabajador) y en proceso
+        self._programados: Set[str] = set()
+        self._ocupados: Set[str] = set()
+        self._listos: asyncio.Queue = asyncio.Queue()
+        self._tareas: List[asyncio.Task] = []
+        self._vistos: "OrderedDict[str, None]" = OrderedDict()
+        self.stats = {"recibidos": 0, "duplicados": 0, "descartados": 0, "fusionados": 0, "turnos": 0,
+                      "errores": 0, "envios_fallidos": 0}
+
+    def encolar(self, mensaje: MensajeEntrante) -> bool:
+        """Agrega el mensaje a la cola; retorna False si es un duplicado o si se descartó por cola llena."""
+        if mensaje.id:
+            if mensaje.id in self._vistos:
+                self.stats["duplicados"] += 1
+                WHATSAPP_MENSAJES.inc(resultado="duplicado")
+                return False
+            self._vistos[mensaje.id] = None
+            if len(self._vistos) > MAX_IDS_VISTOS:
+                self._vistos.popitem(last=False)
+
+        if self.en_cola >= self.max_cola:
+            self.stats["descartados"] += 1
+            WHATSAPP_MENSAJES.inc(resultado="descartado_cola_llena")
+            logger.warning(f"Cola de WhatsApp llena ({self.en_cola}); se descarta un mensaje de {mensaje.numero}")
+            return False
+
+        self.stats["recibidos"] += 1
+        self._pendientes.setdefault(mensaje.numero, []).append(mensaje)
+        self.en_cola += 1
+        WHATSAPP_COLA.set(self.en_cola)
+        if mensaje.numero not in self._programados and mensaje.numero not in self._ocupados:
+            self._programar(mensaje.numero, self.ventana)
+        return True
+
+    def _programar(self, numero: str, demora: float):
+        self._programados.add(numero)
+        if demora > 0:
+            asyncio.get_running_loop().call_later(demora, self._listos.put_nowait, numero)
+        else:
+            self._listos.put_nowait(numero)
+
+    async def _trabajador(self):
+        while True:
+            numero = await self._listos.get()
+            self._programados.discard(numero)
+            lote = self._pendientes.pop(numero, [])
+            if not lote:
+                continue
+            self._ocupados.add(numero)
+            try:
+                await self._procesar(numero, lote)
+            except Exception as e:
+                logger.error(f"Error procesando mensajes de WhatsApp de {numero}: {e}")
+            finally:
+                self._ocupados.discard(numero)
+                # Lo que llegó durante el turno forma el siguiente, sin esperar otra ventana
+                if numero in self._pendientes and numero not in self._programados:
+                    self._programar(numero, 0)
+
+    async def _procesar(self, numero: str, lote: List[MensajeEntrante]):
+        self.en_cola -= len(lote)
+        WHATSAPP_COLA.set(self.en_cola)
+        ahora = time.monotonic()
+        for mensaje in lote:
+            WHATSAPP_RETRASO.observar(ahora - mensaje.recibido)
+        self.stats["turnos"] += 1
+
+        try:
+            respuesta = await self._responder(numero, "\n".join(m.texto for m in lote))
+            # Cada mensaje cuenta una vez: el primero como respondido y el resto como fusionados
+            WHATSAPP_MENSAJES.inc(resultado="respondido")
+            if len(lote) > 1:
+                self.stats["fusionados"] += len(lote) - 1
+                WHATSAPP_MENSAJES.inc(len(lote) - 1, resultado="fusionado")
+        except SaturacionLLM as e:
+            self.stats["descartados"] += len(lote)
+            WHATSAPP_MENSAJES.inc(len(lote), resultado="descartado_saturacion")
+            logger.warning(f"LLM saturado; se descartan {len(lote)} mensajes de WhatsApp de {numero}: {e}")
+            respuesta = MENSAJE_ERROR
+        except Exception as e:
+            self.stats["errores"] += len(lote)
+            WHATSAPP_MENSAJES.inc(len(lote), resultado="error")
+            logger.error(f"Error respondiendo a {numero} por WhatsApp: {e}")
+            respuesta = MENSAJE_ERROR
+
+        await self._enviar(numero, respuesta)
+
+    async def _responder(self, numero: str, texto: str) -> str:
+        for intento in range(REINTENTOS_SATURACION + 1):
+            try:
+                resultado = await responder(f"whatsapp:{numero}", texto)
+                return resultado["respuesta"]
+            except SaturacionLLM as e:
+                if intento == REINTENTOS_SATURACION:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    async def _enviar(self, numero: str, texto: str):
+        for parte in dividir(texto):
+            try:
+                await self.cliente.enviar(numero, parte)
+                WHATSAPP_ENVIOS.inc(resultado="ok")
+            except Exception as e:
+                self.stats["envios_fallidos"] += 1
+                WHATSAPP_ENVIOS.inc(resultado="error")
+                logger.warning(f"No se pudo enviar la respuesta de WhatsApp a {numero}: {e}")
+                return
+
+    def antiguedad_maxima(self) -> float:
+        recibidos = [lote[0].recibido for lote in self._pendientes.values() if lote]
+        return time.monotonic() - min(recibidos) if recibidos else 0.0
+
+    async def iniciar(self):
+        if isinstance(self.cliente, ClienteGraph) and not WHATSAPP_APP_SECRET:
+            logger.error("WHATSAPP_TOKEN está definido pero falta WHATSAPP_APP_SECRET: "
+                         "el webhook rechazará todas las notificaciones hasta configurarlo")
+        await self.cliente.iniciar()
+        if not self._tareas:
+            self._tareas = [asyncio.create_task(self._trabajador()) for _ in range(self.trabajadores)]
+
+    async def cerrar(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        if self.en_cola:
+            logger.warning(f"Se cierran {self.en_cola} mensajes de WhatsApp sin responder")
+        await self.cliente.cerrar()
+
+    def resumen(self) -> dict:
+        return {
+            "en_cola": self.en_cola,
+            "numeros_pendientes": len(self._pendientes),
+            "en_proceso": len(self._ocupados),
+            "antiguedad_max_s": round(self.antiguedad_maxima(), 3),
+            "trabajadores": len(self._tareas),
+            "cliente": type(self.cliente).__name__,
+            **self.stats,
+        }
+
+
+cola_whatsapp = ColaWhatsApp()
+registro.colector(lambda: WHATSAPP_ANTIGUEDAD.set(cola_whatsapp.antiguedad_maxima()))
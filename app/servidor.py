@@ -0,0 +1,95 @@
+"""
+Arranca la API con `UBE_WORKERS` workers de uvicorn (uno por defecto).
+
+Con el catálogo compartido (`CATALOGO_COMPARTIDO`, activo por defecto con más de un
+worker) inicia antes el refrescador en un proceso aparte, espera su primera
+publicación y lo reinicia si termina. Las sesiones van a SQLite para que
+cualquier worker pueda atender a cualquier usuario.
+
+Uso:
+    python -m app.servidor [--host 0.0.0.0] [--port 8000]
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional
+
+import uvicorn
+
+from app.config import CATALOGO_COMPARTIDO, CATALOGO_COMPARTIDO_PATH, WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se espera la primera publicación del refrescador antes de abrir el puerto
+ESPERA_PRIMERA_PUBLICACION = 30.0
+# Pausa antes de reiniciar un refrescador que terminó
+ESPERA_REINICIO = 5.0
+COMANDO_REFRESCADOR = [sys.executable, "-m", "app.refrescador", "--salir-con-padre"]
+
+
+class Refrescador:
+    """Proceso `python -m app.refrescador`, reiniciado si termina mientras la API sigue arriba."""
+
+    def __init__(self):
+        self.proceso: Optional[subprocess.Popen] = None
+        self._detenido = threading.Event()
+
+    def iniciar(self):
+        self.proceso = subprocess.Popen(COMANDO_REFRESCADOR)
+        threading.Thread(target=self._supervisar, daemon=True).start()
+
+    def _supervisar(self):
+        while not self._detenido.is_set():
+            codigo = self.proceso.wait()
+            if self._detenido.wait(ESPERA_REINICIO):
+                return
+            logger.warning(f"El refrescador del catálogo terminó (código {codigo}); se reinicia")
+            self.proceso = subprocess.Popen(COMANDO_REFRESCADOR)
+
+    def esperar_publicacion(self, timeout: float = ESPERA_PRIMERA_PUBLICACION) -> bool:
+        """True cuando hay un catálogo publicado (de esta corrida o de una anterior)."""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            if os.path.exists(CATALOGO_COMPARTIDO_PATH) and os.path.exists(f"{CATALOGO_COMPARTIDO_PATH}.gen"):
+                return True
+            time.sleep(0.1)
+        return False
+
+    def detener(self):
+        self._detenido.set()
+        if self.proceso is not None and self.proceso.poll() is None:
+            self.proceso.terminate()
+            try:
+                self.proceso.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proceso.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    refrescador = None
+    if CATALOGO_COMPARTIDO:
+        refrescador = Refrescador()
+        refrescador.iniciar()
+        if not refrescador.esperar_publicacion():
+            # Los workers arrancan igual: sin archivo consultan la API hasta la primera publicación
+            logger.warning("El refrescador no publicó el catálogo a tiempo; los workers usarán la API")
+    try:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, workers=WORKERS,
+                    proxy_headers=True, forwarded_allow_ips="*")
+    finally:
+        if refrescador is not None:
+            refrescador.detener()
+
+
+if __name__ == "__main__":
+    main()
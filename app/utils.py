@@ -1,31 +1,65 @@
-from app.schemas.carreras_schema import DataCarreras, Carrera
-from openai import OpenAI
+from app.schemas.carreras_schema import DataCarreras
+import asyncio
 import json
-from app.config import TOKEN_LLAMA, GEMINI_API_KEY
-from typing import List
+import threading
+from app.config import CLASIFICADOR_BASE_URL, CLASIFICADOR_PROVEEDORES, LLM_TIMEOUT, PROVEEDORES_LLM
+from typing import Dict
+from functools import lru_cache
+import tiktoken
+from app.services.carreras_resolver import Resolucion, get_resolver
+from app.services.precarga import precargador
+from app.metrics import CLASIFICADOR_DURACION, medir
+from app.services.proveedores_llm import PoolProveedores, registrar_pool
 
 
-def get_id_by_name(carreras: DataCarreras, mensaje: str) -> int | None:
+async def get_id_by_name(carreras: DataCarreras, mensaje: str) -> int | None:
     """
     Extrae el nombre de la carrera de un mensaje y devuelve su ID.
-    El modelo de IA actúa como un clasificador.
+    Primero se resuelve con el índice local; el modelo de IA solo actúa
+    como clasificador cuando los mejores candidatos son ambiguos.
     """
+    resolucion = await resolver_carrera(carreras, mensaje)
+    return resolucion.id if resolucion else None
 
-    # client = OpenAI(
-    # base_url="https://openrouter.ai/api/v1",
-    # api_key=TOKEN_LLAMA,
-    # )
 
-    client = OpenAI(
-        base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-        api_key=GEMINI_API_KEY,
-    )
+async def resolver_carrera(carreras: DataCarreras, mensaje: str) -> Resolucion | None:
+    """
+    Igual que get_id_by_name, pero retorna también el nombre y la confianza.
+    La malla y los grupos de la carrera resuelta se precargan en segundo plano.
+    """
+    resolucion, candidatos = get_resolver(carreras).resolver(mensaje)
+    if not resolucion and candidatos:
+        id_carrera = await clasificar_con_llm({c.id: c.nombre for c in candidatos}, mensaje)
+        resolucion = next((c for c in candidatos if c.id == id_carrera), None)
+    if resolucion:
+        precargador.carrera_resuelta(resolucion.id)
+    return resolucion
+
+
+@lru_cache(maxsize=1)
+def get_classifier_pool() -> PoolProveedores:
+    """Clientes compatibles con OpenAI (cliente, modelo) de los proveedores del clasificador."""
+    # Import diferido: el SDK de OpenAI no se carga al importar la app (ver precargar_clasificador)
+    from openai import AsyncOpenAI
+
+    reintentos = 2 if len(CLASIFICADOR_PROVEEDORES) == 1 else 0
+    proveedores = {}
+    for nombre in CLASIFICADOR_PROVEEDORES:
+        proveedor = PROVEEDORES_LLM[nombre]
+        cliente = AsyncOpenAI(
+            base_url=proveedor["url"] or CLASIFICADOR_BASE_URL,
+            api_key=proveedor["api_key"] or "sin-clave",
+            timeout=LLM_TIMEOUT,
+            max_retries=reintentos,
+        )
+        proveedores[nombre] = (cliente, proveedor["modelo"])
+    return registrar_pool(PoolProveedores("clasificador", proveedores))
 
-    prompts = {}
-    for x in carreras.grado:
-        prompts[x.id] = x.nombre
-    for x in carreras.postgrado:
-        prompts[x.id] = x.nombre
+
+async def clasificar_con_llm(prompts: Dict[int, str], mensaje: str) -> int | None:
+    """Desempata con el LLM entre los candidatos que el índice local no pudo separar."""
+
+    pool = get_classifier_pool()
 
     # print(f"PROMPTS: {prompts}")
 
@@ -49,13 +83,13 @@ def get_id_by_name(carreras: DataCarreras, mensaje: str) -> int | None:
     ]
 
     try:
-        classification = client.chat.completions.create(
-            # model="meta-llama/llama-3.3-70b-instruct",
-            model="gemini-2.0-flash",
-            messages=messages,
-            response_format={"type": "json_object"},
-            temperature=0.0 
-        )
+        with medir(CLASIFICADOR_DURACION, "clasificador"):
+            classification = await pool.ejecutar(lambda proveedor: proveedor[0].chat.completions.create(
+                model=proveedor[1],
+                messages=messages,
+                response_format={"type": "json_object"},
+                temperature=0.0
+            ))
         
         response_json = json.loads(classification.choices[0].message.content)
         category_id = int(response_json.get("id", None))
@@ -70,23 +104,64 @@ def get_id_by_name(carreras: DataCarreras, mensaje: str) -> int | None:
         return None
     
 
-def formatear_texto_carreras(carreras: List[Carrera], tipo: str):
-    msg = f"**Las carreras de {tipo} son:**\n"
+_encoding_cargado = False
+_encoding_valor = None
+_encoding_lock = threading.Lock()
 
-    for carrera in carreras:
-        sesiones = ", ".join(carrera.sesiones) if carrera.sesiones else "No disponible"
-        modalidades = ", ".join(carrera.modalidades) if carrera.modalidades else "No disponible"
 
-        msg += f"\nNombre de la carrera: {carrera.nombre}."
+def cargar_encoding():
+    """
+    Carga cl100k_base (la primera vez tiktoken descarga el archivo BPE, salvo que
+    esté en TIKTOKEN_CACHE_DIR). Bloquea: en el servidor corre en un hilo.
+    """
+    global _encoding_cargado, _encoding_valor
+    with _encoding_lock:
+        if not _encoding_cargado:
+            try:
+                _encoding_valor = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # Sin acceso al archivo BPE se usa una estimación
+                print(f"No se pudo cargar tiktoken, se estimarán los tokens: {e}")
+            _encoding_cargado = True
+    return _encoding_valor
+
+
+async def precargar_clasificador():
+    """Importa el SDK de OpenAI y arma el pool en un hilo (lifespan), sin bloquear el event loop."""
+    await asyncio.to_thread(get_classifier_pool)
+
+
+async def precargar_encoding():
+    """Carga el encoding en un hilo (lifespan), sin bloquear el event loop."""
+    await asyncio.to_thread(cargar_encoding)
+
+
+def _encoding():
+    if _encoding_cargado:
+        return _encoding_valor
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # Scripts y benchmarks sin event loop: se carga aquí mismo
+        return cargar_encoding()
+    # Dentro del event loop nunca se espera la descarga: se estima hasta que termine la precarga
+    return None
+
+
+def contar_tokens(texto: str) -> int:
+    """Cantidad aproximada de tokens de un texto (cl100k_base de tiktoken)."""
+    encoding = _encoding()
+    if encoding is None:
+        return len(texto) // 4 + 1
+    return len(encoding.encode(texto, disallowed_special=()))
 
-        if carrera.precios:
-            msg += "\n1. Precios de la carrera:"
-            msg += f"\n - Inscripcion: {carrera.precios.inscripcion or 'No disponible'}"
-            msg += f"\n - Matricula: {carrera.precios.matricula or 'No disponible'}"
-            msg += f"\n - Cantidad de cuotas: {carrera.precios.numero_cuotas or 'No disponible'}"
-            msg += f"\n - Precio Homologación: {carrera.precios.homologacion or 'No disponible'}"
-        
-        msg += f"\n2. Sesiones: {sesiones}."
-        msg += f"\n3. Modalidades: {modalidades}.\n"
 
-    return msg
\ No newline at end of file
+def recortar_tokens(texto: str, max_tokens: int, conservar_final: bool = False) -> str:
+    """Recorta un texto a `max_tokens` tokens (por defecto conserva el inicio)."""
+    encoding = _encoding()
+    if encoding is None:
+        return texto[-max_tokens * 4:] if conservar_final else texto[:max_tokens * 4]
+    tokens = encoding.encode(texto, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return texto
+    return encoding.decode(tokens[-max_tokens:] if conservar_final else tokens[:max_tokens])
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Microbenchmark de `buscar_carreras`: índice invertido (`app.services.busqueda_carreras`)
+contra recorrer el catálogo completo con los mismos filtros, y tokens de la
+respuesta contra los del listado completo que el LLM tendría que filtrar.
+
+Uso:
+    python -m benchmarks.busqueda [--carreras 5000] [--repeticiones 500] [--json salida.json]
+
+Usa un catálogo sintético; no necesita la API ni credenciales.
+"""
+import argparse
+import json
+import os
+
+# Valores ficticios: app.config los exige al importar
+os.environ.setdefault("GEMINI_API_KEY", "x")
+os.environ.setdefault("API_BASE_URL", "http://localhost/")
+os.environ.setdefault("TOKEN_LLAMA", "x")
+
+from app.agents.render import render_busqueda, render_carreras  # noqa: E402
+from app.services.busqueda_carreras import CAMPOS_RANGO, IndiceCarreras  # noqa: E402
+from app.services.carreras_resolver import normalizar, tipo_carrera  # noqa: E402
+from app.utils import contar_tokens  # noqa: E402
+from benchmarks.carga import commit_actual  # noqa: E402
+from benchmarks.render import catalogo_sintetico, cronometrar  # noqa: E402
+
+CONSULTAS = {
+    "postgrado_online_nocturna_matricula_max": dict(
+        tipo="postgrado", modalidad="online", sesion="nocturna", rangos={"matricula": (None, 2000)}),
+    "grado_mas_baratas": dict(tipo="grado", limite=3),
+    "cuotas_entre": dict(rangos={"cuotas": (10, 12), "inscripcion": (None, 3000)}, orden="inscripcion"),
+}
+
+
+def recorrer(carreras, tipo=None, modalidad=None, sesion=None, rangos=None, orden="matricula", limite=10):
+    """Línea base: filtra y ordena el catálogo completo en cada consulta."""
+    filas = []
+    for nombre_tipo in ("grado", "postgrado"):
+        if tipo and nombre_tipo != tipo_carrera(tipo):
+            continue
+        for c in getattr(carreras.data, nombre_tipo):
+            if modalidad and normalizar(modalidad) not in (normalizar(m) for m in c.modalidades):
+                continue
+            if sesion and normalizar(sesion) not in (normalizar(s) for s in c.sesiones):
+                continue
+            valores = {campo: valor_de(c) for campo, valor_de in CAMPOS_RANGO.items()}
+            if any(
+                (minimo is not None or maximo is not None) and (
+                    valores[campo] is None
+                    or (minimo is not None and valores[campo] < minimo)
+                    or (maximo is not None and valores[campo] > maximo)
+                )
+                for campo, (minimo, maximo) in (rangos or {}).items()
+            ):
+                continue
+            filas.append(c)
+    filas.sort(key=lambda c: (CAMPOS_RANGO[orden](c) is None, CAMPOS_RANGO[orden](c) or 0, c.id))
+    return filas[:limite], len(filas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--carreras", type=int, default=5000)
+    parser.add_argument("--repeticiones", type=int, default=500)
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args()
+
+    carreras = catalogo_sintetico(args.carreras)
+    construccion_us = cronometrar(lambda: IndiceCarreras(carreras.data), 5)
+    indice = IndiceCarreras(carreras.data)
+    listado = render_carreras(carreras, incluir_precios=True, max_tokens=10 ** 9)
+
+    consultas = {}
+    for nombre, filtros in CONSULTAS.items():
+        encontradas, total = indice.buscar(**filtros)
+        esperadas, total_esperado = recorrer(carreras, **filtros)
+        assert total == total_esperado and [c.id for c in encontradas] == [c.id for c in esperadas], nombre
+        consultas[nombre] = {
+            "coincidencias": total,
+            "indice_us": round(cronometrar(lambda: indice.buscar(**filtros), args.repeticiones), 1),
+            "recorrido_us": round(cronometrar(lambda: recorrer(carreras, **filtros), max(args.repeticiones // 50, 3)), 1),
+            "tokens_respuesta": contar_tokens(render_busqueda(carreras, encontradas, total, filtros.get("orden", "matricula"))),
+        }
+
+    resultados = {
+        "commit": commit_actual(),
+        "parametros": {k: v for k, v in vars(args).items() if k != "json"},
+        "construccion_ms": round(construccion_us / 1e3, 1),
+        "tokens_listado_completo": contar_tokens(listado),
+        "consultas": consultas,
+    }
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
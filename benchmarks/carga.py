@@ -0,0 +1,220 @@
+"""
+Benchmark de extremo a extremo de `/ventas/chat` sin servicios externos.
+
+Levanta los dobles de `benchmarks.stubs` (API de la UBE y clasificador en
+servidores locales, modelo guionado en lugar de Gemini) y simula N usuarios
+concurrentes conversando con la app.
+
+Uso:
+    python -m benchmarks.carga [--usuarios 20] [--turnos 6] [--llm-latencia 0.4] [--json salida.json]
+
+Reporta latencia p50/p95/p99, peticiones por segundo, tiempo de bloqueo del
+event loop y crecimiento de RSS. Con `--json` guarda el resultado (con el
+commit actual) para comparar corridas entre commits.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from benchmarks.stubs import ModeloGuionado, ServidorLocal, crear_api_ube, crear_clasificador, nombre_carrera
+
+CONVERSACION = [
+    "Hola, ¿qué carreras tienen?",
+    "¿Cuál es la malla de {carrera}?",
+    "¿Qué grupos hay para {carrera}?",
+    "¿Cuánto cuesta {carrera}?",
+    "¿Cuáles son los requisitos para {carrera}?",
+    # Nombre abreviado: suele quedar ambiguo y pasa por el clasificador
+    "Grupos de {abreviada}",
+    # Dos herramientas independientes: un solo paso del agente las pide juntas
+    "Quiero ver la malla y los grupos de {carrera}",
+    # Filtros combinados con rango de precio: el índice de búsqueda, no el listado completo
+    "¿Qué carreras online tienen matrícula de menos de 400?",
+    "Quiero matricularme en {carrera}",
+]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def percentil(valores: list[float], p: int) -> float:
+    if len(valores) < 2:
+        return valores[0] if valores else 0.0
+    return statistics.quantiles(valores, n=100, method="inclusive")[p - 1]
+
+
+class MonitorLoop:
+    """Mide cuánto se atrasa un `sleep` corto: ese atraso es tiempo con el loop bloqueado."""
+
+    def __init__(self, intervalo: float = 0.01, umbral: float = 0.005):
+        self.intervalo = intervalo
+        self.umbral = umbral
+        self.bloqueo_total = 0.0
+        self.bloqueo_max = 0.0
+        self.eventos = 0
+        self._task = None
+
+    async def _medir(self):
+        while True:
+            inicio = time.perf_counter()
+            await asyncio.sleep(self.intervalo)
+            atraso = time.perf_counter() - inicio - self.intervalo
+            if atraso > self.umbral:
+                self.bloqueo_total += atraso
+                self.bloqueo_max = max(self.bloqueo_max, atraso)
+                self.eventos += 1
+
+    def iniciar(self):
+        self._task = asyncio.create_task(self._medir())
+
+    def detener(self):
+        self._task.cancel()
+
+    def resumen(self) -> dict:
+        return {
+            "bloqueo_total_ms": round(self.bloqueo_total * 1e3, 1),
+            "bloqueo_max_ms": round(self.bloqueo_max * 1e3, 1),
+            "eventos_bloqueo": self.eventos,
+        }
+
+
+async def correr(args) -> dict:
+    # Importar después de apuntar API_BASE_URL / CLASIFICADOR_BASE_URL a los dobles
+    import httpx
+    import app.agents.ventas as ventas
+    from app.main import app
+    from app.services.precarga import precargador
+
+    modelo = ModeloGuionado(latencia=args.llm_latencia, jitter=args.llm_latencia / 4)
+    ventas.get_llm = lambda: modelo
+    ventas.get_agent_executor.cache_clear()
+
+    latencias: list[float] = []
+    origenes: Counter = Counter()
+    errores = 0
+
+    async def usuario(cliente: httpx.AsyncClient, n: int):
+        nonlocal errores
+        rnd = random.Random(args.semilla + n)
+        carrera = nombre_carrera(rnd.randint(1, args.carreras))
+        for turno in range(args.turnos):
+            query = CONVERSACION[turno % len(CONVERSACION)].format(carrera=carrera, abreviada=carrera.split()[0][:5])
+            inicio = time.perf_counter()
+            r = await cliente.post("/ventas/chat", params={"user_id": f"bench-{n}"}, json={"query": query})
+            latencias.append(time.perf_counter() - inicio)
+            cuerpo = r.json()
+            if r.status_code != 200 or "error" in cuerpo:
+                errores += 1
+            else:
+                origenes[cuerpo.get("origen", "?")] += 1
+            if args.pensar:
+                await asyncio.sleep(rnd.uniform(0, args.pensar))
+
+    monitor = MonitorLoop()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as cliente:
+            rss_inicio = rss_mb()
+            monitor.iniciar()
+            inicio = time.perf_counter()
+            await asyncio.gather(*(usuario(cliente, n) for n in range(args.usuarios)))
+            duracion = time.perf_counter() - inicio
+            monitor.detener()
+            rss_fin = rss_mb()
+
+    return {
+        "peticiones": len(latencias),
+        "errores": errores,
+        "duracion_s": round(duracion, 3),
+        "req_por_s": round(len(latencias) / duracion, 2),
+        "latencia_ms": {
+            "p50": round(percentil(latencias, 50) * 1e3, 1),
+            "p95": round(percentil(latencias, 95) * 1e3, 1),
+            "p99": round(percentil(latencias, 99) * 1e3, 1),
+            "max": round(max(latencias) * 1e3, 1),
+        },
+        "event_loop": monitor.resumen(),
+        "rss_mb": {"inicio": round(rss_inicio, 1), "fin": round(rss_fin, 1), "crecimiento": round(rss_fin - rss_inicio, 1)},
+        "origenes": dict(origenes),
+        "llamadas_llm": modelo.llamadas,
+        "precarga": precargador.resumen(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--usuarios", type=int, default=20, help="Usuarios concurrentes")
+    parser.add_argument("--turnos", type=int, default=7, help="Mensajes por usuario")
+    parser.add_argument("--pensar", type=float, default=0.0, help="Pausa máxima (s) entre mensajes de un usuario")
+    parser.add_argument("--llm-latencia", type=float, default=0.4)
+    parser.add_argument("--api-latencia", type=float, default=0.05)
+    parser.add_argument("--clasificador-latencia", type=float, default=0.3)
+    parser.add_argument("--carreras", type=int, default=60, help="Tamaño del catálogo de la API simulada")
+    parser.add_argument("--periodos", type=int, default=8)
+    parser.add_argument("--asignaturas", type=int, default=6)
+    parser.add_argument("--grupos", type=int, default=4)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--logs", action="store_true", help="Muestra los logs y la salida verbose del agente")
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args()
+
+    api = crear_api_ube(carreras=args.carreras, periodos=args.periodos, asignaturas=args.asignaturas,
+                        grupos=args.grupos, latencia=args.api_latencia, jitter=args.api_latencia / 4)
+    clasificador = crear_clasificador(latencia=args.clasificador_latencia, jitter=args.clasificador_latencia / 4)
+
+    with ServidorLocal(api) as servidor_api, ServidorLocal(clasificador) as servidor_clasificador:
+        os.environ.update(
+            API_BASE_URL=servidor_api.url,
+            CLASIFICADOR_BASE_URL=servidor_clasificador.url,
+            GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", "x"),
+            TOKEN_LLAMA=os.getenv("TOKEN_LLAMA", "x"),
+        )
+        salida = None if args.logs else io.StringIO()
+        with contextlib.redirect_stdout(salida) if salida else contextlib.nullcontext():
+            if salida:
+                logging.disable(logging.WARNING)
+            resultados = asyncio.run(correr(args))
+            logging.disable(logging.NOTSET)
+
+        resultados["upstream"] = {"api_ube": dict(api.state.peticiones), "clasificador": clasificador.state.peticiones}
+
+    resultados = {
+        "commit": commit_actual(),
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("json", "logs")},
+        **resultados,
+    }
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
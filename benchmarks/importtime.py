@@ -0,0 +1,84 @@
+"""
+Reporte de tiempos de importación de la aplicación (equivalente a `python -X importtime`).
+
+Uso:
+    python -m benchmarks.importtime [--top 20] [--max-ms 2500] [--json salida.json]
+
+Falla (exit 1) si el import de `app.main` supera `--max-ms` o si se cargan
+módulos que deben importarse de forma diferida (SDKs de los LLM, hub de LangChain).
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+# Módulos que no deben cargarse al importar la app
+MODULOS_DIFERIDOS = ["openai", "langchain_google_genai", "langchain.hub", "google.generativeai"]
+
+LINEA = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def medir(modulo: str = "app.main") -> list[dict]:
+    env = {
+        **os.environ,
+        # Valores ficticios: solo se mide la importación
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY", "x"),
+        "API_BASE_URL": os.getenv("API_BASE_URL", "http://localhost/"),
+        "TOKEN_LLAMA": os.getenv("TOKEN_LLAMA", "x"),
+    }
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True, text=True, env=env,
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr[-2000:])
+
+    filas = []
+    for linea in proceso.stderr.splitlines():
+        m = LINEA.match(linea)
+        if m:
+            filas.append({
+                "modulo": m.group(4),
+                "propio_ms": int(m.group(1)) / 1000,
+                "acumulado_ms": int(m.group(2)) / 1000,
+                "nivel": len(m.group(3)) // 2,
+            })
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modulo", default="app.main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--max-ms", type=float, default=None)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    filas = medir(args.modulo)
+    total = next(f["acumulado_ms"] for f in filas if f["modulo"] == args.modulo)
+    cargados = {f["modulo"] for f in filas}
+    prohibidos = [m for m in MODULOS_DIFERIDOS if m in cargados]
+
+    print(f"Import de {args.modulo}: {total:.1f} ms ({len(filas)} módulos)\n")
+    print(f"{'acumulado':>10} {'propio':>9}  módulo")
+    for f in sorted(filas, key=lambda f: f["propio_ms"], reverse=True)[:args.top]:
+        print(f"{f['acumulado_ms']:>8.1f}ms {f['propio_ms']:>7.1f}ms  {f['modulo']}")
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"modulo": args.modulo, "total_ms": total, "prohibidos": prohibidos, "modulos": filas}, fh, indent=2)
+
+    errores = []
+    if prohibidos:
+        errores.append(f"Módulos que deberían importarse de forma diferida: {prohibidos}")
+    if args.max_ms is not None and total > args.max_ms:
+        errores.append(f"El import tomó {total:.1f} ms (máximo {args.max_ms} ms)")
+    for error in errores:
+        print(f"\n❌ {error}")
+    sys.exit(1 if errores else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Benchmark del parseo de respuestas de la API de la UBE y de la memoria que ocupan
+en las cachés, con un catálogo y mallas sintéticos grandes:
+
+- `dict_basemodel`: `json.loads` + `Modelo(**data)` con BaseModel (como antes).
+- `json_basemodel`: `Modelo.model_validate_json(bytes)` con los mismos BaseModel.
+- `json_compacto`: los registros `@compacto` actuales (`app.schemas`), validados
+  desde los bytes, con tuplas, strings internados e índice id -> Carrera.
+
+Cada variante corre en un proceso aparte para que el RSS de una no contamine a
+la otra. La memoria retenida se mide con tracemalloc (los objetos que quedan vivos
+en la caché) y el RSS como diferencia antes/después de parsear.
+
+Uso:
+    python -m benchmarks.parseo [--carreras 5000] [--mallas 500] [--periodos 10] [--json salida.json]
+
+No necesita la API ni credenciales.
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import time
+import tracemalloc
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from benchmarks.carga import commit_actual
+
+MODALIDADES = ["Presencial", "Online", "Híbrida", "Semipresencial"]
+SESIONES = ["Matutina", "Vespertina", "Nocturna", "Fin de semana"]
+VARIANTES = ["dict_basemodel", "json_basemodel", "json_compacto"]
+
+
+# Representación anterior de los esquemas (BaseModel), como línea base
+
+class PreciosModelo(BaseModel):
+    inscripcion: float = None
+    matricula: float = None
+    numero_cuotas: int = None
+    homologacion: Optional[float] = None
+
+class CarreraModelo(BaseModel):
+    id: int
+    nombre: str
+    sesiones: List[str]
+    modalidades: List[str]
+    precios: Optional[PreciosModelo] = None
+
+class DataCarrerasModelo(BaseModel):
+    grado: List[CarreraModelo]
+    postgrado: List[CarreraModelo]
+
+class CarrerasModelo(BaseModel):
+    status: str
+    data: DataCarrerasModelo
+
+class AsignaturaModelo(BaseModel):
+    asignatura: str
+    horas: int | float
+    creditos: Optional[int] = None
+
+class DataMallaModelo(BaseModel):
+    nivel_malla: str
+    asignaturas: List[AsignaturaModelo]
+
+class MallaModelo(BaseModel):
+    status: str
+    data: List[DataMallaModelo]
+
+
+def catalogo_json(n: int) -> bytes:
+    carreras = [
+        {
+            "id": i,
+            "nombre": f"{'Maestría en ' if i % 3 == 0 else ''}Carrera Sintética {i}",
+            "sesiones": SESIONES[: 1 + i % len(SESIONES)],
+            "modalidades": MODALIDADES[: 1 + i % len(MODALIDADES)],
+            "precios": {"inscripcion": 50 + i, "matricula": 300 + i, "numero_cuotas": 10, "homologacion": 100},
+        }
+        for i in range(1, n + 1)
+    ]
+    return json.dumps({"status": "success", "data": {
+        "grado": [c for c in carreras if c["id"] % 3],
+        "postgrado": [c for c in carreras if not c["id"] % 3],
+    }}, ensure_ascii=False).encode()
+
+
+def malla_json(id_carrera: int, periodos: int, asignaturas: int = 7) -> bytes:
+    return json.dumps({"status": "success", "data": [
+        {
+            "nivel_malla": f"{p}",
+            "asignaturas": [
+                {"asignatura": f"Asignatura {p}.{a} de la carrera {id_carrera}", "horas": 48 + a, "creditos": 3}
+                for a in range(1, asignaturas + 1)
+            ],
+        }
+        for p in range(1, periodos + 1)
+    ]}, ensure_ascii=False).encode()
+
+
+def rss_kb() -> Optional[int]:
+    """RSS actual del proceso (Linux); None si /proc no está disponible."""
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def parsers(variante: str):
+    if variante == "json_compacto":
+        # Import diferido: app.config exige estas variables al importarse
+        os.environ.setdefault("GEMINI_API_KEY", "x")
+        os.environ.setdefault("API_BASE_URL", "http://localhost/")
+        os.environ.setdefault("TOKEN_LLAMA", "x")
+        from app.schemas.carreras_schema import Carreras
+        from app.schemas.malla_schema import Malla
+        return Carreras.model_validate_json, Malla.model_validate_json
+    if variante == "json_basemodel":
+        return CarrerasModelo.model_validate_json, MallaModelo.model_validate_json
+    return (lambda datos: CarrerasModelo(**json.loads(datos))), (lambda datos: MallaModelo(**json.loads(datos)))
+
+
+def medir_variante(variante: str, args, cola):
+    parsear_catalogo, parsear_malla = parsers(variante)
+    catalogo = catalogo_json(args.carreras)
+    mallas = [malla_json(i, args.periodos) for i in range(1, args.mallas + 1)]
+    # Calentamiento: construye los validadores antes de medir
+    parsear_catalogo(catalogo_json(3))
+    parsear_malla(malla_json(0, 1))
+
+    # Tiempos: mejor de 3, sin tracemalloc (lo haría más lento)
+    ms_catalogo = ms_mallas = float("inf")
+    for _ in range(3):
+        inicio = time.perf_counter()
+        parsear_catalogo(catalogo)
+        ms_catalogo = min(ms_catalogo, (time.perf_counter() - inicio) * 1e3)
+        inicio = time.perf_counter()
+        for datos in mallas:
+            parsear_malla(datos)
+        ms_mallas = min(ms_mallas, (time.perf_counter() - inicio) * 1e3)
+
+    # Memoria: lo que queda vivo en las cachés tras parsear
+    gc.collect()
+    rss_antes = rss_kb()
+    tracemalloc.start()
+    cache_catalogo = parsear_catalogo(catalogo)
+    cache_mallas = {i: parsear_malla(datos) for i, datos in enumerate(mallas, 1)}
+    gc.collect()
+    retenido, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_despues = rss_kb()
+
+    cola.put({
+        "variante": variante,
+        "parseo_catalogo_ms": round(ms_catalogo, 1),
+        "parseo_mallas_ms": round(ms_mallas, 1),
+        "retenido_mb": round(retenido / 2 ** 20, 2),
+        "rss_delta_mb": round((rss_despues - rss_antes) / 1024, 1) if rss_antes is not None else None,
+    })
+    del cache_catalogo, cache_mallas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--carreras", type=int, default=5000)
+    parser.add_argument("--mallas", type=int, default=500)
+    parser.add_argument("--periodos", type=int, default=10)
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args()
+
+    contexto = multiprocessing.get_context("spawn")
+    variantes = []
+    for variante in VARIANTES:
+        cola = contexto.Queue()
+        proceso = contexto.Process(target=medir_variante, args=(variante, args, cola))
+        proceso.start()
+        variantes.append(cola.get())
+        proceso.join()
+
+    resultados = {
+        "commit": commit_actual(),
+        "parametros": {k: v for k, v in vars(args).items() if k != "json"},
+        "catalogo_kb": round(len(catalogo_json(args.carreras)) / 1024, 1),
+        "variantes": variantes,
+    }
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
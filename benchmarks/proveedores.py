@@ -0,0 +1,109 @@
+"""
+Benchmark del pool de proveedores de LLM (`app.services.proveedores_llm`) contra
+dos servidores locales compatibles con OpenAI (`benchmarks.stubs.crear_llm_openai`):
+
+- `a`: rápido, pero con picos de lentitud ocasionales (`--prob-lento`, `--lento`).
+- `b`: algo más lento y estable.
+
+Corre los mismos mensajes con: solo `a`, pool `a,b` sin hedge, pool con hedge y
+pool con `a` caído a mitad de la corrida (failover y circuito).
+
+Uso:
+    python -m benchmarks.proveedores [--llamadas 200] [--concurrencia 10] [--json salida.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.carga import commit_actual, percentil
+from benchmarks.stubs import ServidorLocal, crear_llm_openai
+
+
+async def escenario(nombre: str, urls: dict, args, hedge: bool = False, caida=None) -> dict:
+    from langchain_core.messages import HumanMessage
+    from app.agents.ventas import crear_chat
+    from app.services.proveedores_llm import ChatPool, PoolProveedores
+
+    modelos = {n: crear_chat({"nombre": n, "url": url, "modelo": "stub", "api_key": "x"}, reintentos=0)
+               for n, url in urls.items()}
+    pool = PoolProveedores(nombre, modelos, hedge=hedge, hedge_min=args.hedge_min)
+    chat = ChatPool(pool=pool)
+
+    latencias: list[float] = []
+    errores = 0
+    semaforo = asyncio.Semaphore(args.concurrencia)
+
+    async def llamada(i: int):
+        nonlocal errores
+        if caida is not None and i == args.llamadas // 2:
+            caida.state.fallando = True
+        async with semaforo:
+            inicio = time.perf_counter()
+            try:
+                await chat.ainvoke([HumanMessage(content=f"hola {i}")])
+                latencias.append(time.perf_counter() - inicio)
+            except Exception:
+                errores += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(llamada(i) for i in range(args.llamadas)))
+    duracion = time.perf_counter() - inicio
+    if caida is not None:
+        caida.state.fallando = False
+
+    return {
+        "escenario": nombre,
+        "errores": errores,
+        "duracion_s": round(duracion, 2),
+        "latencia_ms": {p: round(percentil(latencias, int(p[1:])) * 1e3, 1) for p in ("p50", "p95", "p99")},
+        "pool": pool.resumen(),
+    }
+
+
+async def correr(args, servidores: dict, apps: dict) -> list:
+    solo_a = {"a": servidores["a"].url}
+    ambos = {"a": servidores["a"].url, "b": servidores["b"].url}
+    return [
+        await escenario("solo_a", solo_a, args),
+        await escenario("pool", ambos, args),
+        await escenario("pool_hedge", ambos, args, hedge=True),
+        await escenario("pool_hedge_caida_a", ambos, args, hedge=True, caida=apps["a"]),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llamadas", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--latencia-a", type=float, default=0.2)
+    parser.add_argument("--latencia-b", type=float, default=0.3)
+    parser.add_argument("--prob-lento", type=float, default=0.03, help="Probabilidad de un pico de lentitud en `a`")
+    parser.add_argument("--lento", type=float, default=2.0, help="Duración (s) de un pico de lentitud")
+    parser.add_argument("--hedge-min", type=float, default=0.3)
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args()
+
+    os.environ.setdefault("GEMINI_API_KEY", "x")
+    apps = {
+        "a": crear_llm_openai(latencia=args.latencia_a, jitter=args.latencia_a / 4,
+                              prob_lento=args.prob_lento, lento=args.lento),
+        "b": crear_llm_openai(latencia=args.latencia_b, jitter=args.latencia_b / 10),
+    }
+    with ServidorLocal(apps["a"]) as servidor_a, ServidorLocal(apps["b"]) as servidor_b:
+        escenarios = asyncio.run(correr(args, {"a": servidor_a, "b": servidor_b}, apps))
+
+    resultados = {
+        "commit": commit_actual(),
+        "parametros": {k: v for k, v in vars(args).items() if k != "json"},
+        "escenarios": escenarios,
+    }
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Microbenchmark del renderizado de respuestas: renderizar en cada llamada vs.
+buscar los bloques precalculados en `render_store`.
+
+Uso:
+    python -m benchmarks.render [--carreras 500] [--periodos 10] [--repeticiones 200] [--json salida.json]
+
+Usa un catálogo sintético; no necesita la API ni credenciales.
+"""
+import argparse
+import json
+import os
+import time
+
+# Valores ficticios: app.config los exige al importar
+os.environ.setdefault("GEMINI_API_KEY", "x")
+os.environ.setdefault("API_BASE_URL", "http://localhost/")
+os.environ.setdefault("TOKEN_LLAMA", "x")
+
+from app.agents.render import (  # noqa: E402
+    construir_catalogo, construir_malla, render_carreras, render_malla, render_store,
+)
+from app.schemas.carreras_schema import Carreras  # noqa: E402
+from app.schemas.malla_schema import Malla  # noqa: E402
+
+MODALIDADES = ["Presencial", "Online", "Híbrida", "Semipresencial"]
+SESIONES = ["Matutina", "Vespertina", "Nocturna", "Fin de semana"]
+
+
+def catalogo_sintetico(n: int) -> Carreras:
+    carreras = [
+        {
+            "id": i,
+            "nombre": f"{'Maestría en ' if i % 3 == 0 else ''}Carrera Sintética {i}",
+            "sesiones": SESIONES[: 1 + i % len(SESIONES)],
+            "modalidades": MODALIDADES[: 1 + i % len(MODALIDADES)],
+            "precios": {"inscripcion": 50 + i, "matricula": 300 + i, "numero_cuotas": 10, "homologacion": 100},
+        }
+        for i in range(1, n + 1)
+    ]
+    return Carreras(status="success", data={
+        "grado": [c for c in carreras if c["id"] % 3],
+        "postgrado": [c for c in carreras if not c["id"] % 3],
+    })
+
+
+def malla_sintetica(periodos: int, asignaturas: int = 7) -> Malla:
+    return Malla(status="success", data=[
+        {
+            "nivel_malla": f"{p}",
+            "asignaturas": [
+                {"asignatura": f"Asignatura {p}.{a} de formación profesional", "horas": 48 + a, "creditos": 3}
+                for a in range(1, asignaturas + 1)
+            ],
+        }
+        for p in range(1, periodos + 1)
+    ])
+
+
+def cronometrar(funcion, repeticiones: int) -> float:
+    """Microsegundos por llamada."""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1e6
+
+
+def medir(n_carreras: int, n_periodos: int, repeticiones: int) -> dict:
+    carreras = catalogo_sintetico(n_carreras)
+    malla = malla_sintetica(n_periodos)
+
+    # Sin precálculo: vaciar el store en cada llamada equivale a renderizar desde los modelos
+    def carreras_por_llamada():
+        render_store.limpiar()
+        render_carreras(carreras, modalidad="online", incluir_precios=True, pagina=2)
+
+    def malla_por_llamada():
+        render_store.limpiar()
+        render_malla(malla, vista="completa")
+
+    resultados = {
+        "carreras": n_carreras,
+        "periodos": n_periodos,
+        "catalogo_render_us": cronometrar(carreras_por_llamada, max(repeticiones // 10, 1)),
+        "malla_render_us": cronometrar(malla_por_llamada, repeticiones),
+    }
+
+    # Con precálculo: lo que hace la caché al cargar los datos
+    render_store.limpiar()
+    inicio = time.perf_counter()
+    render_store.precargar(carreras, "catalogo", construir_catalogo)
+    render_store.precargar(malla, "malla", construir_malla)
+    resultados["precalculo_ms"] = (time.perf_counter() - inicio) * 1e3
+    resultados["catalogo_lookup_us"] = cronometrar(
+        lambda: render_carreras(carreras, modalidad="online", incluir_precios=True, pagina=2), repeticiones)
+    resultados["malla_lookup_us"] = cronometrar(lambda: render_malla(malla, vista="completa"), repeticiones)
+    resultados["store"] = render_store.resumen()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--carreras", type=int, default=500)
+    parser.add_argument("--periodos", type=int, default=10)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args()
+
+    resultados = medir(args.carreras, args.periodos, args.repeticiones)
+    print(f"Catálogo de {resultados['carreras']} carreras, malla de {resultados['periodos']} períodos")
+    print(f"  precálculo (una vez por carga): {resultados['precalculo_ms']:.1f} ms")
+    for nombre in ("catalogo", "malla"):
+        render, lookup = resultados[f"{nombre}_render_us"], resultados[f"{nombre}_lookup_us"]
+        print(f"  {nombre:<9} render: {render:>10.1f} µs   lookup: {lookup:>8.1f} µs   ({render / lookup:.0f}x)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
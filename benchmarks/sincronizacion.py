@@ -0,0 +1,137 @@
+"""
+Benchmark de los refrescos contra la API de la UBE simulada: cuánto cuesta
+volver a consultar el catálogo y las mallas cuando los datos no cambiaron, y
+qué se invalida cuando cambia una sola carrera.
+
+Variantes:
+- `completo`: descarga, parseo, huella y textos en cada refresco (como antes).
+- `huella`: la API no manda validadores; se comparan los bytes y, si son
+  iguales, se reutiliza el objeto anterior sin parsear.
+- `condicional`: GET con `If-None-Match` / `If-Modified-Since`; la API responde 304.
+
+`refresco_ms` incluye a la API simulada, que corre en un hilo del mismo proceso;
+`cpu_cliente_ms` es solo el CPU del hilo de la app (descarga, parseo, huellas, textos).
+
+Uso:
+    python -m benchmarks.sincronizacion [--carreras 2000] [--mallas 100] [--refrescos 5] [--json salida.json]
+
+No necesita la API real ni credenciales.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.carga import commit_actual
+from benchmarks.stubs import ServidorLocal, crear_api_ube
+
+VARIANTES = ["completo", "huella", "condicional"]
+
+
+async def correr(variante: str, api, args) -> dict:
+    # Importar después de apuntar API_BASE_URL al doble
+    from app.agents.render import render_store
+    from app.schemas.carreras_schema import Carreras
+    from app.schemas.malla_schema import Malla
+    from app.services.cache import (carreras_cache, depender_de_carreras, dependencias_vigentes, get_carreras,
+                                    mallas_cache, rastrear_dependencias, versiones_carreras)
+    from app.services.http_client import ube_client
+    from app.services.ventas_service import sincronizador
+
+    if variante == "completo":
+        async def catalogo(_):
+            return Carreras.model_validate_json((await ube_client.get("carreras")).content)
+
+        async def malla(id_carrera):
+            return Malla.model_validate_json((await ube_client.get("malla", str(id_carrera))).content)
+
+        carreras_cache.loader, mallas_cache.loader = catalogo, malla
+
+    ids = range(1, args.mallas + 1)
+    await carreras_cache.refrescar()
+    await asyncio.gather(*(mallas_cache.refrescar(i) for i in ids))
+
+    # Respuestas de ejemplo: una sobre la carrera 1, otra sobre la 2 y un listado completo
+    dependencias = {}
+    for nombre, id_carrera in (("carrera_1", 1), ("carrera_2", 2), ("listado", None)):
+        with rastrear_dependencias() as dependencias[nombre]:
+            await get_carreras(acotado=id_carrera is not None)
+            if id_carrera:
+                depender_de_carreras(id_carrera)
+
+    bytes_inicio = api.state.bytes_enviados
+    construcciones_inicio = render_store.stats["construcciones"]
+    inicio, cpu_inicio = time.perf_counter(), time.thread_time()
+    for _ in range(args.refrescos):
+        await carreras_cache.refrescar()
+        await asyncio.gather(*(mallas_cache.refrescar(i) for i in ids))
+    refresco_ms = (time.perf_counter() - inicio) * 1e3 / args.refrescos
+    cpu_ms = (time.thread_time() - cpu_inicio) * 1e3 / args.refrescos
+    sin_cambios = {
+        "refresco_ms": round(refresco_ms, 1),
+        "cpu_cliente_ms": round(cpu_ms, 1),
+        "kb_por_refresco": round((api.state.bytes_enviados - bytes_inicio) / 1024 / args.refrescos, 1),
+        "textos_reconstruidos": render_store.stats["construcciones"] - construcciones_inicio,
+        "respuestas_vigentes": sum(dependencias_vigentes(d) for d in dependencias.values()),
+    }
+
+    # Cambia el precio de una carrera
+    api.state.cambiar_precio(1)
+    filas_inicio = render_store.stats["filas_renderizadas"]
+    inicio, cpu_inicio = time.perf_counter(), time.thread_time()
+    await carreras_cache.refrescar()
+    cambio = {
+        "refresco_ms": round((time.perf_counter() - inicio) * 1e3, 1),
+        "cpu_cliente_ms": round((time.thread_time() - cpu_inicio) * 1e3, 1),
+        "carreras_modificadas": versiones_carreras.ultimo_cambio["modificadas"],
+        "filas_renderizadas": render_store.stats["filas_renderizadas"] - filas_inicio,
+        "respuestas_invalidadas": sorted(n for n, d in dependencias.items() if not dependencias_vigentes(d)),
+    }
+    await ube_client.cerrar()
+    return {"variante": variante, "sin_cambios": sin_cambios, "cambio_de_precio": cambio,
+            "sincronizacion": sincronizador.resumen()}
+
+
+def medir_variante(variante: str, args, cola):
+    api = crear_api_ube(carreras=args.carreras, periodos=args.periodos, latencia=args.api_latencia, jitter=0.0,
+                        validadores=variante == "condicional")
+    with ServidorLocal(api) as servidor:
+        os.environ.update(API_BASE_URL=servidor.url, SNAPSHOT_PATH="", GEMINI_API_KEY="x", TOKEN_LLAMA="x")
+        cola.put(asyncio.run(correr(variante, api, args)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--carreras", type=int, default=2000)
+    parser.add_argument("--mallas", type=int, default=100)
+    parser.add_argument("--periodos", type=int, default=10)
+    parser.add_argument("--refrescos", type=int, default=5)
+    parser.add_argument("--api-latencia", type=float, default=0.005)
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args()
+
+    # Un proceso por variante: las cachés y el cliente son globales del módulo
+    import multiprocessing
+    contexto = multiprocessing.get_context("spawn")
+    variantes = []
+    for variante in VARIANTES:
+        cola = contexto.Queue()
+        proceso = contexto.Process(target=medir_variante, args=(variante, args, cola))
+        proceso.start()
+        variantes.append(cola.get())
+        proceso.join()
+
+    resultados = {
+        "commit": commit_actual(),
+        "parametros": {k: v for k, v in vars(args).items() if k != "json"},
+        "variantes": variantes,
+    }
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Dobles locales para medir la app sin servicios externos:
+
+- `crear_api_ube`: app ASGI que imita los endpoints de `API_BASE_URL`
+  (`carreras`, `grupos/{id}`, `malla/{id}`, `matricular`) con latencia y
+  tamaño de respuesta configurables. Con `validadores=True` responde con
+  `ETag` / `Last-Modified` y 304 a los GET condicionales; sin ellos el cliente
+  solo puede comparar el contenido. `app.state.cambiar_precio(id)` y
+  `app.state.ocupar_cupo(id)` cambian los datos para simular actualizaciones.
+- `crear_clasificador`: endpoint `chat/completions` compatible con OpenAI
+  para el clasificador que usa `get_id_by_name` al desempatar.
+- `ModeloGuionado`: chat model determinista que llama a las herramientas del
+  agente según palabras clave del mensaje, con latencia simulada.
+- `crear_llm_openai`: el mismo guion detrás de un endpoint `chat/completions`
+  compatible con OpenAI, con picos de lentitud y errores configurables (para
+  probar el pool de proveedores de `app.services.proveedores_llm`).
+- `ServidorLocal`: levanta una app ASGI con uvicorn en un hilo aparte.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, FunctionMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+BASES = [
+    "Derecho", "Psicología Clínica", "Enfermería", "Contabilidad y Auditoría", "Administración de Empresas",
+    "Educación Inicial", "Odontología", "Arquitectura", "Ingeniería Civil", "Marketing", "Economía",
+    "Turismo", "Gastronomía", "Fisioterapia", "Nutrición y Dietética", "Software", "Comunicación",
+    "Trabajo Social", "Criminalística", "Educación Básica",
+]
+MODALIDADES = ["Presencial", "Online", "Híbrida", "Semipresencial"]
+SESIONES = ["Matutina", "Vespertina", "Nocturna", "Fin de semana"]
+
+
+def nombre_carrera(i: int) -> str:
+    """Nombres realistas: los repetidos (Derecho / Maestría en Derecho) ejercitan el desempate."""
+    base = BASES[(i - 1) % len(BASES)]
+    ronda = (i - 1) // len(BASES)
+    if ronda == 0:
+        return base
+    if ronda == 1:
+        return f"Maestría en {base}"
+    return f"{base} mención {ronda - 1}"
+
+
+def _latencia(base: float, jitter: float) -> float:
+    return max(0.0, base + random.uniform(-jitter, jitter))
+
+
+def crear_api_ube(carreras: int = 60, periodos: int = 8, asignaturas: int = 6, grupos: int = 4,
+                  latencia: float = 0.05, jitter: float = 0.02, validadores: bool = True) -> FastAPI:
+    app = FastAPI()
+    app.state.peticiones = {"carreras": 0, "malla": 0, "grupos": 0, "matricular": 0}
+    # GET condicionales respondidos con 304 (sin cuerpo)
+    app.state.no_modificadas = {"carreras": 0, "malla": 0, "grupos": 0}
+    app.state.bytes_enviados = 0
+    # Cambios simulados: carrera -> incremento de la matrícula / cupos ocupados
+    precios_extra: Dict[int, int] = {}
+    cupos_ocupados: Dict[int, int] = {}
+    # Recurso -> (ETag, Last-Modified): la fecha avanza solo cuando cambia el contenido
+    versiones: Dict[str, tuple] = {}
+    catalogo_generado: Dict[tuple, bytes] = {}
+
+    def cambiar_precio(id_carrera: int, monto: int = 10):
+        precios_extra[id_carrera] = precios_extra.get(id_carrera, 0) + monto
+
+    def ocupar_cupo(id_carrera: int, cupos: int = 1):
+        cupos_ocupados[id_carrera] = cupos_ocupados.get(id_carrera, 0) + cupos
+
+    app.state.cambiar_precio = cambiar_precio
+    app.state.ocupar_cupo = ocupar_cupo
+
+    def catalogo() -> bytes:
+        llave = tuple(sorted(precios_extra.items()))
+        if llave not in catalogo_generado:
+            filas = [
+                {
+                    "id": i,
+                    "nombre": nombre_carrera(i),
+                    "sesiones": SESIONES[: 1 + i % len(SESIONES)],
+                    "modalidades": MODALIDADES[: 1 + i % len(MODALIDADES)],
+                    "precios": {"inscripcion": 50 + i, "matricula": 300 + i + precios_extra.get(i, 0),
+                                "numero_cuotas": 10, "homologacion": 100},
+                }
+                for i in range(1, carreras + 1)
+            ]
+            catalogo_generado.clear()
+            catalogo_generado[llave] = json.dumps({"status": "success", "data": {
+                "grado": [f for f in filas if not f["nombre"].startswith("Maestría")],
+                "postgrado": [f for f in filas if f["nombre"].startswith("Maestría")],
+            }}, ensure_ascii=False).encode()
+        return catalogo_generado[llave]
+
+    async def responder(request: Request, endpoint: str, recurso: str, contenido: bytes) -> Response:
+        app.state.peticiones[endpoint] += 1
+        await asyncio.sleep(_latencia(latencia, jitter))
+        if not validadores:
+            app.state.bytes_enviados += len(contenido)
+            return Response(contenido, media_type="application/json")
+
+        etag = f'"{hashlib.blake2b(contenido, digest_size=8).hexdigest()}"'
+        if recurso not in versiones or versiones[recurso][0] != etag:
+            versiones[recurso] = (etag, formatdate(time.time(), usegmt=True))
+        etag, modificado = versiones[recurso]
+        encabezados = {"ETag": etag, "Last-Modified": modificado}
+
+        if_none_match = request.headers.get("if-none-match")
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_none_match is not None:
+            no_modificado = etag in [e.strip() for e in if_none_match.split(",")]
+        elif if_modified_since is not None:
+            try:
+                no_modificado = parsedate_to_datetime(modificado) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                no_modificado = False
+        else:
+            no_modificado = False
+        if no_modificado:
+            app.state.no_modificadas[endpoint] += 1
+            return Response(status_code=304, headers=encabezados)
+        app.state.bytes_enviados += len(contenido)
+        return Response(contenido, media_type="application/json", headers=encabezados)
+
+    @app.get("/carreras")
+    async def get_carreras(request: Request):
+        return await responder(request, "carreras", "carreras", catalogo())
+
+    @app.get("/malla/{id_carrera}")
+    async def get_malla(id_carrera: int, request: Request):
+        contenido = json.dumps({"status": "success", "data": [
+            {"nivel_malla": str(p), "asignaturas": [
+                {"asignatura": f"Asignatura {p}.{a} de {nombre_carrera(id_carrera)}", "horas": 48, "creditos": 3}
+                for a in range(1, asignaturas + 1)
+            ]}
+            for p in range(1, periodos + 1)
+        ]}, ensure_ascii=False).encode()
+        return await responder(request, "malla", f"malla/{id_carrera}", contenido)
+
+    @app.get("/grupos/{id_carrera}")
+    async def get_grupos(id_carrera: int, request: Request):
+        ocupados = cupos_ocupados.get(id_carrera, 0)
+        contenido = json.dumps({"status": "success", "data": [
+            {"carrera": str(id_carrera), "nombre": f"P{g}", "fecha_inicio": "2026-11-03", "fecha_fin": "2027-03-01",
+             "capacidad": 30 - ocupados if g == 1 else 30, "sesion": SESIONES[g % len(SESIONES)],
+             "modalidad": MODALIDADES[g % len(MODALIDADES)], "nivel": "1"}
+            for g in range(1, grupos + 1)
+        ]}, ensure_ascii=False).encode()
+        return await responder(request, "grupos", f"grupos/{id_carrera}", contenido)
+
+    @app.post("/matricular")
+    async def post_matricular():
+        app.state.peticiones["matricular"] += 1
+        await asyncio.sleep(_latencia(latencia, jitter))
+        return {"status": "success", "message": "Matrícula registrada"}
+
+    return app
+
+
+def crear_clasificador(latencia: float = 0.3, jitter: float = 0.1) -> FastAPI:
+    """Responde con el primer candidato de la lista que recibe en el prompt."""
+    app = FastAPI()
+    app.state.peticiones = 0
+
+    @app.post("/chat/completions")
+    async def completions(request: Request):
+        app.state.peticiones += 1
+        cuerpo = await request.json()
+        await asyncio.sleep(_latencia(latencia, jitter))
+        m = re.search(r'"(\d+)":', cuerpo["messages"][0]["content"])
+        contenido = json.dumps({"id": int(m.group(1)) if m else None})
+        return {
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": cuerpo.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": contenido}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    return app
+
+
+# Palabra clave del mensaje -> (herramienta, argumentos); el nombre de la carrera
+# se pasa como el mensaje completo, igual que haría el modelo con una frase libre
+def argumentos_busqueda(mensaje: str) -> dict:
+    """Filtros de buscar_carreras para consultas como "carreras online por menos de 400"."""
+    texto = mensaje.lower()
+    monto = re.search(r"\d+", texto)
+    return {
+        "modalidad": "online" if "online" in texto else None,
+        "matricula_max": float(monto.group()) if monto else None,
+        "limite": 3,
+    }
+
+
+GUION = [
+    ("menos de", "buscar_carreras", argumentos_busqueda),
+    ("barat", "buscar_carreras", argumentos_busqueda),
+    ("malla", "listar_malla", lambda m: {"nombre_carrera": m}),
+    ("materias", "listar_malla", lambda m: {"nombre_carrera": m}),
+    ("grupo", "listar_grupos", lambda m: {"nombre_carrera": m}),
+    ("horario", "listar_grupos", lambda m: {"nombre_carrera": m}),
+    ("requisito", "requisitos_matriculacion", lambda m: {"nombre_carrera": m}),
+    ("matricul", "matricular", lambda m: {"nombre_carrera": m}),
+    ("cuesta", "listar_carreras", lambda m: {"nombre_carrera": m, "incluir_precios": True}),
+    ("precio", "listar_carreras", lambda m: {"nombre_carrera": m, "incluir_precios": True}),
+    ("carreras", "listar_carreras", lambda m: {}),
+]
+
+
+def decidir(mensaje: str) -> List[tuple]:
+    """(herramienta, argumentos) que el guion pide para el mensaje, una vez por herramienta; vacío si responde texto."""
+    texto = mensaje.lower()
+    decisiones = {}
+    for clave, herramienta, argumentos in GUION:
+        if clave in texto and herramienta not in decisiones:
+            decisiones[herramienta] = argumentos(mensaje)
+    # "carreras" aparece en casi cualquier consulta: solo cuenta si no hay otra herramienta
+    if len(decisiones) > 1:
+        decisiones.pop("listar_carreras", None)
+    return list(decisiones.items())
+
+
+def resultados_herramientas(contenidos: List[str]) -> str:
+    return "Esto es lo que encontré:\n" + "\n".join(str(c)[:400] for c in contenidos)
+
+
+RESPUESTA_SIN_HERRAMIENTA = "Soy Dr. Matrícula, ¿en qué carrera estás interesado?"
+
+
+def crear_llm_openai(latencia: float = 0.4, jitter: float = 0.1, prob_lento: float = 0.0, lento: float = 5.0,
+                     prob_error: float = 0.0) -> FastAPI:
+    """
+    `chat/completions` compatible con OpenAI que sigue el guion: con `tools` pide todas
+    las herramientas del mensaje en un paso (con `functions`, solo la primera); tras
+    sus resultados, o sin herramientas, responde texto.
+    Con probabilidad `prob_lento` tarda `lento` segundos y con `prob_error` responde 500.
+    `app.state.fallando = True` hace fallar todas las peticiones (caída del proveedor).
+    """
+    app = FastAPI()
+    app.state.peticiones = 0
+    app.state.fallando = False
+
+    @app.post("/chat/completions")
+    async def completions(request: Request):
+        app.state.peticiones += 1
+        cuerpo = await request.json()
+        espera = lento if random.random() < prob_lento else _latencia(latencia, jitter)
+        await asyncio.sleep(espera)
+        if app.state.fallando or random.random() < prob_error:
+            return JSONResponse(status_code=500, content={"error": {"message": "falla simulada"}})
+
+        mensajes = cuerpo["messages"]
+        mensaje = {"role": "assistant", "content": RESPUESTA_SIN_HERRAMIENTA}
+        if mensajes[-1]["role"] in ("function", "tool"):
+            resultados = []
+            for m in reversed(mensajes):
+                if m["role"] not in ("function", "tool"):
+                    break
+                resultados.insert(0, m["content"])
+            mensaje["content"] = resultados_herramientas(resultados)
+        elif cuerpo.get("functions") or cuerpo.get("tools"):
+            humano = next((m["content"] for m in reversed(mensajes) if m["role"] == "user"), "")
+            llamadas = [{"name": herramienta, "arguments": json.dumps(argumentos, ensure_ascii=False)}
+                        for herramienta, argumentos in decidir(str(humano))]
+            if llamadas:
+                mensaje["content"] = None
+                if cuerpo.get("tools"):
+                    mensaje["tool_calls"] = [
+                        {"index": i, "id": f"call_{app.state.peticiones}_{i}", "type": "function", "function": llamada}
+                        for i, llamada in enumerate(llamadas)
+                    ]
+                else:
+                    mensaje["function_call"] = llamadas[0]
+
+        if cuerpo.get("stream"):
+            # Un solo fragmento con todo el mensaje, como SSE
+            def evento(delta: dict, fin: Optional[str]) -> str:
+                return "data: " + json.dumps({
+                    "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": cuerpo.get("model"), "choices": [{"index": 0, "delta": delta, "finish_reason": fin}],
+                }, ensure_ascii=False) + "\n\n"
+
+            return StreamingResponse(iter([evento(mensaje, None), evento({}, "stop"), "data: [DONE]\n\n"]),
+                                     media_type="text/event-stream")
+        return {
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": cuerpo.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": mensaje}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    return app
+
+
+class ModeloGuionado(BaseChatModel):
+    """
+    Chat model determinista para benchmarks. Con herramientas enlazadas (turno del
+    agente) pide en un solo paso todas las que el mensaje menciona y, tras recibir
+    sus salidas, responde con un resumen; sin herramientas (resúmenes de memoria)
+    responde texto.
+    """
+
+    latencia: float = 0.4
+    jitter: float = 0.1
+    llamadas: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "modelo-guionado"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _responder(self, messages: List[BaseMessage], kwargs: dict) -> AIMessage:
+        self.llamadas += 1
+        if not kwargs.get("tools") and not kwargs.get("functions"):
+            return AIMessage(content="Resumen: el usuario consultó carreras de la UBE.")
+
+        resultados = []
+        for m in reversed(messages):
+            if not isinstance(m, (FunctionMessage, ToolMessage)):
+                break
+            resultados.insert(0, m.content)
+        if resultados:
+            return AIMessage(content=resultados_herramientas(resultados))
+
+        mensaje = next((str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        decisiones = decidir(mensaje)
+        if not decisiones:
+            return AIMessage(content=RESPUESTA_SIN_HERRAMIENTA)
+        if kwargs.get("tools"):
+            return AIMessage(content="", tool_calls=[
+                {"name": herramienta, "args": argumentos, "id": f"call_{self.llamadas}_{i}"}
+                for i, (herramienta, argumentos) in enumerate(decisiones)
+            ])
+        herramienta, argumentos = decisiones[0]
+        return AIMessage(content="", additional_kwargs={"function_call": {
+            "name": herramienta, "arguments": json.dumps(argumentos, ensure_ascii=False),
+        }})
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(_latencia(self.latencia, self.jitter))
+        return ChatResult(generations=[ChatGeneration(message=self._responder(messages, kwargs))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(_latencia(self.latencia, self.jitter))
+        return ChatResult(generations=[ChatGeneration(message=self._responder(messages, kwargs))])
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServidorLocal:
+    """Sirve una app ASGI con uvicorn en un hilo propio (su propio event loop)."""
+
+    def __init__(self, app, puerto: int = None):
+        self.puerto = puerto or puerto_libre()
+        self.url = f"http://127.0.0.1:{self.puerto}/"
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.puerto, log_level="warning"))
+        self._hilo = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._hilo.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._hilo.join(timeout=5)
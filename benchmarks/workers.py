@@ -0,0 +1,154 @@
+"""
+Benchmark del modo multi-worker (`python -m app.servidor`): con N workers de
+uvicorn, cada uno con sus cachés (`local`) contra el catálogo compartido por un
+refrescador y mapeado en memoria (`compartido`).
+
+Para cada combinación levanta el servidor contra la API de la UBE simulada y mide:
+- arranque: segundos hasta que los N workers responden `/ventas/estado`;
+- memoria de cada worker tras consultar las mallas de todas las carreras: RSS y
+  PSS (el PSS reparte las páginas compartidas entre los procesos que las mapean);
+- peticiones a la API de la UBE (en `compartido` solo las hace el refrescador).
+
+Uso:
+    python -m benchmarks.workers [--workers 1 2 4] [--carreras 500] [--periodos 10] [--json salida.json]
+
+Solo Linux (lee /proc). No necesita credenciales: las consultas de malla las
+responde el router sin pasar por el LLM.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.carga import commit_actual
+from benchmarks.stubs import ServidorLocal, crear_api_ube, nombre_carrera, puerto_libre
+
+MODOS = ["local", "compartido"]
+
+
+def memoria_kb(pid: int) -> Dict[str, Optional[int]]:
+    """RSS y PSS de un proceso según /proc/<pid>/smaps_rollup."""
+    memoria = {"rss": None, "pss": None}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for linea in f:
+                campo = linea.split(":")[0].lower()
+                if campo in memoria:
+                    memoria[campo] = int(linea.split()[1])
+    except OSError:
+        pass
+    return memoria
+
+
+def hijos(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def esperar_workers(url: str, workers: int, timeout: float = 60.0) -> set:
+    """Consulta /ventas/estado hasta ver `workers` pids distintos (cada conexión nueva puede caer en otro)."""
+    pids, limite = set(), time.monotonic() + timeout
+    while len(pids) < workers and time.monotonic() < limite:
+        try:
+            r = httpx.get(f"{url}/ventas/estado", headers={"Connection": "close"}, timeout=2)
+            pids.add(r.json()["pid"])
+        except (httpx.HTTPError, ValueError, KeyError):
+            time.sleep(0.05)
+    return pids
+
+
+def consultar_mallas(url: str, carreras: int, concurrencia: int = 16):
+    def consultar(i: int):
+        httpx.post(f"{url}/ventas/chat", params={"user_id": f"bench-{i}"},
+                   json={"query": f"Malla curricular de {nombre_carrera(i)}"}, headers={"Connection": "close"}, timeout=30)
+
+    with ThreadPoolExecutor(concurrencia) as pool:
+        list(pool.map(consultar, range(1, carreras + 1)))
+
+
+def medir(modo: str, workers: int, args, directorio: str) -> dict:
+    api = crear_api_ube(carreras=args.carreras, periodos=args.periodos, latencia=args.api_latencia)
+    puerto = puerto_libre()
+    prefijo = os.path.join(directorio, f"{modo}-{workers}")
+    with ServidorLocal(api) as servidor_api:
+        entorno = dict(
+            os.environ,
+            UBE_WORKERS=str(workers),
+            CATALOGO_COMPARTIDO="true" if modo == "compartido" else "false",
+            CATALOGO_COMPARTIDO_PATH=f"{prefijo}.bin",
+            SESIONES_BACKEND="sqlite",
+            SESIONES_DB_PATH=f"{prefijo}.db",
+            SNAPSHOT_PATH="",
+            API_BASE_URL=servidor_api.url,
+            GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", "x"),
+            TOKEN_LLAMA=os.getenv("TOKEN_LLAMA", "x"),
+        )
+        inicio = time.monotonic()
+        servidor = subprocess.Popen([sys.executable, "-m", "app.servidor", "--port", str(puerto)], env=entorno,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{puerto}"
+        try:
+            pids = esperar_workers(url, workers)
+            arranque = time.monotonic() - inicio
+            peticiones_arranque = sum(api.state.peticiones.values())
+
+            consultar_mallas(url, args.carreras)
+            # Las cachés de cada worker se llenan con lo que atendió; se repite para que todos vean todo
+            for _ in range(workers - 1):
+                consultar_mallas(url, args.carreras)
+            memorias = [memoria_kb(pid) for pid in sorted(pids)]
+            refrescador = [memoria_kb(p) for p in hijos(servidor.pid) if p not in pids
+                           and "app.refrescador" in open(f"/proc/{p}/cmdline").read()]
+        finally:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+
+    return {
+        "modo": modo,
+        "workers": workers,
+        "workers_vistos": len(pids),
+        "arranque_s": round(arranque, 2),
+        "worker_rss_mb": round(sum(m["rss"] or 0 for m in memorias) / max(len(memorias), 1) / 1024, 1),
+        "worker_pss_mb": round(sum(m["pss"] or 0 for m in memorias) / max(len(memorias), 1) / 1024, 1),
+        "total_pss_mb": round((sum(m["pss"] or 0 for m in memorias + refrescador)) / 1024, 1),
+        "refrescador_pss_mb": round(refrescador[0]["pss"] / 1024, 1) if refrescador and refrescador[0]["pss"] else None,
+        "api_ube": {"arranque": peticiones_arranque, "total": dict(api.state.peticiones)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=MODOS)
+    parser.add_argument("--carreras", type=int, default=500, help="Tamaño del catálogo de la API simulada")
+    parser.add_argument("--periodos", type=int, default=10)
+    parser.add_argument("--api-latencia", type=float, default=0.01)
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        corridas = [medir(modo, n, args, directorio) for n in args.workers for modo in args.modos]
+
+    resultados = {
+        "commit": commit_actual(),
+        "parametros": {k: v for k, v in vars(args).items() if k != "json"},
+        "corridas": corridas,
+    }
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()